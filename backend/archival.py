@@ -0,0 +1,44 @@
+"""
+Sıcak/soğuk veri yaşam döngüsü (arşivleme)
+
+Sürekli büyüyen koleksiyonların eski kayıtları sıkıştırmalı arşiv
+koleksiyonlarına taşınır, böylece sık sorgulanan koleksiyonlar ve indeksleri
+bellekte kalır:
+
+- `dues` -> `dues_archive`: vadesi `due_years` yıldan eski, ödenmiş aidatlar
+- `requests` -> `requests_archive`: `request_months` aydan önce çözülmüş talepler
+- `announcement_reads` -> `announcement_reads_archive`: `read_months` aydan
+  eski (süresi dolmuş) duyuruların okundu kayıtları
+
+Taşıma partiler halinde toplu yazma ile yapılır ve idempotenttir. Aidat ve
+talep detayları arşivden okunmaya devam eder; süresi dolmuş duyurular
+okunmamış sayısına girmez, okunma istatistikleri duyuru belgesinde kalır.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class ArchivePolicy:
+    due_years: int = 2
+    request_months: int = 12
+    read_months: int = 6
+
+    def cutoffs(self, now: datetime) -> Dict[str, datetime]:
+        return {
+            "dues": now - timedelta(days=365 * self.due_years),
+            "requests": now - timedelta(days=30 * self.request_months),
+            "announcement_reads": now - timedelta(days=30 * self.read_months),
+        }
+
+
+async def run_archival(repositories, policy: ArchivePolicy = ArchivePolicy(), batch_size: int = 500,
+                       now: Optional[datetime] = None) -> Dict[str, int]:
+    """Tüm arşivleme adımlarını çalıştır; koleksiyon başına taşınan kayıt sayısı"""
+    cutoffs = policy.cutoffs(now or datetime.utcnow())
+    return {
+        "dues": await repositories.dues.archive_paid(cutoffs["dues"], batch_size),
+        "requests": await repositories.requests.archive_resolved(cutoffs["requests"], batch_size),
+        "announcement_reads": await repositories.announcements.archive_reads(cutoffs["announcement_reads"], batch_size),
+    }
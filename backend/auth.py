@@ -0,0 +1,196 @@
+"""
+İmzalı oturum token'ları (JWT)
+
+Giriş sırasında kısa ömürlü bir erişim token'ı ve uzun ömürlü bir yenileme
+token'ı verilir. Erişim token'ı `user_id`, `role`, `building_id` ve
+`apartment_id` alanlarını taşır; handler'lar kimliği veritabanına gitmeden
+imzayı doğrulayarak öğrenir. Yenileme sırasında kullanıcı bir kez okunur, böylece
+rol/bina değişiklikleri en geç bir erişim token'ı ömrü sonra yansır.
+
+Yönetici uçları her zaman token ister. Sakin uçları, token göndermeyen eski
+istemciler için `AUTH_ALLOW_ANONYMOUS=1` (varsayılan) iken token'sız da
+çağrılabilir; istemciler token göndermeye başlayınca `AUTH_ALLOW_ANONYMOUS=0`
+ile token zorunlu hale gelir.
+"""
+import logging
+import os
+import secrets
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+import jwt
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+# Bina yöneticileri kendi binalarındaki tüm daire/kullanıcı kaynaklarına, super_admin her binaya erişebilir
+from repositories import ADMIN_ROLES
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+
+
+@dataclass(frozen=True)
+class AuthSettings:
+    secret_key: str
+    access_ttl: timedelta
+    refresh_ttl: timedelta
+    allow_anonymous: bool
+
+
+@lru_cache(maxsize=None)
+def settings() -> AuthSettings:
+    """Ortam değişkenlerinden ayarlar (.env yüklendikten sonra, ilk kullanımda okunur)"""
+    secret_key = os.environ.get("JWT_SECRET")
+    if not secret_key:
+        # Geliştirme ortamı: her süreçte farklı anahtar, yeniden başlatınca token'lar geçersiz olur
+        logger.warning("JWT_SECRET tanımlı değil; geçici bir anahtar kullanılıyor")
+        secret_key = secrets.token_urlsafe(32)
+    return AuthSettings(
+        secret_key=secret_key,
+        access_ttl=timedelta(minutes=int(os.environ.get("ACCESS_TOKEN_MINUTES", "15"))),
+        refresh_ttl=timedelta(days=int(os.environ.get("REFRESH_TOKEN_DAYS", "30"))),
+        allow_anonymous=os.environ.get("AUTH_ALLOW_ANONYMOUS", "1") == "1",
+    )
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    user_id: str
+    role: str
+    building_id: Optional[str]
+    apartment_id: Optional[str]
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role in ADMIN_ROLES
+
+    @property
+    def is_super_admin(self) -> bool:
+        return self.role == "super_admin"
+
+    def manages(self, building_id: Optional[str]) -> bool:
+        """Yönetici bu binanın kaynaklarına erişebilir mi"""
+        return self.is_super_admin or (self.is_admin and building_id is not None and building_id == self.building_id)
+
+
+def _encode(payload: dict, token_type: str, ttl: timedelta) -> str:
+    now = datetime.utcnow()
+    return jwt.encode({**payload, "type": token_type, "iat": now, "exp": now + ttl},
+                      settings().secret_key, algorithm=ALGORITHM)
+
+
+def issue_tokens(user: dict) -> dict:
+    """Kullanıcı için erişim ve yenileme token'ları"""
+    access_token = _encode({
+        "sub": str(user["_id"]),
+        "role": user.get("role"),
+        "building_id": user.get("building_id"),
+        "apartment_id": user.get("apartment_id"),
+    }, "access", settings().access_ttl)
+    refresh_token = _encode({"sub": str(user["_id"]), "jti": uuid.uuid4().hex}, "refresh", settings().refresh_ttl)
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": int(settings().access_ttl.total_seconds()),
+    }
+
+
+def decode_token(token: str, token_type: str) -> dict:
+    """İmzayı ve süreyi doğrula; geçersizse jwt.InvalidTokenError"""
+    payload = jwt.decode(token, settings().secret_key, algorithms=[ALGORITHM], options={"require": ["exp", "sub"]})
+    if payload.get("type") != token_type:
+        raise jwt.InvalidTokenError("Yanlış token türü")
+    return payload
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def _claims(payload: dict) -> TokenClaims:
+    return TokenClaims(
+        user_id=payload["sub"],
+        role=payload.get("role"),
+        building_id=payload.get("building_id"),
+        apartment_id=payload.get("apartment_id"),
+    )
+
+
+def optional_claims(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Optional[TokenClaims]:
+    """Token varsa doğrulayıp kimliği ver; yoksa None (token'sız eski istemciler, AUTH_ALLOW_ANONYMOUS=1 iken)"""
+    if credentials is None:
+        if not settings().allow_anonymous:
+            raise _unauthorized("Oturum gerekli")
+        return None
+    try:
+        payload = decode_token(credentials.credentials, "access")
+    except jwt.ExpiredSignatureError:
+        raise _unauthorized("Oturum süresi doldu")
+    except jwt.InvalidTokenError:
+        raise _unauthorized("Geçersiz oturum")
+    return _claims(payload)
+
+
+def routing_claims(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> Optional[TokenClaims]:
+    """
+    Kiracı yönlendirmesi için kimlik: geçersiz token'da hata vermez, None döner.
+    Token'ı kullanmayan uçlar eskisi gibi çalışır; yetki kontrolü optional_claims/require_claims'te
+    """
+    if credentials is None:
+        return None
+    try:
+        return _claims(decode_token(credentials.credentials, "access"))
+    except jwt.InvalidTokenError:
+        return None
+
+
+def require_claims(claims: Optional[TokenClaims] = Depends(optional_claims)) -> TokenClaims:
+    """Geçerli bir erişim token'ı zorunlu"""
+    if claims is None:
+        raise _unauthorized("Oturum gerekli")
+    return claims
+
+
+def _forbidden() -> HTTPException:
+    return HTTPException(status_code=403, detail="Bu kaynağa erişim yetkiniz yok")
+
+
+def require_admin(claims: TokenClaims = Depends(require_claims)) -> TokenClaims:
+    """Yönetici token'ı zorunlu (bina kontrolü için ayrıca ensure_building)"""
+    if not claims.is_admin:
+        raise HTTPException(status_code=403, detail="Bu işlem için yetkiniz yok")
+    return claims
+
+
+def ensure_building(claims: TokenClaims, building_id: Optional[str]) -> None:
+    """Bina yöneticileri yalnızca kendi binalarının kaynaklarına erişebilir"""
+    if not claims.manages(building_id):
+        raise _forbidden()
+
+
+def ensure_user(claims: Optional[TokenClaims], user_id: Optional[str],
+                user_building_id: Optional[str] = None) -> Optional[str]:
+    """
+    İstemcinin gönderdiği user_id'yi token ile doğrula; token varsa kimlik token'dan gelir.
+    Başka bir kullanıcıya yalnızca o kullanıcının binasının yöneticisi erişebilir.
+    """
+    if claims is None:
+        return user_id
+    if user_id is not None and user_id != claims.user_id and not claims.manages(user_building_id):
+        raise _forbidden()
+    return user_id or claims.user_id
+
+
+def ensure_apartment(claims: Optional[TokenClaims], apartment_id: str,
+                     apartment_building_id: Optional[str] = None) -> None:
+    """Sakinler yalnızca kendi dairelerine, bina yöneticileri kendi binalarının dairelerine erişebilir"""
+    if claims is not None and claims.apartment_id != apartment_id and not claims.manages(apartment_building_id):
+        raise _forbidden()
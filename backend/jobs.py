@@ -0,0 +1,117 @@
+"""
+Zamanlanmış işler
+
+Eskiden GET isteklerinde tembel olarak yapılan ya da ayrı döngülerde
+çalışan periyodik işler; `scheduler.Scheduler`'a kaydedilir ve her
+çalıştırmayı dağıtımda tek bir worker yapar. İşler tüm kiracıların
+veritabanlarında çalışır.
+
+- `legal-escalation`: vadesi geçmiş en az iki aidatı olan dairelere hukuki
+  süreç (ihtar) açar. Daireler partiler halinde taranır; her parti sonrası
+  ilerleme (kiracı, son daire id'si) kaydedilir.
+- `portfolio-refresh`: super_admin portföy göstergelerini (önbellek) yeniler.
+- `archival`: eski kayıtları arşive taşır (bkz. archival).
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+import archival
+from scheduler import JobContext
+
+logger = logging.getLogger(__name__)
+
+# Bu kadar ay gecikmiş aidatı olan daireye hukuki süreç açılır
+LEGAL_ESCALATION_MIN_OVERDUE = 2
+
+
+def new_legal_process(apartment_id: str, total_debt: float, overdue_months: int,
+                      now: Optional[datetime] = None) -> dict:
+    """İhtar aşamasında yeni hukuki süreç kaydı"""
+    now = now or datetime.utcnow()
+    return {
+        "apartment_id": apartment_id,
+        "status": "warning_sent",
+        "total_debt": total_debt,
+        "overdue_months": overdue_months,
+        "timeline": [
+            {
+                "stage": "warning_sent",
+                "title": "İhtar Gönderildi",
+                "description": "Aidat borcu nedeniyle resmi ihtar gönderilmiştir.",
+                "date": now,
+                "completed": True
+            },
+            {
+                "stage": "legal_notice",
+                "title": "Yasal Bildirim",
+                "description": "Ödeme yapılmaması durumunda yasal işlem başlatılacaktır.",
+                "date": None,
+                "completed": False
+            },
+            {
+                "stage": "lawyer_assigned",
+                "title": "Avukata Devredildi",
+                "description": "Dosya hukuk danışmanına iletilmiştir.",
+                "date": None,
+                "completed": False
+            },
+            {
+                "stage": "lawsuit_filed",
+                "title": "Dava Açıldı",
+                "description": "Mahkeme sürecine geçilmiştir.",
+                "date": None,
+                "completed": False
+            }
+        ],
+        "contact": {
+            "lawyer_name": "Av. Mehmet Yılmaz",
+            "lawyer_phone": "0 (212) 555 01 01",
+            "lawyer_email": "m.yilmaz@hukuk.com"
+        },
+        "notes": "Ödeme planı için yönetim ile görüşebilirsiniz.",
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+async def escalate_overdue(tenants, context: JobContext, batch_size: int = 500) -> Dict[str, int]:
+    """Gecikmiş dairelere hukuki süreç aç; kiracı başına açılan süreç sayısı"""
+    now = datetime.utcnow()
+    checkpoint = context.checkpoint or {}
+    opened = {}
+    for tenant_id, repositories in sorted((await tenants.all()).items()):
+        if checkpoint and tenant_id < checkpoint["tenant"]:
+            continue
+        after = checkpoint["after"] if checkpoint and tenant_id == checkpoint["tenant"] else None
+        opened[tenant_id] = 0
+        while True:
+            overdue = await repositories.dues.list_overdue_apartments(
+                now, LEGAL_ESCALATION_MIN_OVERDUE, after, batch_size
+            )
+            if not overdue:
+                break
+            existing = await repositories.legal_processes.apartment_ids_with_process(
+                [row["apartment_id"] for row in overdue]
+            )
+            created = await repositories.legal_processes.create_many([
+                new_legal_process(row["apartment_id"], row["total_debt"], row["overdue_months"], now)
+                for row in overdue if row["apartment_id"] not in existing
+            ])
+            opened[tenant_id] += len(created)
+            after = overdue[-1]["apartment_id"]
+            await context.save({"tenant": tenant_id, "after": after})
+    if any(opened.values()):
+        logger.info(f"Hukuki süreç açıldı: {opened}")
+    return opened
+
+
+async def refresh_portfolio(portfolio_refresher, context: JobContext) -> int:
+    return await portfolio_refresher.refresh()
+
+
+async def archive_old_records(tenants, context: JobContext,
+                              policy: archival.ArchivePolicy = archival.ArchivePolicy(),
+                              batch_size: int = 500) -> Dict[str, Dict[str, int]]:
+    """Tüm kiracılarda arşivleme; taşıma idempotent olduğu için yarıda kalırsa baştan çalışması yeterli"""
+    return await tenants.fan_out(lambda repositories: archival.run_archival(repositories, policy, batch_size))
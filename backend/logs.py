@@ -0,0 +1,224 @@
+"""
+Engellemeyen, yapılandırılmış (JSON) loglama
+
+Log kayıtları istek işleyen koddan bir kuyruğa (`QueueHandler`) bırakılır;
+stderr'e yazma ayrı bir dinleyici iş parçacığında (`QueueListener`) yapılır,
+böylece yavaş bir çıktı event loop'u bloklamaz. Kuyruk doluysa kayıt atılır
+ve atılan kayıt sayısı bir sonraki kayıtla birlikte raporlanır.
+
+Her istek bir korelasyon kimliği taşır: istemcinin `X-Request-ID` başlığı
+(geçerliyse) ya da yeni bir kimlik. Kimlik istek boyunca atılan tüm loglara
+eklenir ve yanıtta aynı başlıkla geri gönderilir. İstek sonunda rota şablonu,
+durum kodu ve süreyle tek bir erişim kaydı yazılır.
+
+Hata fırtınalarında loglama darboğaz olmasın diye WARNING ve üstü kayıtlarda
+her log çağrısı noktası (dosya + satır) kendi token kovasıyla sınırlanır;
+başarılı isteklerin erişim kayıtları ayrıca örneklenebilir.
+"""
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from rate_limit import BucketLimit
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# İstemciden gelen kimlik log satırına olduğu gibi yazılır; yalnızca güvenli karakterler
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+access_logger = logging.getLogger("access")
+
+# JSON çıktısına eklenen `extra` alanları
+EXTRA_FIELDS = ("method", "route", "status", "latency_ms", "suppressed", "dropped")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for field in EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Kaydı atan isteğin kimliğini kayda yaz (kuyruğa girmeden, çağıran bağlamda)"""
+
+    def filter(self, record):
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+
+class CallSiteRateLimitFilter(logging.Filter):
+    """
+    `min_level` ve üstü kayıtlar için her log çağrısı noktasına bir token
+    bucket. Kova boşken gelen kayıtlar atılır; sayıları o noktadan geçen bir
+    sonraki kayda `suppressed` olarak eklenir. CRITICAL kayıtlar hiçbir zaman
+    sınırlanmaz.
+    """
+
+    def __init__(self, limit: BucketLimit, min_level: int = logging.WARNING, max_sites: int = 10_000):
+        super().__init__()
+        self.limit = limit
+        self.min_level = min_level
+        self.max_sites = max_sites
+        # (dosya, satır) -> (token, son güncelleme, atılan kayıt sayısı)
+        self.sites: Dict[Tuple[str, int], Tuple[float, float, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.min_level or record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self.sites.get(key, (self.limit.capacity, now, 0))
+            tokens = min(self.limit.capacity, tokens + (now - updated) * self.limit.rate)
+            if tokens < 1:
+                self.sites[key] = (tokens, now, suppressed + 1)
+                return False
+            if key not in self.sites and len(self.sites) >= self.max_sites:
+                self.sites.pop(next(iter(self.sites)))
+            self.sites[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Kuyruk doluysa beklemeden kaydı at (stderr'e hata basmadan)"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Mesaj argümanları sonradan değişebilir: metni burada üret; biçimlendirme
+        # (JSON, traceback) dinleyici iş parçacığında yapılır
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if self.dropped:
+            record.dropped, self.dropped = self.dropped, 0
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: int = logging.INFO, queue_size: int = 10_000,
+                  rate_limit: BucketLimit = BucketLimit(capacity=50, rate=5)) -> logging.handlers.QueueListener:
+    """Kök logger'ı kuyruk + JSON çıktısına bağla; dinleyici başlatılmış olarak döner"""
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(RequestContextFilter())
+    handler.addFilter(CallSiteRateLimitFilter(rate_limit))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    # uvicorn kendi düz metin handler'larını kurar: kayıtları aynı kuyruğa yönlendir,
+    # erişim kayıtlarını ise (rota ve kimlik içermedikleri için) RequestLogMiddleware yazar
+    for name in ("uvicorn", "uvicorn.error"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+    logging.getLogger("uvicorn.access").handlers = []
+    logging.getLogger("uvicorn.access").propagate = False
+
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def _request_id(scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-id":
+            candidate = value.decode("latin-1")
+            if _REQUEST_ID_PATTERN.match(candidate):
+                return candidate
+            break
+    return uuid.uuid4().hex
+
+
+class RequestLogMiddleware:
+    """İstek kimliği, `X-Request-ID` yanıt başlığı ve istek başına tek JSON erişim kaydı (ASGI)"""
+
+    def __init__(self, app, sample_rate: float = 1.0):
+        self.app = app
+        # Başarılı (< 400) isteklerin erişim kayıtlarından tutulacak oran; hatalar her zaman yazılır
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+        token = request_id_var.set(request_id)
+        header = (REQUEST_ID_HEADER.lower().encode("latin-1"), request_id.encode("latin-1"))
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.log(scope, status, time.perf_counter() - started)
+            request_id_var.reset(token)
+
+    def log(self, scope, status: int, elapsed: float) -> None:
+        if status < 400 and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        route = scope.get("route")
+        access_logger.log(
+            logging.ERROR if status >= 500 else logging.INFO,
+            "%s %s %s", scope["method"], scope["path"], status,
+            extra={
+                "method": scope["method"],
+                # Rota şablonu (/api/dues/{due_id}); eşleşmeyen isteklerde yol
+                "route": getattr(route, "path", None) or scope["path"],
+                "status": status,
+                "latency_ms": round(elapsed * 1000, 2),
+            }
+        )
@@ -0,0 +1,330 @@
+"""
+Bakım komutları
+
+Kullanım: python manage.py <komut> [seçenekler]
+"""
+import asyncio
+import os
+from datetime import datetime
+from pathlib import Path
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import UpdateMany, UpdateOne
+
+import archival
+import onboarding
+import text_search
+from rate_limit import MongoBucketStore
+from repositories import ADMIN_ROLES, Repositories, to_object_id
+from scheduler import MongoJobStore
+from tenancy import DEFAULT_TENANT, TenantRouter
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+cli = typer.Typer(help="Bina Yönetim Sistemi bakım komutları")
+
+
+def get_database():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    return client[os.environ['DB_NAME']]
+
+
+async def iterate_batches(collection, query: dict, batch_size: int, projection: dict = None):
+    """Koleksiyonu _id sırasıyla, keyset ile parça parça dolaş"""
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        batch = await collection.find(batch_query, projection).sort("_id", 1).to_list(batch_size)
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]["_id"]
+
+
+async def reindex_search_collection(collection, body_field: str, batch_size: int, force: bool) -> int:
+    query = {} if force else {"search_index": {"$exists": False}}
+    updated = 0
+    async for batch in iterate_batches(collection, query, batch_size, {"title": 1, body_field: 1}):
+        operations = [
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"search_index": text_search.build_search_index(doc.get("title"), doc.get(body_field))}}
+            )
+            for doc in batch
+        ]
+        result = await collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+    return updated
+
+
+def tenant_connector(db):
+    """(mongo_url, db_name) -> kiracı veritabanı; aynı sunucudaki kiracılar tek istemciyi paylaşır"""
+    clients = {}
+
+    def connect(mongo_url, db_name):
+        if not mongo_url:
+            return db.client[db_name]
+        if mongo_url not in clients:
+            clients[mongo_url] = AsyncIOMotorClient(mongo_url)
+        return clients[mongo_url][db_name]
+
+    return connect
+
+
+async def tenant_databases(db):
+    """Kontrol veritabanı ve tenant_routes'taki her kiracı için (kiracı id, veritabanı)"""
+    yield DEFAULT_TENANT, db
+    connect = tenant_connector(db)
+    async for route in db.tenant_routes.find({}):
+        yield str(route["_id"]), connect(route.get("mongo_url"), route["db_name"])
+
+
+async def tenant_repositories(db):
+    """Kontrol veritabanı ve tenant_routes'taki her kiracı için (kiracı id, repository kümesi)"""
+    async for tenant_id, database in tenant_databases(db):
+        # Kullanıcılar kontrol veritabanında kalır (bkz. tenancy)
+        yield tenant_id, Repositories.motor(database, users_database=db if database is not db else None)
+
+
+@cli.command("ensure-indexes")
+def ensure_indexes():
+    """Tüm kiracılarda indeksleri oluştur (STARTUP_ENSURE_INDEXES=0 ile açılışta atlanıyorsa dağıtım öncesi bir kez)"""
+    async def run():
+        db = get_database()
+        async for tenant_id, repositories in tenant_repositories(db):
+            await repositories.ensure_indexes()
+            typer.echo(f"{tenant_id}: indeksler hazır")
+        await MongoBucketStore(db).ensure_indexes()
+        await MongoJobStore(db).ensure_indexes()
+
+    asyncio.run(run())
+
+
+@cli.command("reindex-search")
+def reindex_search(batch_size: int = 1000, force: bool = False):
+    """Tüm kiracılarda talep ve duyurular için arama alanını (search_index) doldur"""
+    async def run():
+        async for tenant_id, database in tenant_databases(get_database()):
+            requests = await reindex_search_collection(database.requests, "description", batch_size, force)
+            announcements = await reindex_search_collection(database.announcements, "content", batch_size, force)
+            typer.echo(f"{tenant_id}: talepler: {requests}, duyurular: {announcements} belge güncellendi")
+
+    asyncio.run(run())
+
+
+async def backfill_request_buildings(db, batch_size: int, users_db=None) -> int:
+    """building_id alanı olmayan taleplere kullanıcının binasını yaz (kullanıcılar `users_db`'de olabilir)"""
+    users_db = users_db if users_db is not None else db
+    missing = {"$or": [{"building_id": {"$exists": False}}, {"building_id": None}]}
+    user_ids = [u for u in await db.requests.distinct("user_id", missing) if u]
+    updated = 0
+    for start in range(0, len(user_ids), batch_size):
+        chunk = user_ids[start:start + batch_size]
+        object_ids = [ObjectId(u) for u in chunk if ObjectId.is_valid(u)]
+        users = await users_db.users.find({"_id": {"$in": object_ids}}, {"building_id": 1}).to_list(None)
+        operations = [
+            UpdateMany({"user_id": str(user["_id"]), **missing}, {"$set": {"building_id": str(user["building_id"])}})
+            for user in users if user.get("building_id")
+        ]
+        if operations:
+            result = await db.requests.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+    return updated
+
+
+@cli.command("backfill-request-buildings")
+def backfill_request_buildings_command(batch_size: int = 500):
+    """Tüm kiracılarda eski taleplere building_id alanını doldur"""
+    async def run():
+        db = get_database()
+        async for tenant_id, database in tenant_databases(db):
+            updated = await backfill_request_buildings(database, batch_size, users_db=db)
+            typer.echo(f"{tenant_id}: {updated} talep güncellendi")
+
+    asyncio.run(run())
+
+
+SYNC_COLLECTIONS = ("announcements", "dues", "requests", "legal_processes", "building_status")
+
+
+@cli.command("backfill-updated-at")
+def backfill_updated_at():
+    """Delta senkronizasyon için updated_at alanı olmayan kayıtları oluşturulma zamanıyla doldur"""
+    async def run():
+        now = datetime.utcnow()
+        async for tenant_id, database in tenant_databases(get_database()):
+            for name in SYNC_COLLECTIONS:
+                result = await database[name].update_many(
+                    {"updated_at": {"$exists": False}},
+                    [{"$set": {"updated_at": {"$ifNull": ["$created_at", now]}}}]
+                )
+                typer.echo(f"{tenant_id} / {name}: {result.modified_count} kayıt güncellendi")
+
+    asyncio.run(run())
+
+
+@cli.command("rebuild-announcement-stats")
+def rebuild_announcement_stats(building_id: str = None, batch_size: int = 500):
+    """Duyuru okunma sayaçlarını announcement_reads kayıtlarından yeniden hesapla"""
+    async def run():
+        query = {"building_id": building_id} if building_id else {}
+        async for tenant_id, database in tenant_databases(get_database()):
+            repositories = Repositories.motor(database)
+            rebuilt = 0
+            async for batch in iterate_batches(database.announcements, query, batch_size, {"_id": 1}):
+                for announcement in batch:
+                    await repositories.announcements.rebuild_stats(str(announcement["_id"]))
+                    rebuilt += 1
+            typer.echo(f"{tenant_id}: {rebuilt} duyurunun istatistiği yeniden hesaplandı")
+
+    asyncio.run(run())
+
+
+@cli.command("dedupe-building-status")
+def dedupe_building_status(dry_run: bool = False):
+    """Bina başına birden fazla building_status kaydı varsa en son güncelleneni bırak (benzersiz indeks öncesi)"""
+    async def run():
+        async for tenant_id, database in tenant_databases(get_database()):
+            duplicates = database.building_status.aggregate([
+                {"$sort": {"updated_at": -1, "_id": -1}},
+                {"$group": {"_id": "$building_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}},
+            ])
+            removed = 0
+            async for group in duplicates:
+                extra = group["ids"][1:]
+                if not dry_run:
+                    await database.building_status.delete_many({"_id": {"$in": extra}})
+                removed += len(extra)
+            typer.echo(f"{tenant_id}: {removed} kopya durum kaydı {'bulundu' if dry_run else 'silindi'}")
+
+    asyncio.run(run())
+
+
+async def merge_user_records(database, user_ids, keep_id: str) -> None:
+    """Silinecek kullanıcıların taleplerini ve okundu kayıtlarını kalan kullanıcıya taşı"""
+    for name in ("requests", "requests_archive", "announcement_reads_archive"):
+        await database[name].update_many({"user_id": {"$in": user_ids}}, {"$set": {"user_id": keep_id}})
+    # Okundu kaydı (duyuru, kullanıcı) başına tek: kalan kullanıcının zaten okuduğu duyurununki silinir
+    read = set(await database.announcement_reads.distinct("announcement_id", {"user_id": keep_id}))
+    async for doc in database.announcement_reads.find({"user_id": {"$in": user_ids}}, {"announcement_id": 1}):
+        if doc["announcement_id"] in read:
+            await database.announcement_reads.delete_one({"_id": doc["_id"]})
+        else:
+            await database.announcement_reads.update_one({"_id": doc["_id"]}, {"$set": {"user_id": keep_id}})
+            read.add(doc["announcement_id"])
+
+
+@cli.command("dedupe-users")
+def dedupe_users(dry_run: bool = False):
+    """Aynı telefon numaralı kullanıcıları birleştir (users.phone_number benzersiz indeksi öncesi)"""
+    async def run():
+        db = get_database()
+        duplicates = db.users.aggregate([
+            {"$sort": {"_id": 1}},
+            {"$group": {"_id": "$phone_number", "users": {"$push": {"_id": "$_id", "role": "$role"}},
+                        "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ])
+        removed = 0
+        async for group in duplicates:
+            # Yönetici rolü olan, yoksa en eski kayıt kalır
+            users = group["users"]
+            keep = next((u for u in users if u.get("role") in ADMIN_ROLES), users[0])
+            extra = [u["_id"] for u in users if u["_id"] != keep["_id"]]
+            typer.echo(f"{group['_id']}: {keep['_id']} kalır, {', '.join(map(str, extra))} birleştirilir")
+            if not dry_run:
+                async for tenant_id, database in tenant_databases(db):
+                    await merge_user_records(database, [str(u) for u in extra], str(keep["_id"]))
+                await db.users.delete_many({"_id": {"$in": extra}})
+            removed += len(extra)
+        typer.echo(f"{removed} kopya kullanıcı {'bulundu' if dry_run else 'silindi'}")
+        if removed and not dry_run:
+            typer.echo("Okunma sayaçları için rebuild-announcement-stats çalıştırın")
+
+    asyncio.run(run())
+
+
+@cli.command("rebuild-debt-maps")
+def rebuild_debt_maps(building_id: str = None):
+    """Bina borç haritalarını daire ve aidat kayıtlarından yeniden hesapla"""
+    async def run():
+        query = {"_id": to_object_id(building_id)} if building_id else {}
+        async for tenant_id, database in tenant_databases(get_database()):
+            repositories = Repositories.motor(database)
+            rebuilt = 0
+            async for building in database.buildings.find(query, {"_id": 1}):
+                await repositories.dues.rebuild_debt_map(str(building["_id"]))
+                rebuilt += 1
+            typer.echo(f"{tenant_id}: {rebuilt} binanın borç haritası yeniden hesaplandı")
+
+    asyncio.run(run())
+
+
+@cli.command("archive")
+def archive(due_years: int = 2, request_months: int = 12, read_months: int = 6, batch_size: int = 500):
+    """Eski ödenmiş aidatları, çözülmüş talepleri ve süresi dolmuş duyuru okumalarını arşive taşı"""
+    async def run():
+        policy = archival.ArchivePolicy(due_years=due_years, request_months=request_months, read_months=read_months)
+        async for tenant_id, repositories in tenant_repositories(get_database()):
+            # Arşiv koleksiyonları ilk yazımdan önce sıkıştırmalı olarak oluşturulsun
+            await repositories.ensure_indexes()
+            moved = await archival.run_archival(repositories, policy, batch_size)
+            for name, count in moved.items():
+                typer.echo(f"{tenant_id} / {name}: {count} kayıt arşivlendi")
+
+    asyncio.run(run())
+
+
+@cli.command("jobs")
+def list_jobs(job: str = None, limit: int = 20):
+    """Zamanlanmış işlerin durumu ve son çalıştırmaları"""
+    async def run():
+        store = MongoJobStore(get_database())
+        for lock in await store.list():
+            owner = f", çalıştıran: {lock['owner']}" if lock.get("owner") else ""
+            typer.echo(f"{lock['_id']}: sonraki {lock['next_run_at']:%Y-%m-%d %H:%M}, "
+                       f"son durum {lock.get('last_status', '-')}{owner}")
+        for r in await store.history(job, limit):
+            error = f" - {r['error']}" if r.get("error") else ""
+            typer.echo(f"{r['started_at']:%Y-%m-%d %H:%M:%S} {r['job']} {r['status']} ({r['duration_ms']} ms){error}")
+
+    asyncio.run(run())
+
+
+@cli.command("import-residents")
+def import_residents(building_id: str, path: Path, dry_run: bool = False):
+    """Daire ve sakinleri CSV/XLSX dosyasından toplu aktar"""
+    async def run():
+        try:
+            frame = onboarding.read_table(path.read_bytes(), path.name)
+        except onboarding.ImportFileError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(1)
+        # Daireler binanın kiracısına, kullanıcılar kontrol veritabanına yazılır
+        db = get_database()
+        connect = tenant_connector(db)
+        tenants = TenantRouter(Repositories.motor(db), routes=db.tenant_routes,
+                               connect=lambda mongo_url, db_name: Repositories.motor(connect(mongo_url, db_name),
+                                                                                     users_database=db))
+        report = await onboarding.import_residents(
+            await tenants.for_building(building_id), building_id, onboarding.parse(frame), dry_run
+        )
+        typer.echo(
+            f"{report['total_rows']} satır, {report['valid_rows']} geçerli. "
+            f"Daireler: {report['apartments']}, kullanıcılar: {report['users']}"
+        )
+        for error in report["errors"]:
+            typer.echo(f"Satır {error['row']}: {'; '.join(error['errors'])}")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    cli()
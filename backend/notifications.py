@@ -0,0 +1,179 @@
+"""
+Duyuru bildirimleri (outbox + arka plan worker)
+
+Duyuru oluşturulurken belgeye bir `delivery` alt belgesi (outbox kaydı) yazılır;
+duyuru ve outbox kaydı tek belge olduğu için yazım atomiktir. Arka plandaki
+`OutboxWorker` bekleyen kayıtları kiralayıp (lease) binadaki tüm sakinlere
+partiler halinde bildirim gönderir:
+
+- Her parti sonrası ilerleme (son kullanıcı id'si) kaydedilir; çökme
+  sonrasında gönderim kaldığı yerden devam eder.
+- Başarısız alıcılar üstel geri çekilme (backoff) ile yeniden denenir.
+- Aynı anda uçuşta olan parti sayısı sınırlıdır (backpressure); gönderici
+  yavaşladığında worker'lar bekler, bellek ve bağlantılar şişmez.
+"""
+import asyncio
+import logging
+import random
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def new_delivery(now: datetime) -> dict:
+    """Yeni duyuru için outbox kaydı"""
+    return {
+        "pending": True,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "last_user_id": None,
+        "sent": 0,
+        "failed": 0,
+    }
+
+
+class NotificationSender(ABC):
+    @abstractmethod
+    async def send_batch(self, notifications: List[dict]) -> List[str]:
+        """Bildirimleri gönder; gönderilemeyen alıcıların user_id listesini döndür"""
+
+
+class StubNotificationSender(NotificationSender):
+    """Yerel/test göndericisi: bildirimleri bellekte tutar ve loglar"""
+
+    def __init__(self, fail_user_ids: Optional[set] = None):
+        self.sent: List[dict] = []
+        self.fail_user_ids = fail_user_ids or set()
+
+    async def send_batch(self, notifications):
+        failed = [n["user_id"] for n in notifications if n["user_id"] in self.fail_user_ids]
+        self.sent.extend(n for n in notifications if n["user_id"] not in self.fail_user_ids)
+        logger.info(f"{len(notifications) - len(failed)} bildirim gönderildi, {len(failed)} başarısız")
+        return failed
+
+
+class OutboxWorker:
+    def __init__(self, repositories, sender: NotificationSender, workers: int = 2, batch_size: int = 500,
+                 max_in_flight: int = 4, max_attempts: int = 5, retry_base: float = 0.5,
+                 lease_seconds: int = 60, poll_interval: float = 2.0):
+        self.repositories = repositories
+        self.sender = sender
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        # Tüm worker'lar arasında aynı anda gönderimde olabilecek parti sayısı
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run(), name=f"outbox-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        """Yeni outbox kaydı yazıldı; beklemeden işle"""
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.process_next()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker hatası: {str(e)}")
+                processed = False
+            if not processed:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _lease_until(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+
+    async def process_next(self) -> bool:
+        """Sıradaki outbox kaydını kirala ve gönder; iş yoksa False"""
+        announcements = self.repositories.announcements
+        job = await announcements.claim_delivery(datetime.utcnow(), self._lease_until())
+        if job is None:
+            return False
+
+        delivery = job["delivery"]
+        last_user_id = delivery.get("last_user_id")
+        sent, failed = delivery.get("sent", 0), delivery.get("failed", 0)
+        try:
+            while True:
+                user_ids = await self.repositories.users.list_ids_for_building(
+                    job["building_id"], last_user_id, self.batch_size
+                )
+                if not user_ids:
+                    break
+                batch_failed = await self._send_with_retry([self._notification(job, u) for u in user_ids])
+                sent += len(user_ids) - len(batch_failed)
+                failed += len(batch_failed)
+                last_user_id = user_ids[-1]
+                # İlerlemeyi kaydet ve kirayı uzat
+                await announcements.update_delivery(job["_id"], {
+                    "last_user_id": last_user_id,
+                    "sent": sent,
+                    "failed": failed,
+                    "next_attempt_at": self._lease_until(),
+                })
+        except Exception as e:
+            attempts = delivery.get("attempts", 1)
+            give_up = attempts >= self.max_attempts
+            logger.error(f"Duyuru bildirimi başarısız ({job['_id']}, deneme {attempts}): {str(e)}")
+            await announcements.update_delivery(job["_id"], {
+                "pending": not give_up,
+                "status": "failed" if give_up else "pending",
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=self._backoff(attempts)),
+                "error": str(e),
+            })
+            return True
+
+        await announcements.update_delivery(job["_id"], {
+            "pending": False,
+            "status": "completed",
+            "completed_at": datetime.utcnow(),
+        })
+        return True
+
+    async def _send_with_retry(self, notifications: List[dict]) -> List[str]:
+        """Partiyi gönder; başarısız alıcıları backoff ile yeniden dene"""
+        remaining = notifications
+        for attempt in range(1, self.max_attempts + 1):
+            async with self._in_flight:
+                failed_ids = set(await self.sender.send_batch(remaining))
+            remaining = [n for n in remaining if n["user_id"] in failed_ids]
+            if not remaining:
+                return []
+            if attempt < self.max_attempts:
+                await asyncio.sleep(self._backoff(attempt))
+        return [n["user_id"] for n in remaining]
+
+    def _backoff(self, attempt: int) -> float:
+        return self.retry_base * (2 ** (attempt - 1)) * (0.5 + random.random())
+
+    @staticmethod
+    def _notification(announcement: dict, user_id: str) -> dict:
+        return {
+            "user_id": user_id,
+            "announcement_id": announcement["_id"],
+            "building_id": announcement["building_id"],
+            "title": announcement.get("title"),
+            "body": announcement.get("content"),
+            "priority": announcement.get("priority", "normal"),
+        }
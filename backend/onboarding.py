@@ -0,0 +1,164 @@
+"""
+Toplu daire ve sakin aktarımı (CSV / XLSX)
+
+Dosya pandas ile okunur; sütun eşleme, normalizasyon ve doğrulama satır satır
+değil sütun işlemleriyle yapılır. Geçerli satırlar daireler
+(building_id, block, apartment_number) ve kullanıcılar (phone_number)
+üzerinden toplu upsert ile yazılır; hatalı satırlar satır numarasıyla raporlanır.
+"""
+import io
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import pandas as pd
+
+# Dosyadaki sütun adları (küçük harf) -> alan adı
+COLUMN_ALIASES = {
+    "block": "block", "blok": "block",
+    "floor": "floor", "kat": "floor",
+    "apartment_number": "apartment_number", "apartment": "apartment_number", "daire": "apartment_number",
+    "daire_no": "apartment_number", "daire no": "apartment_number",
+    "phone_number": "phone_number", "phone": "phone_number", "telefon": "phone_number",
+    "role": "role", "rol": "role",
+    "name": "name", "ad": "name", "ad soyad": "name", "ad_soyad": "name", "isim": "name",
+}
+REQUIRED_COLUMNS = ("block", "apartment_number")
+RESIDENT_ROLES = ("tenant", "owner")
+# Türkçe rol adları da kabul edilir
+ROLE_ALIASES = {"kiracı": "tenant", "kiraci": "tenant", "mülk sahibi": "owner", "mulk sahibi": "owner", "ev sahibi": "owner"}
+
+# Başlık satırı 1. satırdır; veri satırları 2'den başlar
+FIRST_DATA_ROW = 2
+
+
+class ImportFileError(ValueError):
+    """Dosya okunamadı ya da zorunlu sütunlar eksik"""
+
+
+@dataclass
+class ParsedImport:
+    apartments: List[dict] = field(default_factory=list)
+    residents: List[dict] = field(default_factory=list)
+    errors: List[dict] = field(default_factory=list)
+    total_rows: int = 0
+
+
+def read_table(content: bytes, filename: str) -> pd.DataFrame:
+    """CSV ya da XLSX dosyasını metin sütunlu DataFrame olarak oku"""
+    try:
+        if filename.lower().endswith((".xlsx", ".xls")):
+            frame = pd.read_excel(io.BytesIO(content), dtype=str)
+        else:
+            frame = pd.read_csv(io.BytesIO(content), dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+    except Exception as e:
+        raise ImportFileError(f"Dosya okunamadı: {str(e)}") from e
+
+    frame.columns = [COLUMN_ALIASES.get(str(c).strip().lower(), str(c).strip().lower()) for c in frame.columns]
+    missing = [c for c in REQUIRED_COLUMNS if c not in frame.columns]
+    if missing:
+        raise ImportFileError(f"Eksik sütunlar: {', '.join(missing)}")
+    for column in ("floor", "phone_number", "role", "name"):
+        if column not in frame.columns:
+            frame[column] = None
+    return frame
+
+
+def _normalize_phone(phones: pd.Series) -> pd.Series:
+    """Rakam dışını at, +90 / 0 önekini kaldır: 10 haneli numara"""
+    digits = phones.fillna("").str.replace(r"\D", "", regex=True)
+    digits = digits.where(~(digits.str.len().eq(12) & digits.str.startswith("90")), digits.str[2:])
+    return digits.where(~(digits.str.len().eq(11) & digits.str.startswith("0")), digits.str[1:])
+
+
+def parse(frame: pd.DataFrame) -> ParsedImport:
+    """Satırları toplu doğrula; geçerli daire ve sakin kayıtlarını ve satır hatalarını döndür"""
+    frame = frame.dropna(how="all")
+    rows = frame.index.to_series() + FIRST_DATA_ROW
+    block = frame["block"].fillna("").str.strip().str.upper()
+    number = pd.to_numeric(frame["apartment_number"].str.strip(), errors="coerce")
+    floor_text = frame["floor"].fillna("").str.strip()
+    floor = pd.to_numeric(floor_text, errors="coerce")
+    phone = _normalize_phone(frame["phone_number"])
+    role_text = frame["role"].fillna("").str.strip().str.lower()
+    role = role_text.replace(ROLE_ALIASES).mask(role_text.eq(""), "tenant")
+    name = frame["name"].fillna("").str.strip()
+    has_phone = phone.ne("")
+
+    checks = [
+        (block.eq(""), "Blok boş"),
+        (number.isna() | (number % 1 != 0) | (number <= 0), "Daire numarası geçersiz"),
+        (floor_text.ne("") & (floor.isna() | (floor % 1 != 0)), "Kat geçersiz"),
+        (has_phone & phone.str.len().ne(10), "Telefon numarası 10 haneli olmalı"),
+        (has_phone & ~role.isin(RESIDENT_ROLES), "Rol tenant/owner (kiracı/mülk sahibi) olmalı"),
+        (has_phone & phone.duplicated(keep="first"), "Telefon numarası dosyada tekrar ediyor"),
+    ]
+    messages = pd.Series([[] for _ in range(len(frame))], index=frame.index, dtype=object)
+    for failed, message in checks:
+        for index in failed[failed].index:
+            messages[index].append(message)
+    invalid = messages.str.len().gt(0)
+
+    result = ParsedImport(total_rows=len(frame))
+    result.errors = [
+        {"row": int(rows[index]), "errors": messages[index]} for index in invalid[invalid].index
+    ]
+
+    valid = ~invalid
+    apartments = pd.DataFrame({
+        "block": block[valid],
+        "apartment_number": number[valid].astype("Int64"),
+        "floor": floor[valid].astype("Int64"),
+    }).drop_duplicates(subset=["block", "apartment_number"], keep="last")
+    result.apartments = [
+        {
+            "block": row.block,
+            "apartment_number": int(row.apartment_number),
+            "floor": None if pd.isna(row.floor) else int(row.floor),
+        }
+        for row in apartments.itertuples(index=False)
+    ]
+
+    residents = valid & has_phone
+    result.residents = [
+        {
+            "phone_number": row.phone,
+            "role": row.role,
+            "name": row.name or "Sakin",
+            "block": row.block,
+            "apartment_number": int(row.number),
+        }
+        for row in pd.DataFrame({
+            "phone": phone[residents], "role": role[residents], "name": name[residents],
+            "block": block[residents], "number": number[residents],
+        }).itertuples(index=False)
+    ]
+    return result
+
+
+async def import_residents(repositories, building_id: str, parsed: ParsedImport, dry_run: bool = False) -> Dict:
+    """Daireleri ve sakinleri toplu upsert ile yaz; özet ve satır hatalarını döndür"""
+    report = {
+        "total_rows": parsed.total_rows,
+        "valid_rows": parsed.total_rows - len(parsed.errors),
+        "apartments": {"inserted": 0, "updated": 0},
+        "users": {"inserted": 0, "updated": 0},
+        "errors": parsed.errors,
+        "dry_run": dry_run,
+    }
+    if dry_run or not parsed.apartments:
+        return report
+
+    apartment_ids, report["apartments"] = await repositories.buildings.upsert_apartments(building_id, parsed.apartments)
+    users = [
+        {
+            "phone_number": resident["phone_number"],
+            "name": resident["name"],
+            "role": resident["role"],
+            "building_id": building_id,
+            "apartment_id": apartment_ids[(resident["block"], resident["apartment_number"])],
+        }
+        for resident in parsed.residents
+    ]
+    if users:
+        report["users"] = await repositories.users.upsert_many(users)
+    return report
@@ -0,0 +1,91 @@
+"""
+Keyset (imleç) sayfalama ve delta senkronizasyon token yardımcıları
+
+Liste sırası her zaman (sıralama anahtarı azalan, tür artan, _id azalan)
+düzenindedir. Son öğenin (anahtar, tür, _id) üçlüsü opak bir imlece kodlanır;
+sonraki sayfa bu üçlüden sonra gelen öğelerle devam eder. Offset kullanılmadığı
+için derin sayfalar da indeks üzerinden aynı hızda okunur.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+
+def encode_cursor(value: Any, kind: str, doc_id: str) -> str:
+    if isinstance(value, datetime):
+        payload = {"d": value.isoformat(), "k": kind, "i": doc_id}
+    else:
+        payload = {"v": value, "k": kind, "i": doc_id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    """İmleci çöz; geçersizse ValueError"""
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value = datetime.fromisoformat(payload["d"]) if "d" in payload else payload["v"]
+        return {"value": value, "kind": payload["k"], "id": payload["i"]}
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Geçersiz imleç") from e
+
+
+def is_after_cursor(kind: str, value: Any, doc_id: str, cursor: Optional[dict]) -> bool:
+    """
+    Sıralama (değer azalan, tür artan, _id azalan) düzeninde belge imleçten
+    sonra mı geliyor?
+    """
+    if cursor is None:
+        return True
+    if value != cursor["value"]:
+        return value < cursor["value"]
+    if kind != cursor["kind"]:
+        return kind > cursor["kind"]
+    return doc_id < cursor["id"]
+
+
+def cursor_match(kind: str, field: str, cursor: Optional[dict], id_filter) -> dict:
+    """`is_after_cursor` koşulunun Mongo $match karşılığı (id_filter: _id < imleç)"""
+    if cursor is None:
+        return {}
+    if kind > cursor["kind"]:
+        return {field: {"$lte": cursor["value"]}}
+    if kind < cursor["kind"]:
+        return {field: {"$lt": cursor["value"]}}
+    return {"$or": [
+        {field: {"$lt": cursor["value"]}},
+        {field: cursor["value"], "_id": id_filter},
+    ]}
+
+
+def encode_sync_token(synced_at: datetime, after: Optional[datetime] = None,
+                      positions: Optional[Dict[str, Tuple[datetime, str]]] = None) -> str:
+    """
+    Delta senkronizasyon token'ı: son senkronizasyon anı. Sayfası dolan akış varsa
+    devam token'ı ayrıca sorgunun alt sınırını ve bu akışların son (zaman, _id)
+    konumunu taşır; devam sayfaları örtüşme uygulanmadan bu konumdan sürer.
+    """
+    payload: Dict[str, Any] = {"t": synced_at.isoformat()}
+    if positions:
+        payload["a"] = after.isoformat() if after else None
+        payload["p"] = {stream: [at.isoformat(), doc_id] for stream, (at, doc_id) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_sync_token(token: Optional[str]) -> Optional[dict]:
+    """Token'ı çöz: synced_at, after ve positions (son token'da boş); geçersizse ValueError"""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return {
+            "synced_at": datetime.fromisoformat(payload["t"]),
+            "after": datetime.fromisoformat(payload["a"]) if payload.get("a") else None,
+            "positions": {
+                stream: (datetime.fromisoformat(at), str(doc_id)) for stream, (at, doc_id) in payload.get("p", {}).items()
+            },
+        }
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ValueError("Geçersiz senkronizasyon token'ı") from e
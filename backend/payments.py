@@ -0,0 +1,310 @@
+"""
+Ödeme sağlayıcı adaptörü
+
+Ödeme sağlayıcısı `PaymentProvider` arayüzünün arkasındadır; `PAYMENT_PROVIDER`
+ile seçilir (şimdilik yalnızca yerel `stub`). Sağlayıcıya yapılan her çağrı
+`PaymentGateway` üzerinden geçer:
+
+- Çağrı başına zaman aşımı; aşılırsa çağrı iptal edilir.
+- Aynı anda sağlayıcıda bekleyen çağrı sayısı bir semafor ile sınırlıdır;
+  sıra kısa sürede boşalmazsa istek reddedilir. Yavaş bir sağlayıcı yalnızca
+  ödeme isteklerini etkiler, diğer uçlar bağlantı/worker beklemez.
+- Yalnızca idempotent işlemler (durum sorgusu, idempotency anahtarıyla
+  tahsilat ve iade) jitter'lı üstel geri çekilme ile yeniden denenir.
+- Art arda hatalardan sonra devre kesici açılır ve çağrılar sağlayıcıya hiç
+  gitmeden hemen reddedilir; bekleme süresi dolunca tek bir deneme çağrısı
+  yapılır, başarılıysa devre kapanır.
+- Sağlayıcı gecikmeleri işlem başına sayaç ve histogram olarak tutulur.
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Gecikme histogramı dilimleri (saniye, üst sınır)
+LATENCY_BUCKETS: List[Tuple[str, Optional[float]]] = [
+    ("lt_100ms", 0.1),
+    ("100ms_500ms", 0.5),
+    ("500ms_1s", 1.0),
+    ("1s_3s", 3.0),
+    ("3s_10s", 10.0),
+    ("gte_10s", None),
+]
+
+
+@dataclass(frozen=True)
+class PaymentResult:
+    success: bool
+    transaction_id: Optional[str]
+    message: str = ""
+
+
+class PaymentError(Exception):
+    """Sağlayıcıya ulaşılamadı ya da beklenmeyen yanıt verdi (yeniden denenebilir)"""
+
+
+class PaymentUnavailable(Exception):
+    """
+    Ödeme şu an alınamıyor (devre açık, sıra dolu ya da sağlayıcı yanıt vermedi).
+    `sent` False ise çağrı sağlayıcıya hiç gitmedi; True ise sonucu belirsizdir.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0, sent: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.sent = sent
+
+
+class PaymentProvider(ABC):
+    # Aynı idempotency anahtarıyla tekrarlanan tahsilat ikinci kez çekim yapmıyorsa True
+    idempotent_charges: bool = False
+
+    @abstractmethod
+    async def charge(self, idempotency_key: str, amount: float, currency: str, method: str,
+                     metadata: Dict[str, str]) -> PaymentResult:
+        """Tahsilat yap; reddedilirse success=False, iletişim hatasında PaymentError"""
+
+    @abstractmethod
+    async def get_status(self, idempotency_key: str) -> Optional[PaymentResult]:
+        """Anahtara ait tahsilatın sonucu; hiç yapılmadıysa None"""
+
+    @abstractmethod
+    async def refund(self, idempotency_key: str, transaction_id: str, amount: float) -> PaymentResult:
+        """Tahsilatı iade et (aynı anahtarla tekrar ikinci kez iade etmez); iletişim hatasında PaymentError"""
+
+
+class StubPaymentProvider(PaymentProvider):
+    """Yerel/test sağlayıcısı: her tahsilatı kabul eder, sonuçları bellekte tutar"""
+
+    idempotent_charges = True
+
+    def __init__(self, latency: float = 0.0, decline_methods: Optional[set] = None):
+        self.latency = latency
+        self.decline_methods = decline_methods or set()
+        self.charges: Dict[str, PaymentResult] = {}
+        self.refunds: Dict[str, PaymentResult] = {}
+        self.refunded: set = set()
+
+    async def charge(self, idempotency_key, amount, currency, method, metadata):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if idempotency_key in self.charges:
+            result = self.charges[idempotency_key]
+            if result.transaction_id in self.refunded:
+                # İade edilmiş tahsilatın tekrarı yeni çekim sayılmaz
+                return PaymentResult(success=False, transaction_id=result.transaction_id,
+                                     message="Bu ödeme iade edilmiş; yeni bir idempotency anahtarıyla deneyin")
+            return result
+        if method in self.decline_methods:
+            return PaymentResult(success=False, transaction_id=None, message="Ödeme reddedildi")
+        result = PaymentResult(success=True, transaction_id=f"TEST-{uuid.uuid4().hex[:16].upper()}")
+        self.charges[idempotency_key] = result
+        return result
+
+    async def get_status(self, idempotency_key):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.charges.get(idempotency_key)
+
+    async def refund(self, idempotency_key, transaction_id, amount):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if idempotency_key not in self.refunds:
+            self.refunds[idempotency_key] = PaymentResult(success=True, transaction_id=f"REFUND-{transaction_id}")
+            self.refunded.add(transaction_id)
+        return self.refunds[idempotency_key]
+
+
+class CircuitBreaker:
+    """Art arda `failure_threshold` hatada açılır; `reset_timeout` sonra tek deneme çağrısına izin verir"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(1.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """Deneme çağrısı sağlayıcıya hiç gitmedi; bir sonraki çağrı deneme olabilir"""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Ödeme sağlayıcısı devre kesicisi açıldı ({self.failures} hata)")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class LatencyMetrics:
+    """İşlem başına çağrı, hata, zaman aşımı sayaçları ve gecikme histogramı"""
+
+    def __init__(self):
+        self.operations: Dict[str, dict] = {}
+
+    def _entry(self, operation: str) -> dict:
+        return self.operations.setdefault(operation, {
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+            "latency": {name: 0 for name, _ in LATENCY_BUCKETS},
+        })
+
+    def observe(self, operation: str, seconds: float, outcome: str = "ok") -> None:
+        entry = self._entry(operation)
+        entry["calls"] += 1
+        if outcome == "error":
+            entry["errors"] += 1
+        elif outcome == "timeout":
+            entry["timeouts"] += 1
+        entry["total_seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        for name, upper in LATENCY_BUCKETS:
+            if upper is None or seconds < upper:
+                entry["latency"][name] += 1
+                break
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            operation: {
+                **entry,
+                "latency": dict(entry["latency"]),
+                "avg_seconds": entry["total_seconds"] / entry["calls"] if entry["calls"] else 0.0,
+            }
+            for operation, entry in self.operations.items()
+        }
+
+
+class PaymentGateway:
+    def __init__(self, provider: PaymentProvider, timeout: float = 10.0, max_concurrency: int = 20,
+                 queue_timeout: float = 0.5, retries: int = 2, retry_base: float = 0.2,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.retry_base = retry_base
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = LatencyMetrics()
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def charge(self, idempotency_key: str, amount: float, currency: str = "TRY", method: str = "test",
+                     metadata: Optional[Dict[str, str]] = None) -> PaymentResult:
+        """Tahsilat; sağlayıcı idempotency anahtarını destekliyorsa hatada yeniden denenir"""
+        return await self._call(
+            "charge",
+            lambda: self.provider.charge(idempotency_key, amount, currency, method, metadata or {}),
+            retries=self.retries if self.provider.idempotent_charges else 0
+        )
+
+    async def get_status(self, idempotency_key: str) -> Optional[PaymentResult]:
+        return await self._call("get_status", lambda: self.provider.get_status(idempotency_key), retries=self.retries)
+
+    async def refund(self, idempotency_key: str, transaction_id: str, amount: float) -> PaymentResult:
+        """İade; idempotency anahtarıyla yapıldığı için hatada yeniden denenir"""
+        return await self._call("refund", lambda: self.provider.refund(idempotency_key, transaction_id, amount),
+                                retries=self.retries)
+
+    def health(self) -> dict:
+        return {
+            "provider": type(self.provider).__name__,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "metrics": self.metrics.snapshot(),
+        }
+
+    async def _call(self, operation: str, call: Callable[[], Awaitable[T]], retries: int) -> T:
+        for attempt in range(retries + 1):
+            try:
+                return await self._attempt(operation, call)
+            except PaymentUnavailable as e:
+                # Önceki deneme sağlayıcıya gitti: sonuç belirsiz
+                e.sent = e.sent or attempt > 0
+                raise
+            except PaymentError as e:
+                if attempt >= retries:
+                    raise PaymentUnavailable("Ödeme sağlayıcısına ulaşılamadı", retry_after=1.0, sent=True) from e
+                logger.warning(f"Ödeme sağlayıcısı hatası ({operation}, deneme {attempt + 1}): {str(e)}")
+                await asyncio.sleep(self._backoff(attempt + 1))
+
+    async def _attempt(self, operation: str, call: Callable[[], Awaitable[T]]) -> T:
+        if not self.breaker.allow():
+            raise PaymentUnavailable("Ödeme sistemi geçici olarak kullanılamıyor", self.breaker.retry_after())
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Sağlayıcıyla ilgili bir hata değil; devreyi etkilemez
+            self.breaker.release_probe()
+            raise PaymentUnavailable("Ödeme sistemi yoğun, lütfen daha sonra tekrar deneyin")
+        except BaseException:
+            # İptal (istemci koptu, kapanış): deneme hakkı bırakılmazsa devre yarı açık kalır
+            self.breaker.release_probe()
+            raise
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(call(), timeout=self.timeout)
+        except asyncio.TimeoutError as e:
+            self.metrics.observe(operation, time.perf_counter() - started, "timeout")
+            self.breaker.record_failure()
+            raise PaymentError("Zaman aşımı") from e
+        except Exception as e:
+            self.metrics.observe(operation, time.perf_counter() - started, "error")
+            self.breaker.record_failure()
+            raise PaymentError(str(e)) from e
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        finally:
+            self._slots.release()
+        self.metrics.observe(operation, time.perf_counter() - started)
+        self.breaker.record_success()
+        return result
+
+    def _backoff(self, attempt: int) -> float:
+        return self.retry_base * (2 ** (attempt - 1)) * (0.5 + random.random())
+
+
+def create_provider(name: str, **options) -> PaymentProvider:
+    """`PAYMENT_PROVIDER` adına göre sağlayıcı"""
+    if name == "stub":
+        return StubPaymentProvider(latency=float(options.get("latency", 0.0)))
+    raise ValueError(f"Bilinmeyen ödeme sağlayıcısı: {name}")
@@ -0,0 +1,35 @@
+"""
+Portföy göstergelerinin yenilenmesi
+
+Göstergeler tüm koleksiyonları tarayan aggregation'larla hesaplandığı için
+istek sırasında değil, `portfolio-refresh` zamanlanmış işiyle (bkz. jobs),
+her kiracının veritabanında paralel olarak yenilenir. İş kiralık kilitle
+çalıştığı için her aralıkta dağıtımda tek bir hesaplama yapılır.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PortfolioRefresher:
+    def __init__(self, tenants):
+        self.tenants = tenants
+        self.refreshed_at: Optional[datetime] = None
+        self._running: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> int:
+        """Göstergeleri şimdi yenile; süren bir yenileme varsa onu bekle"""
+        if self._running is None or self._running.done():
+            self._running = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._running)
+
+    async def _refresh(self) -> int:
+        now = datetime.utcnow()
+        counts = await self.tenants.fan_out(lambda repositories: repositories.portfolio.refresh(now))
+        count = sum(counts.values())
+        self.refreshed_at = now
+        logger.info(f"Portföy göstergeleri yenilendi ({count} bina)")
+        return count
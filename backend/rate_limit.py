@@ -0,0 +1,196 @@
+"""
+İstek sınırlama (token bucket)
+
+Her istek bir rota sınıfına ayrılır (login, write, read) ve istemci IP'si +
+rota sınıfı için ayrı bir token kovasından harcar; giriş denemeleri ayrıca
+telefon numarası başına sınırlanır. Kova durumu varsayılan olarak süreç
+içinde tutulur; `RATE_LIMIT_BACKEND=mongo` ile `rate_limits` koleksiyonunda
+tutulur ve sınırlar tüm worker'lar arasında ortak uygulanır.
+
+Aşırı yük altında (süreçte uçuşta olan istek sayısı eşiği aşınca) önce
+pahalı yazma istekleri reddedilir, okumalar daha geç kesilir. Reddedilen
+istekler `429` ve `Retry-After` başlığıyla döner.
+"""
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+LOGIN_PATH = "/api/auth/login"
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    capacity: float  # en fazla birikebilecek token (ani yük payı)
+    rate: float      # saniyede eklenen token
+
+    @classmethod
+    def parse(cls, text: str) -> "BucketLimit":
+        """"10/60" -> 60 saniyede 10 istek (10'luk ani yük payıyla)"""
+        count, _, seconds = text.partition("/")
+        return cls(capacity=float(count), rate=float(count) / float(seconds or 1))
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """İsteğin rota sınıfı; sınırlanmayan istekler için None"""
+    if not path.startswith("/api") or method == "OPTIONS":
+        return None
+    if path == LOGIN_PATH:
+        return "login"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class BucketStore(ABC):
+    @abstractmethod
+    async def take(self, key: str, limit: BucketLimit, cost: float = 1.0) -> float:
+        """Kovadan token harca; izin verildiyse 0, aksi halde beklenecek saniye"""
+
+    async def ensure_indexes(self) -> None:
+        """Gerekli indeksleri oluştur (bellek içi uygulamada gerek yok)"""
+
+
+class InMemoryBucketStore(BucketStore):
+    """Süreç içi kovalar: key -> (token, son güncelleme)"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def take(self, key, limit, cost=1.0):
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+        if tokens >= cost:
+            self._store(key, tokens - cost, now)
+            return 0.0
+        self._store(key, tokens, now)
+        return (cost - tokens) / limit.rate
+
+    def _store(self, key: str, tokens: float, now: float) -> None:
+        if key not in self.buckets and len(self.buckets) >= self.max_keys:
+            # Sahte IP/telefon selinde belleği sınırla: en eski kovayı at
+            self.buckets.pop(next(iter(self.buckets)))
+        self.buckets[key] = (tokens, now)
+
+
+class MongoBucketStore(BucketStore):
+    """
+    Worker'lar arası ortak kovalar. Dolum ve harcama tek bir pipeline
+    güncellemesiyle atomik yapılır; kullanılmayan kovalar TTL ile silinir.
+    """
+
+    def __init__(self, database, idle_ttl: timedelta = timedelta(hours=1)):
+        self.collection = database.rate_limits
+        self.idle_ttl = idle_ttl
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at"),
+        ])
+
+    async def take(self, key, limit, cost=1.0):
+        now = datetime.utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        refilled = {"$min": [limit.capacity, {"$add": [
+            {"$ifNull": ["$tokens", limit.capacity]}, {"$multiply": [elapsed, limit.rate]}
+        ]}]}
+        allowed = {"$gte": ["$tokens", cost]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {
+                    "allowed": allowed,
+                    "tokens": {"$cond": [allowed, {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "expires_at": now + self.idle_ttl,
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (cost - bucket["tokens"]) / limit.rate
+
+
+class RateLimiter:
+    def __init__(self, store: BucketStore, limits: Dict[str, BucketLimit], phone_limit: BucketLimit,
+                 max_in_flight: int = 200, shed_writes_at: float = 0.75):
+        self.store = store
+        self.limits = limits
+        self.phone_limit = phone_limit
+        self.max_in_flight = max_in_flight
+        # Bu doluluğun üstünde yazma/giriş istekleri reddedilir, okumalar max_in_flight'a kadar kabul edilir
+        self.write_in_flight = int(max_in_flight * shed_writes_at)
+        self.in_flight = 0
+
+    def overloaded(self, route: str) -> bool:
+        threshold = self.max_in_flight if route == "read" else self.write_in_flight
+        return self.in_flight >= threshold
+
+    async def check(self, key: str, limit: BucketLimit) -> float:
+        """Kovadan harca; kova deposu erişilemezse isteği engelleme"""
+        try:
+            return await self.store.take(key, limit)
+        except Exception as e:
+            logger.warning(f"İstek sınırlama deposu hatası: {str(e)}")
+            return 0.0
+
+    async def check_phone(self, phone_number: str) -> float:
+        return await self.check(f"phone:{phone_number}", self.phone_limit)
+
+
+def too_many_requests(retry_after: float, detail: str = "Çok fazla istek, lütfen daha sonra tekrar deneyin"):
+    return JSONResponse(
+        {"detail": detail},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class RateLimitMiddleware:
+    """IP + rota sınıfı başına token bucket ve yük altında yazma-önce reddetme (ASGI)"""
+
+    def __init__(self, app, limiter: RateLimiter, trust_forwarded: bool = False):
+        self.app = app
+        self.limiter = limiter
+        self.trust_forwarded = trust_forwarded
+
+    def client_ip(self, scope) -> str:
+        if self.trust_forwarded:
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope, receive, send):
+        route = route_class(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiter
+        if limiter.overloaded(route):
+            await too_many_requests(1, "Sunucu yoğun, lütfen daha sonra tekrar deneyin")(scope, receive, send)
+            return
+        retry_after = await limiter.check(f"ip:{self.client_ip(scope)}:{route}", limiter.limits[route])
+        if retry_after > 0:
+            await too_many_requests(retry_after)(scope, receive, send)
+            return
+
+        limiter.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight -= 1
@@ -0,0 +1,136 @@
+"""
+Aidat ödeme makbuzları (PDF / PNG)
+
+Makbuz sunucuda Pillow ile çizilir; çizim CPU yoğun olduğu için event loop
+dışında bir süreç havuzunda çalışır. Çıktı diskte içerik adresli olarak
+saklanır: anahtar `transaction_id`, `payment_date` ve tutarın özetidir. Aynı
+makbuzun tekrar indirilmesi yalnızca diskten okumadır; ödeme düzeltilirse
+anahtar değişir ve yeni makbuz üretilir.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Çizim değişirse artırılır; eski önbellek dosyaları kullanılmaz
+RECEIPT_VERSION = 1
+
+FORMATS = {"pdf": "application/pdf", "png": "image/png"}
+
+PAGE_SIZE = (1240, 1754)  # A4, 150 dpi
+PAGE_DPI = 150
+
+MONTHS = ["Ocak", "Şubat", "Mart", "Nisan", "Mayıs", "Haziran",
+          "Temmuz", "Ağustos", "Eylül", "Ekim", "Kasım", "Aralık"]
+
+# Türkçe karakterleri kapsayan bir TrueType font; bulunamazsa Pillow'un gömülü fontu
+FONT_PATH = os.environ.get("RECEIPT_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+
+PAYMENT_METHODS = {"credit_card": "Kredi Kartı", "bank_transfer": "Havale/EFT", "test": "Test Ödeme"}
+
+
+def receipt_key(due: dict) -> str:
+    """Makbuz içeriğini belirleyen alanların özeti"""
+    payment_date = due.get("payment_date")
+    if isinstance(payment_date, datetime):
+        payment_date = payment_date.isoformat()
+    source = f"{RECEIPT_VERSION}|{due.get('transaction_id')}|{payment_date}|{float(due.get('amount') or 0):.2f}"
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def receipt_fields(due: dict, building: Optional[dict], apartment: Optional[dict]) -> dict:
+    """Makbuza basılacak satırlar (süreç havuzuna gönderilebilir düz veri)"""
+    payment_date = due.get("payment_date")
+    period = f"{MONTHS[due['month'] - 1]} {due['year']}" if due.get("month") and due.get("year") else "-"
+    apartment_text = "-"
+    if apartment:
+        apartment_text = f"{apartment.get('block', '')} Blok, Daire {apartment.get('apartment_number', '')}"
+    return {
+        "company": (building or {}).get("name") or "Site Yönetimi",
+        "rows": [
+            ("Aidat Dönemi", period),
+            ("Daire", apartment_text),
+            ("Tutar", f"{float(due.get('amount') or 0):,.2f} TL"),
+            ("Ödeme Tarihi", payment_date.strftime("%d.%m.%Y %H:%M") if isinstance(payment_date, datetime) else "-"),
+            ("Ödeme Yöntemi", PAYMENT_METHODS.get(due.get("payment_method"), due.get("payment_method") or "-")),
+            ("İşlem Numarası", str(due.get("transaction_id") or "-")),
+        ],
+    }
+
+
+def _font(size: int):
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+
+def _render(fields: dict, fmt: str) -> bytes:
+    """Makbuzu çiz (süreç havuzunda çalışır)"""
+    image = Image.new("RGB", PAGE_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    title_font = _font(56)
+    label_font = _font(34)
+    value_font = _font(38)
+    margin = 110
+
+    draw.rectangle([0, 0, PAGE_SIZE[0], 260], fill=(30, 64, 175))
+    draw.text((margin, 80), fields["company"], font=title_font, fill="white")
+    draw.text((margin, 170), "Aidat Ödeme Makbuzu", font=label_font, fill=(219, 234, 254))
+
+    y = 360
+    for label, value in fields["rows"]:
+        draw.text((margin, y), label, font=label_font, fill=(107, 114, 128))
+        draw.text((margin, y + 48), value, font=value_font, fill=(17, 24, 39))
+        y += 140
+        draw.line([margin, y - 30, PAGE_SIZE[0] - margin, y - 30], fill=(229, 231, 235), width=2)
+
+    draw.text((margin, PAGE_SIZE[1] - 140), "Bu makbuz elektronik olarak oluşturulmuştur.",
+              font=label_font, fill=(156, 163, 175))
+
+    buffer = io.BytesIO()
+    if fmt == "pdf":
+        image.save(buffer, "PDF", resolution=PAGE_DPI)
+    else:
+        image.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+class ReceiptRenderer:
+    def __init__(self, root: Path, workers: int = 2):
+        self.root = Path(root)
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def path_for(self, key: str, fmt: str) -> Path:
+        # İki seviyeli dizin: tek dizinde çok sayıda dosya birikmesin
+        return self.root / key[:2] / f"{key}.{fmt}"
+
+    async def render(self, key: str, fmt: str, fields: dict) -> Path:
+        """Makbuzu çizip önbelleğe yaz; yarım dosya hiç görünmez"""
+        path = self.path_for(key, fmt)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(self._pool, _render, fields, fmt)
+
+        def write():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+            temporary.write_bytes(content)
+            os.replace(temporary, path)
+
+        await asyncio.to_thread(write)
+        return path
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
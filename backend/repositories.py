@@ -0,0 +1,2505 @@
+"""
+Veri erişim katmanı (repository)
+
+Her aggregate (kullanıcılar, binalar, aidatlar, duyurular, talepler, hukuki
+süreçler) için bir repository tanımlanır. Her birinin iki uygulaması vardır:
+
+- Motor*: MongoDB üzerinde çalışan asıl uygulama
+- InMemory*: dict ve sıralı indekslerle tamamen bellekte çalışan uygulama
+  (hermetik testler, benchmark'lar ve küçük/sıcak koleksiyonlar için)
+
+Tüm repository'ler `_id` alanı string olan düz dict'ler döndürür; handler'ların
+ObjectId dönüşümü yapmasına gerek yoktur.
+"""
+import asyncio
+import bisect
+import copy
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure
+
+import pagination
+import text_search
+from singleflight import SingleFlight
+
+
+# ========== YARDIMCILAR ==========
+
+def to_object_id(value: Any) -> Optional[ObjectId]:
+    """Geçerli ise ObjectId'ye çevir, değilse None döndür"""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+# Yalnızca sunucu tarafında kullanılan, API yanıtlarına girmeyen alanlar
+HIDDEN_FIELDS = ("search_index", "payment_claim", "transition_id")
+
+
+def serialize(doc: Optional[dict]) -> Optional[dict]:
+    """Üst seviyedeki ObjectId alanlarını stringe çevir, gizli alanları at"""
+    if doc is None:
+        return None
+    for field in HIDDEN_FIELDS:
+        doc.pop(field, None)
+    for key, value in doc.items():
+        if isinstance(value, ObjectId):
+            doc[key] = str(value)
+    return doc
+
+
+def apply_fields(doc: dict, fields: dict) -> dict:
+    """$set karşılığı: "wifi.status" gibi noktalı alanları destekler"""
+    for key, value in fields.items():
+        target = doc
+        *parents, leaf = key.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = copy.deepcopy(value)
+    return doc
+
+
+class _Lowest:
+    """Sıralamada None değerlerini en küçük kabul etmek için"""
+
+    def __lt__(self, other):
+        return not isinstance(other, _Lowest)
+
+    def __gt__(self, other):
+        return False
+
+    def __eq__(self, other):
+        return isinstance(other, _Lowest)
+
+
+_LOWEST = _Lowest()
+
+
+def _sort_value(value: Any) -> Any:
+    return _LOWEST if value is None else value
+
+
+class SortedIndex:
+    """
+    Gruplanmış sıralı indeks: grup alanı -> (sıralama değeri, _id) listesi.
+    Mongo'daki {group_field: 1, sort_field: 1} bileşik indeksinin karşılığı.
+    """
+
+    def __init__(self, group_field: str, sort_field: str):
+        self.group_field = group_field
+        self.sort_field = sort_field
+        self.entries: Dict[Any, List[Tuple[Any, str]]] = defaultdict(list)
+
+    def _entry(self, doc: dict) -> Tuple[Any, str]:
+        return (_sort_value(doc.get(self.sort_field)), doc["_id"])
+
+    def add(self, doc: dict) -> None:
+        bisect.insort(self.entries[doc.get(self.group_field)], self._entry(doc))
+
+    def remove(self, doc: dict) -> None:
+        bucket = self.entries.get(doc.get(self.group_field))
+        if not bucket:
+            return
+        entry = self._entry(doc)
+        position = bisect.bisect_left(bucket, entry)
+        if position < len(bucket) and bucket[position] == entry:
+            bucket.pop(position)
+
+    def ids(self, group: Any, descending: bool = False) -> List[str]:
+        bucket = self.entries.get(group, [])
+        ordered = reversed(bucket) if descending else bucket
+        return [doc_id for _, doc_id in ordered]
+
+
+class InMemoryCollection:
+    """
+    Bellek içi koleksiyon: _id -> belge sözlüğü, eşitlik indeksleri ve
+    gruplanmış sıralı indeksler. Dışarıya her zaman kopya verir.
+    """
+
+    def __init__(self, unique: Iterable[str] = (), sorted_indexes: Iterable[Tuple[str, str]] = ()):
+        self.docs: Dict[str, dict] = {}
+        self.unique: Dict[str, Dict[Any, str]] = {field: {} for field in unique}
+        self.sorted: Dict[Tuple[str, str], SortedIndex] = {
+            (group, sort): SortedIndex(group, sort) for group, sort in sorted_indexes
+        }
+
+    @staticmethod
+    def _out(doc: Optional[dict]) -> Optional[dict]:
+        return serialize(copy.deepcopy(doc)) if doc else None
+
+    def _index(self, doc: dict) -> None:
+        for field, index in self.unique.items():
+            if doc.get(field) is not None:
+                index[doc[field]] = doc["_id"]
+        for index in self.sorted.values():
+            index.add(doc)
+
+    def _unindex(self, doc: dict) -> None:
+        for field, index in self.unique.items():
+            if index.get(doc.get(field)) == doc["_id"]:
+                del index[doc[field]]
+        for index in self.sorted.values():
+            index.remove(doc)
+
+    def insert(self, doc: dict) -> dict:
+        stored = copy.deepcopy(doc)
+        stored["_id"] = str(stored.get("_id") or ObjectId())
+        for field, index in self.unique.items():
+            if stored.get(field) is not None and stored[field] in index:
+                raise ValueError(f"Duplicate key: {field}={stored[field]!r}")
+        self.docs[stored["_id"]] = stored
+        self._index(stored)
+        return self._out(stored)
+
+    def get(self, doc_id: Any) -> Optional[dict]:
+        return self._out(self.docs.get(str(doc_id)))
+
+    def get_by(self, field: str, value: Any) -> Optional[dict]:
+        return self.get(self.unique[field].get(value))
+
+    def first(self) -> Optional[dict]:
+        return self._out(next(iter(self.docs.values()), None))
+
+    def find(self, group_field: str, group: Any, sort_field: str, descending: bool = False,
+             limit: Optional[int] = None, where=None) -> List[dict]:
+        results = []
+        for doc_id in self.sorted[(group_field, sort_field)].ids(group, descending):
+            doc = self.docs[doc_id]
+            if where is None or where(doc):
+                results.append(self._out(doc))
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def all(self, limit: Optional[int] = None) -> List[dict]:
+        docs = list(self.docs.values())[:limit]
+        return [self._out(doc) for doc in docs]
+
+    def update(self, doc_id: Any, fields: dict, where=None) -> Optional[dict]:
+        doc = self.docs.get(str(doc_id))
+        if doc is None or (where is not None and not where(doc)):
+            return None
+        self._unindex(doc)
+        apply_fields(doc, fields)
+        self._index(doc)
+        return self._out(doc)
+
+    def delete(self, doc_id: Any) -> Optional[dict]:
+        doc = self.docs.pop(str(doc_id), None)
+        if doc is None:
+            return None
+        self._unindex(doc)
+        return self._out(doc)
+
+    def search(self, kind: str, query_terms: List[str], filters: dict, sort: str,
+               cursor: Optional[dict], limit: int) -> List[dict]:
+        """Bellek içi metin araması; Motor tarafındaki `_text_search` ile aynı sıralama"""
+        results = []
+        for doc in self.docs.values():
+            if not _matches_search_filters(doc, filters):
+                continue
+            doc_score = text_search.score(doc.get("search_index"), query_terms)
+            if doc_score <= 0:
+                continue
+            key = doc_score if sort == "relevance" else doc.get("created_at")
+            if pagination.is_after_cursor(kind, key, doc["_id"], cursor):
+                results.append((key, doc["_id"], doc_score, doc))
+        results.sort(key=lambda r: (r[0], r[1]), reverse=True)
+        return [{**self._out(doc), "score": doc_score} for _, _, doc_score, doc in results[:limit]]
+
+
+def _matches_search_filters(doc: dict, filters: dict) -> bool:
+    for field in ("building_id", "user_id", "category", "status"):
+        if filters.get(field) is not None and doc.get(field) != filters[field]:
+            return False
+    created_at = doc.get("created_at")
+    if filters.get("date_from") and (created_at is None or created_at < filters["date_from"]):
+        return False
+    if filters.get("date_to") and (created_at is None or created_at >= filters["date_to"]):
+        return False
+    return True
+
+
+# Okunma süresi dağılımı: (dilim adı, üst sınır); son dilim sınırsız
+READ_TIME_BUCKETS: List[Tuple[str, Optional[timedelta]]] = [
+    ("lt_1h", timedelta(hours=1)),
+    ("1h_6h", timedelta(hours=6)),
+    ("6h_24h", timedelta(days=1)),
+    ("1d_3d", timedelta(days=3)),
+    ("3d_7d", timedelta(days=7)),
+    ("gte_7d", None),
+]
+
+
+def read_time_bucket(created_at: Optional[datetime], read_at: datetime) -> str:
+    """Duyurunun yayınından okunmasına kadar geçen sürenin dilimi"""
+    elapsed = read_at - created_at if created_at else timedelta(0)
+    for name, upper in READ_TIME_BUCKETS:
+        if upper is None or elapsed < upper:
+            return name
+    return READ_TIME_BUCKETS[-1][0]
+
+
+def empty_read_stats() -> dict:
+    return {"read_count": 0, "last_read_at": None, "time_to_read": {name: 0 for name, _ in READ_TIME_BUCKETS}}
+
+
+# Toplu aktarım kullanıcıların bu rollerini değiştirmez
+ADMIN_ROLES = ("building_admin", "super_admin")
+
+
+def _apartment_set(apartment: dict, now: datetime) -> dict:
+    fields = {"updated_at": now}
+    if apartment.get("floor") is not None:
+        fields["floor"] = apartment["floor"]
+    return fields
+
+
+# Durumu izlenen bina özellikleri; "active" dışındaki her durum kesinti sayılır
+STATUS_FEATURES = ("wifi", "elevator", "electricity", "water", "cleaning")
+
+
+def history_day(at: datetime) -> datetime:
+    """Durum geçmişi kovası: bina başına günde bir belge"""
+    return datetime(at.year, at.month, at.day)
+
+
+def status_uptime(buckets: List[dict], start: datetime, end: datetime) -> Dict[str, dict]:
+    """
+    Gün kovalarından özellik başına izlenen/kesinti süresi ve kesinti sayısı
+    (Motor ve bellek içi uygulamaların ortak hesabı).
+    Her kovanın açılış durumu günün başında gerçekleşmiş olay gibi eklenir.
+    """
+    timelines: Dict[str, List[Tuple[datetime, str]]] = defaultdict(list)
+    for bucket in buckets:
+        for feature, status in (bucket.get("opening") or {}).items():
+            timelines[feature].append((bucket["day"], status))
+        for event in bucket.get("events", []):
+            timelines[event["feature"]].append((event["at"], event["status"]))
+
+    results = {}
+    for feature, timeline in timelines.items():
+        timeline = sorted((e for e in timeline if e[0] < end), key=lambda e: e[0])
+        totals = {"observed_ms": 0, "down_ms": 0, "outages": 0}
+        previous = None
+        for position, (at, status) in enumerate(timeline):
+            next_at = timeline[position + 1][0] if position + 1 < len(timeline) else end
+            segment_end = min(next_at, end)
+            duration = max(0, int((segment_end - max(at, start)) / timedelta(milliseconds=1)))
+            down = status != "active"
+            totals["observed_ms"] += duration
+            if down:
+                totals["down_ms"] += duration
+                # Aralık başında süren kesinti de sayılır
+                if segment_end > start and (previous in ("active", None) or at <= start):
+                    totals["outages"] += 1
+            previous = status
+        results[feature] = totals
+    return results
+
+
+class DuplicateIndexKeys(Exception):
+    """Benzersiz indeks, koleksiyondaki mükerrer değerler yüzünden oluşturulamadı"""
+
+
+# ========== ARAYÜZLER ==========
+
+class Repository(ABC):
+    async def ensure_indexes(self) -> None:
+        """Gerekli indeksleri oluştur (bellek içi uygulamalarda gerek yok)"""
+
+    async def warm_up(self) -> None:
+        """Sık okunan kayıtları önbelleğe al (önbelleği olmayan uygulamalarda gerek yok)"""
+
+
+class UserRepository(Repository):
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def find_by_phone(self, phone_number: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create(self, user: dict) -> dict: ...
+
+    @abstractmethod
+    async def list_ids_for_building(self, building_id: str, after_id: Optional[str] = None,
+                                    limit: int = 500) -> List[str]:
+        """Binadaki kullanıcı id'leri, _id sırasıyla (keyset)"""
+
+    @abstractmethod
+    async def count_for_building(self, building_id: str) -> int: ...
+
+    @abstractmethod
+    async def upsert_many(self, users: List[dict]) -> Dict[str, int]:
+        """
+        Kullanıcıları telefon numarasına göre toplu ekle/güncelle; yönetici
+        rolleri korunur. {"inserted": n, "updated": n} döndürür.
+        """
+
+
+class BuildingRepository(Repository):
+    """Binalar, daireleri ve bina özellik durumları"""
+
+    @abstractmethod
+    async def list(self, limit: int = 100) -> List[dict]: ...
+
+    @abstractmethod
+    async def get(self, building_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def first(self) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create(self, building: dict) -> dict: ...
+
+    @abstractmethod
+    async def get_apartment(self, apartment_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create_apartment(self, apartment: dict) -> dict: ...
+
+    @abstractmethod
+    async def delete_apartment(self, apartment_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def upsert_apartments(self, building_id: str,
+                                apartments: List[dict]) -> Tuple[Dict[Tuple[str, int], str], Dict[str, int]]:
+        """
+        Daireleri (block, apartment_number) anahtarıyla toplu ekle/güncelle.
+        Binadaki tüm dairelerin (block, apartment_number) -> _id eşlemesini ve
+        {"inserted": n, "updated": n} sayılarını döndürür.
+        """
+
+    @abstractmethod
+    async def get_status(self, building_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def list_statuses(self, building_ids: List[str]) -> List[dict]: ...
+
+    @abstractmethod
+    async def get_or_create_status(self, building_id: str, defaults: dict) -> dict:
+        """Durumu getir; yoksa `defaults` ile oluştur (eşzamanlı çağrılarda tek kayıt)"""
+
+    @abstractmethod
+    async def update_status(self, building_id: str, fields: dict) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def change_status(self, building_id: str, fields: dict) -> Optional[Tuple[dict, dict]]:
+        """Durumu güncelle; (önceki, güncel) belgeleri döndür, kayıt yoksa None"""
+
+    @abstractmethod
+    async def append_status_history(self, building_id: str, at: datetime, changes: Dict[str, str],
+                                    opening: Dict[str, str]) -> None:
+        """
+        Durum geçişlerini binanın o günkü geçmiş kovasına ekle. Kova yeni
+        oluşuyorsa `opening` (geçişlerden önceki durum) günün açılış durumu olur.
+        """
+
+    @abstractmethod
+    async def status_uptime(self, building_id: str, start: datetime, end: datetime) -> Dict[str, dict]:
+        """Özellik başına izlenen süre, kesinti süresi (ms) ve kesinti sayısı"""
+
+
+class DueRepository(Repository):
+    @abstractmethod
+    async def list_for_apartment(self, apartment_id: str, limit: int = 100) -> List[dict]:
+        """Daire aidatları, en yeni vade tarihi önce"""
+
+    @abstractmethod
+    async def list_unpaid(self, apartment_id: str, limit: int = 100) -> List[dict]:
+        """Ödenmemiş aidatlar, en eski vade tarihi önce"""
+
+    @abstractmethod
+    async def get(self, due_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create_many(self, dues: List[dict]) -> List[dict]: ...
+
+    @abstractmethod
+    async def archive_paid(self, before: datetime, batch_size: int = 500) -> int:
+        """Vadesi `before` öncesi olan ödenmiş aidatları arşive taşı; taşınan sayısı"""
+
+    @abstractmethod
+    async def has_archived(self, apartment_id: str) -> bool:
+        """Dairenin arşivlenmiş aidatı var mı (boş liste yeni hesap anlamına gelmez)"""
+
+    @abstractmethod
+    async def claim_for_payment(self, apartment_id: str, due_ids: List[str], payment_key: str,
+                                until: datetime, now: datetime) -> bool:
+        """
+        Aidatları çekimden önce ödeme anahtarına ayır (hepsi ya da hiçbiri): her biri
+        dairenin ödenmemiş aidatı olmalı ve başka bir anahtara ayrılmamış ya da
+        ayırmanın süresi dolmuş olmalı. Aynı anahtarla tekrar ayırma süreyi yeniler.
+        """
+
+    @abstractmethod
+    async def release_payment_claim(self, due_ids: List[str], payment_key: str) -> None:
+        """Bu anahtarın ayırmalarını bırak (başka anahtarın ayırmasına dokunmaz)"""
+
+    @abstractmethod
+    async def mark_many_paid(self, apartment_id: str, due_ids: List[str], fields: dict, payment_key: str) -> bool:
+        """
+        Bu ödeme anahtarına ayrılmış aidatları hep birlikte ödendi yap ve ayırmayı
+        kaldır: biri bile ödenmiş, başka daireye ait ya da ayırması kaybedilmişse
+        hiçbiri değişmez ve False döner. `fields` ödemenin `transaction_id` alanını içermelidir.
+        """
+
+    @abstractmethod
+    async def list_changed(self, apartment_id: str, since: Optional[datetime], limit: int = 500,
+                           after_id: Optional[str] = None) -> List[dict]:
+        """
+        `since` sonrasında değişen aidatlar, (updated_at, _id) artan. after_id verilirse
+        keyset devamı: (updated_at, _id) > (since, after_id)
+        """
+
+    @abstractmethod
+    async def get_debt_map(self, building_id: str) -> Optional[dict]:
+        """Binanın hazır (materialize) borç haritası; yoksa None"""
+
+    @abstractmethod
+    async def rebuild_debt_map(self, building_id: str) -> dict:
+        """Borç haritasını binanın tüm daireleri için yeniden hesapla ve kaydet"""
+
+    @abstractmethod
+    async def refresh_debt_map(self, apartment_id: str) -> None:
+        """Haritada yalnızca bu dairenin hücresini güncelle (harita yoksa bir şey yapmaz)"""
+
+    @abstractmethod
+    async def list_overdue_apartments(self, now: datetime, min_count: int = 2, after: Optional[str] = None,
+                                      limit: int = 500) -> List[dict]:
+        """
+        Vadesi geçmiş en az `min_count` ödenmemiş aidatı olan daireler, apartment_id
+        artan (`after` sonrası): {"apartment_id", "total_debt", "overdue_months"}
+        """
+
+
+class AnnouncementRepository(Repository):
+    @abstractmethod
+    async def list_for_building(self, building_id: str, category: Optional[str] = None,
+                                limit: int = 100) -> List[dict]: ...
+
+    @abstractmethod
+    async def get(self, announcement_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create(self, announcement: dict) -> dict: ...
+
+    @abstractmethod
+    async def create_many(self, announcements: List[dict]) -> List[dict]: ...
+
+    @abstractmethod
+    async def delete(self, announcement_id: str) -> Optional[dict]:
+        """Duyuruyu sil; silinen belgeyi ya da None döndür"""
+
+    @abstractmethod
+    async def list_changed(self, building_id: str, since: Optional[datetime], limit: int = 500,
+                           after_id: Optional[str] = None) -> List[dict]:
+        """
+        `since` sonrasında değişen duyurular, (updated_at, _id) artan. after_id verilirse
+        keyset devamı: (updated_at, _id) > (since, after_id)
+        """
+
+    @abstractmethod
+    async def claim_delivery(self, now: datetime, lease_until: datetime) -> Optional[dict]:
+        """Zamanı gelmiş bir bildirim (outbox) kaydını kirala; yoksa None"""
+
+    @abstractmethod
+    async def update_delivery(self, announcement_id: str, fields: dict) -> None: ...
+
+    @abstractmethod
+    async def mark_read(self, announcement_id: str, user_id: str, read_at: datetime) -> bool:
+        """Okundu kaydını oluştur/güncelle; ilk okuma ise True döndür"""
+
+    @abstractmethod
+    async def unread_count(self, user_id: str, building_id: str) -> int: ...
+
+    @abstractmethod
+    async def record_first_read(self, announcement_id: str, read_at: datetime) -> None:
+        """Duyurunun okunma sayaçlarını (`stats`) ilk okuma için artır"""
+
+    @abstractmethod
+    async def rebuild_stats(self, announcement_id: str) -> Optional[dict]:
+        """Sayaçları okundu kayıtlarından yeniden hesapla; duyuru yoksa None"""
+
+    @abstractmethod
+    async def list_stats_for_building(self, building_id: str, limit: int = 20) -> List[dict]:
+        """Binanın son duyuruları, yalnızca başlık/tarih ve `stats` alanlarıyla"""
+
+    @abstractmethod
+    async def archive_reads(self, before: datetime, batch_size: int = 500) -> int:
+        """
+        `before` öncesi yayınlanmış (süresi dolmuş) duyuruların okundu kayıtlarını
+        arşive taşı; duyuru `reads_archived_at` ile işaretlenir ve okunmamış
+        sayısına girmez. Silinmiş duyuruların eski kayıtları da taşınır.
+        """
+
+    @abstractmethod
+    async def search(self, query_terms: List[str], filters: dict, sort: str = "relevance",
+                     cursor: Optional[dict] = None, limit: int = 20) -> List[dict]:
+        """Metin araması; her sonuç `score` alanı taşır"""
+
+
+class RequestRepository(Repository):
+    @abstractmethod
+    async def list_for_user(self, user_id: str, limit: int = 100) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_for_building(self, building_id: str, filters: dict, cursor: Optional[dict] = None,
+                                limit: int = 50) -> List[dict]:
+        """Bina talep kuyruğu, en yeni önce (created_at, _id azalan); filters: status/priority/category"""
+
+    @abstractmethod
+    async def count_for_building(self, building_id: str, filters: dict) -> Dict[str, Dict[str, int]]:
+        """Bina taleplerinin durum ve önceliğe göre sayıları"""
+
+    @abstractmethod
+    async def get(self, request_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create(self, request: dict) -> dict: ...
+
+    @abstractmethod
+    async def create_many(self, requests: List[dict]) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_changed(self, user_id: str, since: Optional[datetime], limit: int = 500,
+                           after_id: Optional[str] = None) -> List[dict]:
+        """
+        `since` sonrasında değişen talepler, (updated_at, _id) artan. after_id verilirse
+        keyset devamı: (updated_at, _id) > (since, after_id)
+        """
+
+    @abstractmethod
+    async def update(self, request_id: str, fields: dict, allowed_statuses: Optional[List[str]] = None,
+                     building_id: Optional[str] = None) -> Optional[dict]:
+        """
+        Talebi güncelle ve güncel belgeyi döndür. allowed_statuses verilirse
+        yalnızca mevcut durum bunlardan biriyse uygulanır; building_id verilirse
+        başka binanın talebi bulunamamış sayılır. Uygulanmazsa None.
+        """
+
+    @abstractmethod
+    async def add_attachments(self, request_id: str, attachments: List[dict], updated_at: datetime) -> Optional[dict]:
+        """Talebe ek referansları ekle; talep yoksa None"""
+
+    @abstractmethod
+    async def archive_resolved(self, before: datetime, batch_size: int = 500) -> int:
+        """`before` öncesi çözülmüş talepleri arşive taşı; taşınan sayısı"""
+
+    @abstractmethod
+    async def has_archived(self, user_id: str) -> bool:
+        """Kullanıcının arşivlenmiş talebi var mı (boş liste yeni hesap anlamına gelmez)"""
+
+    @abstractmethod
+    async def transition_many(self, changes: List[Tuple[str, List[str], dict]],
+                              building_id: Optional[str] = None) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """
+        Çoklu durum geçişi: (request_id, izin verilen mevcut durumlar, alanlar).
+        Her id için (güncellendi mi, mevcut durum; kayıt yoksa None) döndürür.
+        building_id verilirse başka binanın talepleri kayıt yok sayılır.
+        """
+
+    @abstractmethod
+    async def search(self, query_terms: List[str], filters: dict, sort: str = "relevance",
+                     cursor: Optional[dict] = None, limit: int = 20) -> List[dict]:
+        """Metin araması; her sonuç `score` alanı taşır"""
+
+
+class LegalProcessRepository(Repository):
+    @abstractmethod
+    async def get_for_apartment(self, apartment_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create(self, legal_process: dict) -> dict: ...
+
+    @abstractmethod
+    async def create_many(self, legal_processes: List[dict]) -> List[dict]: ...
+
+    @abstractmethod
+    async def apartment_ids_with_process(self, apartment_ids: List[str]) -> Set[str]:
+        """Verilen dairelerden hukuki süreci olanlar"""
+
+
+class TombstoneRepository(Repository):
+    """Silinen kayıtların izleri: istemciler delta senkronizasyonda silmeleri buradan öğrenir"""
+
+    @abstractmethod
+    async def record(self, kind: str, doc_id: str, scope: str, deleted_at: datetime) -> None:
+        """scope: kaydı görebilen küme, örn. building:<id>, apartment:<id>, user:<id>"""
+
+    @abstractmethod
+    async def list_since(self, scopes: List[str], since: datetime, limit: int = 500,
+                         after_id: Optional[str] = None) -> List[dict]:
+        """`since` sonrası silme izleri, (deleted_at, _id) artan; after_id ile keyset devamı"""
+
+
+# Silme izleri bu süreden sonra silinir; daha eski token'la gelen istemci tam senkronizasyon yapar
+TOMBSTONE_RETENTION = timedelta(days=90)
+
+
+class PortfolioRepository(Repository):
+    """
+    Tüm binaların özet göstergeleri (super_admin portföy görünümü). Göstergeler
+    birkaç `$facet` aggregation ile hesaplanıp bina başına bir belge olarak
+    saklanır; liste bu hazır belgeler üzerinden sıralanır ve sayfalanır.
+    """
+
+    @abstractmethod
+    async def refresh(self, now: datetime) -> int:
+        """Tüm binaların göstergelerini yeniden hesapla; bina sayısını döndür"""
+
+    @abstractmethod
+    async def list(self, sort: str, descending: bool, cursor: Optional[dict] = None, limit: int = 50) -> List[dict]:
+        """Hazır göstergeler; `sort` PORTFOLIO_SORT_FIELDS anahtarlarından biri, eşitlikte _id ile"""
+
+    @abstractmethod
+    async def count(self) -> int: ...
+
+
+# Sakin sayılan roller
+RESIDENT_ROLES = ("tenant", "owner")
+# Bu durumlardaki hukuki süreçler kapanmış sayılır
+LEGAL_CLOSED_STATUSES = ("closed", "settled")
+# Tahsilat oranı son bir yılda vadesi gelen aidatlar üzerinden hesaplanır
+COLLECTION_WINDOW = timedelta(days=365)
+REQUEST_PRIORITIES = ("urgent", "high", "normal", "low")
+
+# Sıralama adı -> portföy belgesindeki alan
+PORTFOLIO_SORT_FIELDS = {
+    "name": "name",
+    "resident_count": "resident_count",
+    "collection_rate": "collection_rate",
+    "outstanding_debt": "outstanding_debt",
+    "open_requests": "open_requests.total",
+    "legal_processes": "legal_processes",
+    "outages": "outage_count",
+}
+
+
+def portfolio_rows(buildings: List[dict], activity: dict, finance: dict, now: datetime) -> List[dict]:
+    """
+    Aggregation çıktılarını (`$facet` dalları: bina id'sine göre gruplar)
+    bina başına portföy belgelerine dönüştür
+    """
+    residents = {g["_id"]: g["count"] for g in activity.get("residents", [])}
+    legal = {g["_id"]: g["count"] for g in activity.get("legal", [])}
+    outages = {g["_id"]: g["features"] for g in activity.get("outages", [])}
+    requests: Dict[str, Dict[str, int]] = defaultdict(lambda: {"total": 0, **{p: 0 for p in REQUEST_PRIORITIES}})
+    for group in activity.get("requests", []):
+        priority = group["_id"].get("priority") or "normal"
+        counts = requests[group["_id"]["building_id"]]
+        counts[priority] = counts.get(priority, 0) + group["count"]
+        counts["total"] += group["count"]
+    collection = {g["_id"]: g for g in finance.get("collection", [])}
+    outstanding = {g["_id"]: g for g in finance.get("outstanding", [])}
+
+    rows = []
+    for building in buildings:
+        building_id = str(building["_id"])
+        billed = collection.get(building_id, {}).get("billed", 0)
+        collected = collection.get(building_id, {}).get("collected", 0)
+        features = outages.get(building_id, [])
+        rows.append({
+            "_id": building_id,
+            "name": building.get("name"),
+            "resident_count": residents.get(building_id, 0),
+            # Vadesi gelen aidat yoksa kaçırılan tahsilat da yok
+            "collection_rate": round(collected / billed, 4) if billed else 1.0,
+            "billed": billed,
+            "collected": collected,
+            "outstanding_debt": outstanding.get(building_id, {}).get("amount", 0),
+            "outstanding_dues": outstanding.get(building_id, {}).get("dues", 0),
+            "open_requests": dict(requests[building_id]),
+            "legal_processes": legal.get(building_id, 0),
+            "outages": features,
+            "outage_count": len(features),
+            "refreshed_at": now,
+        })
+    return rows
+
+
+def with_updated_at(doc: dict) -> dict:
+    """Delta senkronizasyon için: updated_at yoksa oluşturulma zamanıyla doldur"""
+    doc.setdefault("updated_at", doc.get("created_at") or datetime.utcnow())
+    return doc
+
+
+# ========== MOTOR (MONGODB) UYGULAMALARI ==========
+
+async def _insert(collection, doc: dict) -> dict:
+    result = await collection.insert_one(doc)
+    doc["_id"] = str(result.inserted_id)
+    return doc
+
+
+async def _insert_many(collection, docs: List[dict]) -> List[dict]:
+    if not docs:
+        return docs
+    result = await collection.insert_many(docs)
+    for doc, inserted_id in zip(docs, result.inserted_ids):
+        doc["_id"] = str(inserted_id)
+    return docs
+
+
+def with_search_index(doc: dict, body_field: str) -> dict:
+    """Belgeye arama alanını ekle (kayıttan önce)"""
+    doc["search_index"] = text_search.build_search_index(doc.get("title"), doc.get(body_field))
+    return doc
+
+
+# Arama indeksi: başlık eşleşmeleri gövdeden daha yüksek skor alır
+SEARCH_TEXT_INDEX = IndexModel(
+    [("search_index.title", TEXT), ("search_index.body", TEXT)],
+    weights={"search_index.title": text_search.TITLE_WEIGHT, "search_index.body": text_search.BODY_WEIGHT},
+    default_language="none",
+    name="search_text",
+)
+
+
+async def _text_search(collection, kind: str, query_terms: List[str], filters: dict, sort: str,
+                       cursor: Optional[dict], limit: int) -> List[dict]:
+    match: Dict[str, Any] = {"$text": {"$search": " ".join(query_terms)}}
+    for field in ("building_id", "user_id", "category", "status"):
+        if filters.get(field) is not None:
+            match[field] = filters[field]
+    created_range = {}
+    if filters.get("date_from"):
+        created_range["$gte"] = filters["date_from"]
+    if filters.get("date_to"):
+        created_range["$lt"] = filters["date_to"]
+    if created_range:
+        match["created_at"] = created_range
+
+    key = "score" if sort == "relevance" else "created_at"
+    pipeline = [{"$match": match}, {"$addFields": {"score": {"$meta": "textScore"}}}]
+    if cursor is not None:
+        pipeline.append({"$match": pagination.cursor_match(
+            kind, key, cursor, {"$lt": to_object_id(cursor["id"])}
+        )})
+    pipeline += [
+        {"$sort": {key: -1, "_id": -1}},
+        {"$limit": limit},
+        {"$project": {"search_index": 0}},
+    ]
+    return [serialize(doc) async for doc in collection.aggregate(pipeline)]
+
+
+def _read_time_bucket_expr(elapsed: Any) -> dict:
+    """`read_time_bucket` karşılığı aggregation ifadesi (elapsed milisaniye)"""
+    return {"$switch": {
+        "branches": [
+            {"case": {"$lt": [elapsed, upper / timedelta(milliseconds=1)]}, "then": name}
+            for name, upper in READ_TIME_BUCKETS if upper is not None
+        ],
+        "default": READ_TIME_BUCKETS[-1][0],
+    }}
+
+
+def _after_position(field: str, since: datetime, after_id: Optional[str]) -> dict:
+    """(field, _id) > (since, after_id) keyset koşulu; after_id yoksa field > since"""
+    object_id = to_object_id(after_id) if after_id else None
+    if object_id is None:
+        return {field: {"$gt": since}}
+    return {"$or": [{field: {"$gt": since}}, {field: since, "_id": {"$gt": object_id}}]}
+
+
+async def _changed_since(collection, field: str, value: Any, since: Optional[datetime], limit: int,
+                         after_id: Optional[str] = None) -> List[dict]:
+    query: Dict[str, Any] = {field: value}
+    if since is not None:
+        query.update(_after_position("updated_at", since, after_id))
+    cursor = collection.find(query, {"search_index": 0}).sort([("updated_at", ASCENDING), ("_id", ASCENDING)])
+    return [serialize(doc) for doc in await cursor.to_list(limit)]
+
+
+async def _find_by_id(collection, doc_id: str) -> Optional[dict]:
+    object_id = to_object_id(doc_id)
+    if object_id is None:
+        return None
+    return serialize(await collection.find_one({"_id": object_id}))
+
+
+async def _update_by_id(collection, doc_id: str, fields: dict, extra_filter: Optional[dict] = None) -> Optional[dict]:
+    object_id = to_object_id(doc_id)
+    if object_id is None:
+        return None
+    query = {"_id": object_id, **(extra_filter or {})}
+    return serialize(await collection.find_one_and_update(
+        query, {"$set": fields}, return_document=ReturnDocument.AFTER
+    ))
+
+
+# Arşiv koleksiyonları nadiren okunur: daha yüksek sıkıştırmalı blok sıkıştırıcı
+ARCHIVE_STORAGE = {"wiredTiger": {"configString": "block_compressor=zstd"}}
+
+
+async def _ensure_archive(database, name: str) -> None:
+    """Arşiv koleksiyonunu sıkıştırmalı olarak oluştur (zaten varsa dokunma)"""
+    try:
+        await database.create_collection(name, storageEngine=ARCHIVE_STORAGE)
+    except CollectionInvalid:
+        pass
+
+
+async def _move_to_archive(source, archive, query: dict, batch_size: int) -> int:
+    """
+    Koşulu sağlayan belgeleri _id sırasıyla partiler halinde arşive kopyala ve
+    sıcak koleksiyondan sil. Kopyalama idempotenttir; yarıda kalan bir
+    çalıştırma tekrarlandığında kayıp ya da kopya oluşmaz.
+    """
+    moved, last_id, now = 0, None, datetime.utcnow()
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        docs = await source.find(batch_query).sort("_id", 1).to_list(batch_size)
+        if not docs:
+            return moved
+        await archive.bulk_write(
+            [ReplaceOne({"_id": doc["_id"]}, {**doc, "archived_at": now}, upsert=True) for doc in docs],
+            ordered=False
+        )
+        # Bu arada değişip koşulu artık sağlamayan belgeler sıcak koleksiyonda kalır
+        result = await source.delete_many({**query, "_id": {"$in": [doc["_id"] for doc in docs]}})
+        moved += result.deleted_count
+        last_id = docs[-1]["_id"]
+
+
+class MotorUserRepository(UserRepository):
+    def __init__(self, database):
+        self.collection = database.users
+
+    async def get(self, user_id):
+        return await _find_by_id(self.collection, user_id)
+
+    async def find_by_phone(self, phone_number):
+        return serialize(await self.collection.find_one({"phone_number": phone_number}))
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("building_id", ASCENDING), ("_id", ASCENDING)], name="building_users"),
+        ])
+        try:
+            await self.collection.create_indexes([
+                IndexModel([("phone_number", ASCENDING)], unique=True, name="phone_number"),
+            ])
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            # Giriş telefon numarasının tekilliğine dayanır: sessizce geçilmez, mükerrerler raporlanır
+            duplicates = await self.collection.aggregate([
+                {"$group": {"_id": "$phone_number", "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}},
+                {"$limit": 20},
+            ]).to_list(20)
+            raise DuplicateIndexKeys(
+                "users.phone_number benzersiz indeksi oluşturulamadı, mükerrer numaralar: "
+                + ", ".join(f"{d['_id']} ({d['count']})" for d in duplicates)
+                + ". Birleştirmek için: python manage.py dedupe-users (önce --dry-run ile bakın)"
+            ) from e
+
+    async def create(self, user):
+        return await _insert(self.collection, user)
+
+    async def list_ids_for_building(self, building_id, after_id=None, limit=500):
+        query: Dict[str, Any] = {"building_id": building_id}
+        if after_id is not None:
+            query["_id"] = {"$gt": to_object_id(after_id)}
+        users = await self.collection.find(query, {"_id": 1}).sort("_id", 1).to_list(limit)
+        return [str(user["_id"]) for user in users]
+
+    async def count_for_building(self, building_id):
+        return await self.collection.count_documents({"building_id": building_id})
+
+    async def upsert_many(self, users):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne({"phone_number": user["phone_number"]}, [{"$set": {
+                **{key: {"$literal": value} for key, value in user.items() if key != "role"},
+                "role": {"$cond": [{"$in": ["$role", list(ADMIN_ROLES)]}, "$role", user["role"]]},
+                "created_at": {"$ifNull": ["$created_at", now]},
+                "updated_at": now,
+            }}], upsert=True)
+            for user in users
+        ]
+        result = await self.collection.bulk_write(operations, ordered=False)
+        return {"inserted": result.upserted_count, "updated": result.modified_count}
+
+
+class MotorBuildingRepository(BuildingRepository):
+    def __init__(self, database):
+        self.collection = database.buildings
+        self.apartments = database.apartments
+        self.status = database.building_status
+        self.history = database.building_status_history
+
+    async def ensure_indexes(self):
+        # Demo girişleri aynı daire numarasıyla kayıt açtığı için benzersiz değil
+        await self.apartments.create_indexes([
+            IndexModel([("building_id", ASCENDING), ("block", ASCENDING), ("apartment_number", ASCENDING)],
+                       name="building_block_number"),
+        ])
+        await self.history.create_indexes([
+            IndexModel([("building_id", ASCENDING), ("day", ASCENDING)], unique=True, name="building_day"),
+        ])
+        # Eski sürüm eşzamanlı ilk açılışlarda kopya kayıt üretebiliyordu: önce `manage.py dedupe-building-status`
+        await self.status.create_indexes([
+            IndexModel([("building_id", ASCENDING)], unique=True, name="building_id"),
+        ])
+
+    async def list(self, limit=100):
+        return [serialize(b) for b in await self.collection.find().to_list(limit)]
+
+    async def get(self, building_id):
+        return await _find_by_id(self.collection, building_id)
+
+    async def first(self):
+        return serialize(await self.collection.find_one())
+
+    async def create(self, building):
+        return await _insert(self.collection, building)
+
+    async def get_apartment(self, apartment_id):
+        return await _find_by_id(self.apartments, apartment_id)
+
+    async def create_apartment(self, apartment):
+        return await _insert(self.apartments, apartment)
+
+    async def delete_apartment(self, apartment_id):
+        object_id = to_object_id(apartment_id)
+        if object_id is None:
+            return None
+        return serialize(await self.apartments.find_one_and_delete({"_id": object_id}))
+
+    async def upsert_apartments(self, building_id, apartments):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"building_id": building_id, "block": a["block"], "apartment_number": a["apartment_number"]},
+                {"$set": _apartment_set(a, now), "$setOnInsert": {"created_at": now}},
+                upsert=True
+            )
+            for a in apartments
+        ]
+        result = await self.apartments.bulk_write(operations, ordered=False)
+        ids = {}
+        async for apartment in self.apartments.find({"building_id": building_id}, {"block": 1, "apartment_number": 1}):
+            ids.setdefault((apartment.get("block"), apartment.get("apartment_number")), str(apartment["_id"]))
+        return ids, {"inserted": result.upserted_count, "updated": result.modified_count}
+
+    async def get_status(self, building_id):
+        return serialize(await self.status.find_one({"building_id": building_id}))
+
+    async def list_statuses(self, building_ids):
+        cursor = self.status.find({"building_id": {"$in": building_ids}})
+        return [serialize(s) for s in await cursor.to_list(None)]
+
+    async def get_or_create_status(self, building_id, defaults):
+        query = {"building_id": building_id}
+        update = {"$setOnInsert": with_updated_at(dict(defaults, building_id=building_id))}
+        try:
+            status = await self.status.find_one_and_update(
+                query, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Aynı anda başka bir süreç ekledi; onun kaydını kullan
+            status = await self.status.find_one(query)
+        return serialize(status)
+
+    async def update_status(self, building_id, fields):
+        return serialize(await self.status.find_one_and_update(
+            {"building_id": building_id}, {"$set": fields}, return_document=ReturnDocument.AFTER
+        ))
+
+    async def change_status(self, building_id, fields):
+        previous = serialize(await self.status.find_one_and_update(
+            {"building_id": building_id}, {"$set": fields}, return_document=ReturnDocument.BEFORE
+        ))
+        if previous is None:
+            return None
+        return previous, apply_fields(copy.deepcopy(previous), fields)
+
+    async def append_status_history(self, building_id, at, changes, opening):
+        await self.history.update_one(
+            {"building_id": building_id, "day": history_day(at)},
+            {
+                "$push": {"events": {"$each": [
+                    {"feature": feature, "status": status, "at": at} for feature, status in changes.items()
+                ]}},
+                "$setOnInsert": {"opening": opening},
+            },
+            upsert=True
+        )
+
+    async def status_uptime(self, building_id, start, end):
+        # Aralık başındaki durum için başlangıçtan önceki son kova da dahil edilir
+        anchor = await self.history.find_one(
+            {"building_id": building_id, "day": {"$lte": start}}, {"day": 1}, sort=[("day", DESCENDING)]
+        )
+        first_day = anchor["day"] if anchor else history_day(start)
+        # Kovalar küçük (bina başına günde bir belge): hesap bellek içi uygulamayla aynı fonksiyonda
+        # yapılır, sunucu tarafı pencere fonksiyonları ($setWindowFields, MongoDB 5.0+) gerekmez
+        buckets = await self.history.find(
+            {"building_id": building_id, "day": {"$gte": first_day, "$lt": end}},
+            {"_id": 0, "day": 1, "opening": 1, "events": 1}
+        ).to_list(None)
+        return status_uptime(buckets, start, end)
+
+
+def _debt_cells_pipeline(match: dict) -> List[dict]:
+    """Daireleri ödenmemiş aidatlarıyla birleştirip borç hücrelerini üret"""
+    return [
+        {"$match": match},
+        {"$lookup": {
+            "from": "dues",
+            "let": {"apartment_id": {"$toString": "$_id"}},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$apartment_id", "$$apartment_id"]}, {"$eq": ["$paid", False]}
+                ]}}},
+                {"$project": {"_id": 0, "amount": 1, "due_date": 1}},
+            ],
+            "as": "unpaid",
+        }},
+        {"$project": {
+            "building_id": 1,
+            "block": 1,
+            "floor": 1,
+            "apartment_number": 1,
+            "outstanding": {"$sum": "$unpaid.amount"},
+            "unpaid_due_dates": "$unpaid.due_date",
+        }},
+    ]
+
+
+def _debt_cell(apartment: dict) -> dict:
+    return {
+        "block": apartment.get("block"),
+        "floor": apartment.get("floor"),
+        "apartment_number": apartment.get("apartment_number"),
+        "outstanding": apartment.get("outstanding", 0),
+        "unpaid_due_dates": sorted(d for d in apartment.get("unpaid_due_dates", []) if d is not None),
+    }
+
+
+class MotorDueRepository(DueRepository):
+    def __init__(self, database):
+        self.database = database
+        self.collection = database.dues
+        self.archive = database.dues_archive
+        self.apartments = database.apartments
+        self.debt_maps = database.debt_maps
+        self.client = database.client
+        # Tek sunucu (replica set olmayan) kurulumlarda işlem (transaction) desteklenmez; ilk denemede öğrenilir
+        self._transactions: Optional[bool] = None
+
+    async def list_for_apartment(self, apartment_id, limit=100):
+        cursor = self.collection.find({"apartment_id": apartment_id}).sort("due_date", -1)
+        return [serialize(d) for d in await cursor.to_list(limit)]
+
+    async def list_unpaid(self, apartment_id, limit=100):
+        cursor = self.collection.find({"apartment_id": apartment_id, "paid": False}).sort("due_date", 1)
+        return [serialize(d) for d in await cursor.to_list(limit)]
+
+    async def get(self, due_id):
+        # Arşivlenmiş aidatlar (eski makbuzlar) detayda görünmeye devam eder
+        return await _find_by_id(self.collection, due_id) or await _find_by_id(self.archive, due_id)
+
+    async def archive_paid(self, before, batch_size=500):
+        return await _move_to_archive(
+            self.collection, self.archive, {"paid": True, "due_date": {"$lt": before}}, batch_size
+        )
+
+    async def has_archived(self, apartment_id):
+        return await self.archive.find_one({"apartment_id": apartment_id}, {"_id": 1}) is not None
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("apartment_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+                       name="apartment_updated"),
+            IndexModel([("apartment_id", ASCENDING), ("paid", ASCENDING), ("due_date", ASCENDING)], name="apartment_unpaid"),
+            # Gecikmiş daire taraması (zamanlanmış hukuki süreç işi): yalnızca ödenmemiş aidatlar
+            IndexModel([("apartment_id", ASCENDING), ("due_date", ASCENDING)], name="unpaid_by_apartment",
+                       partialFilterExpression={"paid": False}),
+        ])
+        await self.debt_maps.create_indexes([
+            IndexModel([("building_id", ASCENDING)], unique=True, name="building_id"),
+        ])
+        await _ensure_archive(self.database, "dues_archive")
+        await self.archive.create_indexes([IndexModel([("apartment_id", ASCENDING)], name="apartment_id")])
+
+    async def create_many(self, dues):
+        return await _insert_many(self.collection, [with_updated_at(d) for d in dues])
+
+    async def claim_for_payment(self, apartment_id, due_ids, payment_key, until, now):
+        object_ids = [to_object_id(d) for d in due_ids]
+        if not object_ids or None in object_ids:
+            return False
+        result = await self.collection.update_many(
+            {"_id": {"$in": object_ids}, "apartment_id": apartment_id, "paid": False, "$or": [
+                {"payment_claim": None}, {"payment_claim.until": {"$lte": now}}, {"payment_claim.key": payment_key}
+            ]},
+            {"$set": {"payment_claim": {"key": payment_key, "until": until}}}
+        )
+        if result.matched_count == len(object_ids):
+            return True
+        # Biri ödenmiş ya da başka ödemeye ayrılmış: bu çağrının ayırdıklarını geri bırak
+        await self.release_payment_claim(due_ids, payment_key)
+        return False
+
+    async def release_payment_claim(self, due_ids, payment_key):
+        object_ids = [o for o in (to_object_id(d) for d in due_ids) if o is not None]
+        await self.collection.update_many(
+            {"_id": {"$in": object_ids}, "payment_claim.key": payment_key}, {"$unset": {"payment_claim": ""}}
+        )
+
+    async def mark_many_paid(self, apartment_id, due_ids, fields, payment_key):
+        object_ids = [to_object_id(d) for d in due_ids]
+        if not object_ids or None in object_ids:
+            return False
+        query = {"_id": {"$in": object_ids}, "apartment_id": apartment_id, "paid": False,
+                 "payment_claim.key": payment_key}
+        update = {"$set": {**fields, "paid": True}, "$unset": {"payment_claim": ""}}
+
+        if self._transactions is not False:
+            try:
+                async with await self.client.start_session() as session:
+                    async with session.start_transaction():
+                        result = await self.collection.update_many(query, update, session=session)
+                        if result.modified_count != len(object_ids):
+                            await session.abort_transaction()
+                            return False
+                self._transactions = True
+                return True
+            except OperationFailure as e:
+                # 20 = IllegalOperation: sunucu işlemleri desteklemiyor
+                if e.code != 20:
+                    raise
+                self._transactions = False
+
+        # İşlemsiz: koşullu toplu güncelleme, eksik kalırsa bu ödemenin yazdıklarını geri al
+        result = await self.collection.update_many(query, update)
+        if result.modified_count == len(object_ids):
+            return True
+        # Ayırma süresi dolmuş olarak geri yazılır: aynı anahtar yeniden ayırabilir, başka ödemeyi de bekletmez
+        now = datetime.utcnow()
+        await self.collection.update_many(
+            {"_id": {"$in": object_ids}, "transaction_id": fields["transaction_id"]},
+            {"$set": {"paid": False, "updated_at": now, "payment_claim": {"key": payment_key, "until": now}},
+             "$unset": {name: "" for name in fields if name != "updated_at"}}
+        )
+        return False
+
+    async def list_changed(self, apartment_id, since, limit=500, after_id=None):
+        return await _changed_since(self.collection, "apartment_id", apartment_id, since, limit, after_id)
+
+    async def get_debt_map(self, building_id):
+        return serialize(await self.debt_maps.find_one({"building_id": building_id}))
+
+    async def rebuild_debt_map(self, building_id):
+        cells = {
+            str(apartment["_id"]): _debt_cell(apartment)
+            async for apartment in self.apartments.aggregate(_debt_cells_pipeline({"building_id": building_id}))
+        }
+        return serialize(await self.debt_maps.find_one_and_update(
+            {"building_id": building_id},
+            {"$set": {"apartments": cells, "refreshed_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        ))
+
+    async def refresh_debt_map(self, apartment_id):
+        object_id = to_object_id(apartment_id)
+        if object_id is None:
+            return
+        async for apartment in self.apartments.aggregate(_debt_cells_pipeline({"_id": object_id})):
+            await self.debt_maps.update_one(
+                {"building_id": apartment.get("building_id")},
+                {"$set": {f"apartments.{apartment_id}": _debt_cell(apartment), "refreshed_at": datetime.utcnow()}}
+            )
+
+    async def list_overdue_apartments(self, now, min_count=2, after=None, limit=500):
+        match = {"paid": False, "due_date": {"$lt": now}}
+        if after is not None:
+            match["apartment_id"] = {"$gt": after}
+        cursor = self.collection.aggregate([
+            {"$match": match},
+            {"$sort": {"apartment_id": 1}},
+            {"$group": {"_id": "$apartment_id", "total_debt": {"$sum": "$amount"}, "overdue_months": {"$sum": 1}}},
+            {"$match": {"overdue_months": {"$gte": min_count}}},
+            {"$sort": {"_id": 1}},
+            {"$limit": limit},
+        ])
+        return [
+            {"apartment_id": row["_id"], "total_debt": row["total_debt"], "overdue_months": row["overdue_months"]}
+            for row in await cursor.to_list(limit)
+        ]
+
+
+class MotorAnnouncementRepository(AnnouncementRepository):
+    def __init__(self, database):
+        self.database = database
+        self.collection = database.announcements
+        self.reads = database.announcement_reads
+        self.reads_archive = database.announcement_reads_archive
+
+    async def list_for_building(self, building_id, category=None, limit=100):
+        query = {"building_id": building_id}
+        if category:
+            query["category"] = category
+        cursor = self.collection.find(query).sort("created_at", -1)
+        return [serialize(a) for a in await cursor.to_list(limit)]
+
+    async def get(self, announcement_id):
+        return await _find_by_id(self.collection, announcement_id)
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            SEARCH_TEXT_INDEX,
+            IndexModel([("building_id", ASCENDING), ("created_at", DESCENDING)], name="building_created"),
+            IndexModel([("building_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+                       name="building_updated"),
+            # Yalnızca bekleyen bildirimleri içeren küçük indeks
+            IndexModel(
+                [("delivery.next_attempt_at", ASCENDING)],
+                partialFilterExpression={"delivery.pending": True},
+                name="delivery_pending"
+            ),
+        ])
+        # Okundu kayıtları: upsert, okunmamış sayısı ve istatistik yeniden hesaplama
+        await self.reads.create_indexes([
+            IndexModel([("announcement_id", ASCENDING), ("user_id", ASCENDING)], unique=True, name="announcement_user"),
+        ])
+        await _ensure_archive(self.database, "announcement_reads_archive")
+
+    async def create(self, announcement):
+        await _insert(self.collection, with_search_index(with_updated_at(announcement), "content"))
+        announcement.pop("search_index", None)
+        return announcement
+
+    async def delete(self, announcement_id):
+        object_id = to_object_id(announcement_id)
+        if object_id is None:
+            return None
+        return serialize(await self.collection.find_one_and_delete({"_id": object_id}, {"search_index": 0}))
+
+    async def list_changed(self, building_id, since, limit=500, after_id=None):
+        return await _changed_since(self.collection, "building_id", building_id, since, limit, after_id)
+
+    async def claim_delivery(self, now, lease_until):
+        return serialize(await self.collection.find_one_and_update(
+            {"delivery.pending": True, "delivery.next_attempt_at": {"$lte": now}},
+            {
+                "$set": {"delivery.status": "processing", "delivery.next_attempt_at": lease_until},
+                "$inc": {"delivery.attempts": 1}
+            },
+            sort=[("delivery.next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        ))
+
+    async def update_delivery(self, announcement_id, fields):
+        await self.collection.update_one(
+            {"_id": to_object_id(announcement_id)},
+            {"$set": {f"delivery.{key}": value for key, value in fields.items()}}
+        )
+
+    async def create_many(self, announcements):
+        await _insert_many(self.collection, [with_search_index(with_updated_at(a), "content") for a in announcements])
+        for announcement in announcements:
+            announcement.pop("search_index", None)
+        return announcements
+
+    async def search(self, query_terms, filters, sort="relevance", cursor=None, limit=20):
+        return await _text_search(self.collection, "announcement", query_terms, filters, sort, cursor, limit)
+
+    async def mark_read(self, announcement_id, user_id, read_at):
+        result = await self.reads.update_one(
+            {"announcement_id": announcement_id, "user_id": user_id},
+            {"$set": {"read_at": read_at}, "$setOnInsert": {"first_read_at": read_at}},
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    async def unread_count(self, user_id, building_id):
+        # Okundu kayıtları arşivlenmiş (süresi dolmuş) duyurular sayılmaz
+        announcement_ids = [
+            str(a["_id"]) for a in await self.collection.find(
+                {"building_id": building_id, "reads_archived_at": {"$exists": False}}, {"_id": 1}
+            ).to_list(None)
+        ]
+        if not announcement_ids:
+            return 0
+        read_count = await self.reads.count_documents({
+            "user_id": user_id,
+            "announcement_id": {"$in": announcement_ids}
+        })
+        return len(announcement_ids) - read_count
+
+    async def record_first_read(self, announcement_id, read_at):
+        # Dilim sunucuda duyurunun created_at alanından hesaplanır: önce okuma yok, tek güncelleme
+        bucket = _read_time_bucket_expr({"$subtract": [read_at, "$created_at"]})
+        fields: Dict[str, Any] = {
+            "stats.read_count": {"$add": [{"$ifNull": ["$stats.read_count", 0]}, 1]},
+            "stats.last_read_at": {"$max": ["$stats.last_read_at", read_at]},
+        }
+        for name, _ in READ_TIME_BUCKETS:
+            path = f"stats.time_to_read.{name}"
+            fields[path] = {"$add": [{"$ifNull": [f"${path}", 0]}, {"$cond": [{"$eq": [bucket, name]}, 1, 0]}]}
+        # Okundu kayıtları arşivlenmiş duyuruda eski okuyucu yeniden sayılmasın
+        await self.collection.update_one(
+            {"_id": to_object_id(announcement_id), "reads_archived_at": {"$exists": False}}, [{"$set": fields}]
+        )
+
+    async def rebuild_stats(self, announcement_id):
+        announcement = await _find_by_id(self.collection, announcement_id)
+        if announcement is None:
+            return None
+        # Eski kayıtlarda first_read_at yok; son okuma zamanına düş
+        first_read_at = {"$ifNull": ["$first_read_at", "$read_at"]}
+        pipeline = [
+            {"$match": {"announcement_id": announcement_id}},
+            {"$group": {
+                "_id": _read_time_bucket_expr({"$subtract": [first_read_at, announcement.get("created_at")]}),
+                "count": {"$sum": 1},
+                "last_read_at": {"$max": first_read_at},
+            }},
+        ]
+        stats = empty_read_stats()
+        async for group in self.reads.aggregate(pipeline):
+            stats["time_to_read"][group["_id"]] = group["count"]
+            stats["read_count"] += group["count"]
+            stats["last_read_at"] = max(filter(None, [stats["last_read_at"], group["last_read_at"]]))
+        await self.collection.update_one({"_id": to_object_id(announcement_id)}, {"$set": {"stats": stats}})
+        return stats
+
+    async def archive_reads(self, before, batch_size=500):
+        moved = 0
+        expired = {"created_at": {"$lt": before}, "reads_archived_at": {"$exists": False}}
+        while True:
+            announcements = await self.collection.find(expired, {"_id": 1}).to_list(batch_size)
+            if not announcements:
+                break
+            # Önce işaretle: bu andan sonraki ilk okumalar sayaçları artırmaz
+            await self.collection.update_many(
+                {"_id": {"$in": [a["_id"] for a in announcements]}},
+                {"$set": {"reads_archived_at": datetime.utcnow()}}
+            )
+            moved += await _move_to_archive(
+                self.reads, self.reads_archive,
+                {"announcement_id": {"$in": [str(a["_id"]) for a in announcements]}}, batch_size
+            )
+        # İlk okuması `before` öncesi olan kayıtların duyurusu da o tarihten önce yayınlanmıştır:
+        # silinmiş duyuruların ve işaretlemeden sonra gelen okumaların kayıtları
+        moved += await _move_to_archive(self.reads, self.reads_archive, {"$or": [
+            {"first_read_at": {"$lt": before}},
+            {"first_read_at": {"$exists": False}, "read_at": {"$lt": before}},
+        ]}, batch_size)
+        return moved
+
+    async def list_stats_for_building(self, building_id, limit=20):
+        cursor = self.collection.find(
+            {"building_id": building_id},
+            {"title": 1, "category": 1, "priority": 1, "created_at": 1, "stats": 1}
+        ).sort("created_at", -1)
+        return [serialize(a) for a in await cursor.to_list(limit)]
+
+
+QUEUE_FILTERS = ("status", "priority", "category")
+
+
+def _queue_query(building_id: str, filters: dict, fields=QUEUE_FILTERS) -> dict:
+    query = {"building_id": building_id}
+    for field in fields:
+        if filters.get(field) is not None:
+            query[field] = filters[field]
+    return query
+
+
+class MotorRequestRepository(RequestRepository):
+    def __init__(self, database):
+        self.database = database
+        self.collection = database.requests
+        self.archive = database.requests_archive
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            SEARCH_TEXT_INDEX,
+            IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+            IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING), ("_id", ASCENDING)],
+                       name="user_updated"),
+            # Yönetici kuyruğu: eşitlik alanları önce, sıralama alanları sonra
+            IndexModel(
+                [("building_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="building_status_created"
+            ),
+            IndexModel(
+                [("building_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                name="building_created"
+            ),
+        ])
+        await _ensure_archive(self.database, "requests_archive")
+        await self.archive.create_indexes([IndexModel([("user_id", ASCENDING)], name="user_id")])
+
+    async def list_for_user(self, user_id, limit=100):
+        cursor = self.collection.find({"user_id": user_id}).sort("created_at", -1)
+        return [serialize(r) for r in await cursor.to_list(limit)]
+
+    async def list_for_building(self, building_id, filters, cursor=None, limit=50):
+        query = _queue_query(building_id, filters)
+        if cursor is not None:
+            query.update(pagination.cursor_match(
+                "request", "created_at", cursor, {"$lt": to_object_id(cursor["id"])}
+            ))
+        found = self.collection.find(query, {"search_index": 0}).sort([("created_at", -1), ("_id", -1)])
+        return [serialize(r) for r in await found.to_list(limit)]
+
+    async def count_for_building(self, building_id, filters):
+        # Durum sayıları durum filtresinden bağımsızdır; tek $facet ile iki gruplama
+        pipeline = [
+            {"$match": _queue_query(building_id, filters, ("priority", "category"))},
+            {"$facet": {
+                "status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                "priority": [{"$group": {"_id": "$priority", "count": {"$sum": 1}}}],
+            }},
+        ]
+        facets = (await self.collection.aggregate(pipeline).to_list(1))[0]
+        return {name: {g["_id"]: g["count"] for g in groups} for name, groups in facets.items()}
+
+    async def get(self, request_id):
+        # Arşivlenmiş (eski, çözülmüş) talepler detayda görünmeye devam eder
+        return await _find_by_id(self.collection, request_id) or await _find_by_id(self.archive, request_id)
+
+    async def archive_resolved(self, before, batch_size=500):
+        return await _move_to_archive(self.collection, self.archive, {"status": "resolved", "$or": [
+            {"resolved_at": {"$lt": before}},
+            {"resolved_at": {"$exists": False}, "updated_at": {"$lt": before}},
+        ]}, batch_size)
+
+    async def has_archived(self, user_id):
+        return await self.archive.find_one({"user_id": user_id}, {"_id": 1}) is not None
+
+    async def create(self, request):
+        await _insert(self.collection, with_search_index(with_updated_at(request), "description"))
+        request.pop("search_index", None)
+        return request
+
+    async def list_changed(self, user_id, since, limit=500, after_id=None):
+        return await _changed_since(self.collection, "user_id", user_id, since, limit, after_id)
+
+    async def create_many(self, requests):
+        await _insert_many(self.collection, [with_search_index(with_updated_at(r), "description") for r in requests])
+        for request in requests:
+            request.pop("search_index", None)
+        return requests
+
+    async def update(self, request_id, fields, allowed_statuses=None, building_id=None):
+        extra_filter = {}
+        if allowed_statuses is not None:
+            extra_filter["status"] = {"$in": allowed_statuses}
+        if building_id is not None:
+            extra_filter["building_id"] = building_id
+        return await _update_by_id(self.collection, request_id, fields, extra_filter)
+
+    async def add_attachments(self, request_id, attachments, updated_at):
+        object_id = to_object_id(request_id)
+        if object_id is None:
+            return None
+        return serialize(await self.collection.find_one_and_update(
+            {"_id": object_id},
+            {"$push": {"attachments": {"$each": attachments}}, "$set": {"updated_at": updated_at}},
+            return_document=ReturnDocument.AFTER
+        ))
+
+    async def transition_many(self, changes, building_id=None):
+        results = {request_id: (False, None) for request_id, _, _ in changes}
+        scope = {"building_id": building_id} if building_id is not None else {}
+        # Bu çağrının yazdığı belgeler transition_id ile tanınır (bulk_write işlem başına sonuç vermez;
+        # updated_at karşılaştırması aynı milisaniyedeki geçişlerde ve saat kaymasında yanılır)
+        transition_id = uuid.uuid4().hex
+        object_ids, operations = [], []
+        for request_id, allowed, fields in changes:
+            object_id = to_object_id(request_id)
+            if object_id is not None:
+                object_ids.append(object_id)
+                operations.append(UpdateOne({"_id": object_id, "status": {"$in": allowed}, **scope},
+                                            {"$set": {**fields, "transition_id": transition_id}}))
+        if not operations:
+            return results
+        result = await self.collection.bulk_write(operations, ordered=False)
+        if result.matched_count == len(changes):
+            return {request_id: (True, fields["status"]) for request_id, _, fields in changes}
+
+        # Bir kısmı uygulanmadı: hangilerinin güncellendiğini tek sorguda bul
+        async for doc in self.collection.find({"_id": {"$in": object_ids}, **scope}, {"status": 1, "transition_id": 1}):
+            results[str(doc["_id"])] = (doc.get("transition_id") == transition_id, doc.get("status"))
+        return results
+
+    async def search(self, query_terms, filters, sort="relevance", cursor=None, limit=20):
+        return await _text_search(self.collection, "request", query_terms, filters, sort, cursor, limit)
+
+
+class MotorLegalProcessRepository(LegalProcessRepository):
+    def __init__(self, database):
+        self.collection = database.legal_processes
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("apartment_id", ASCENDING)], name="apartment_id"),
+        ])
+
+    async def get_for_apartment(self, apartment_id):
+        return serialize(await self.collection.find_one({"apartment_id": apartment_id}))
+
+    async def create(self, legal_process):
+        return await _insert(self.collection, with_updated_at(legal_process))
+
+    async def create_many(self, legal_processes):
+        return await _insert_many(self.collection, [with_updated_at(p) for p in legal_processes])
+
+    async def apartment_ids_with_process(self, apartment_ids):
+        if not apartment_ids:
+            return set()
+        return set(await self.collection.distinct("apartment_id", {"apartment_id": {"$in": apartment_ids}}))
+
+
+class MotorTombstoneRepository(TombstoneRepository):
+    def __init__(self, database):
+        self.collection = database.tombstones
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("scope", ASCENDING), ("deleted_at", ASCENDING)], name="scope_deleted"),
+            IndexModel([("deleted_at", ASCENDING)], expireAfterSeconds=int(TOMBSTONE_RETENTION.total_seconds()),
+                       name="deleted_ttl"),
+        ])
+
+    async def record(self, kind, doc_id, scope, deleted_at):
+        await self.collection.insert_one({"kind": kind, "doc_id": doc_id, "scope": scope, "deleted_at": deleted_at})
+
+    async def list_since(self, scopes, since, limit=500, after_id=None):
+        cursor = self.collection.find(
+            {"scope": {"$in": scopes}, **_after_position("deleted_at", since, after_id)}, {"scope": 0}
+        ).sort([("deleted_at", ASCENDING), ("_id", ASCENDING)])
+        return [serialize(doc) for doc in await cursor.to_list(limit)]
+
+
+# Daireye bağlı kayıtlara (aidat, hukuki süreç) binayı ekle
+_APARTMENT_BUILDING = [
+    {"$lookup": {
+        "from": "apartments",
+        "let": {"apartment_id": {"$convert": {
+            "input": "$apartment_id", "to": "objectId", "onError": None, "onNull": None
+        }}},
+        "pipeline": [
+            {"$match": {"$expr": {"$eq": ["$_id", "$$apartment_id"]}}},
+            {"$project": {"building_id": 1}},
+        ],
+        "as": "apartment",
+    }},
+    {"$set": {"building_id": {"$first": "$apartment.building_id"}}},
+    {"$match": {"building_id": {"$ne": None}}},
+]
+
+
+def _residents_pipeline(building_ids: List[str]) -> List[dict]:
+    """Bina başına sakin sayısı (kullanıcılar kiracıdan bağımsız, kontrol veritabanında)"""
+    return [
+        {"$match": {"role": {"$in": list(RESIDENT_ROLES)}, "building_id": {"$in": building_ids}}},
+        {"$group": {"_id": "$building_id", "count": {"$sum": 1}}},
+    ]
+
+
+def _activity_pipeline() -> List[dict]:
+    """Açık talep, hukuki süreç ve arıza kayıtlarını tek akışta birleştirip binaya göre grupla"""
+    outages = [
+        {"feature": feature, "status": {"$ifNull": [f"${feature}.status", "active"]}} for feature in STATUS_FEATURES
+    ]
+    return [
+        {"$match": {"status": {"$ne": "resolved"}}},
+        {"$project": {"_id": 0, "kind": "request", "building_id": 1, "priority": 1}},
+        {"$unionWith": {"coll": "legal_processes", "pipeline": [
+            {"$match": {"status": {"$nin": list(LEGAL_CLOSED_STATUSES)}}},
+            *_APARTMENT_BUILDING,
+            {"$project": {"_id": 0, "kind": "legal", "building_id": 1}},
+        ]}},
+        {"$unionWith": {"coll": "building_status", "pipeline": [
+            {"$project": {"_id": 0, "kind": "status", "building_id": 1, "outages": {
+                "$filter": {"input": outages, "cond": {"$ne": ["$$this.status", "active"]}}
+            }}},
+        ]}},
+        {"$facet": {
+            "requests": [
+                {"$match": {"kind": "request"}},
+                {"$group": {"_id": {"building_id": "$building_id", "priority": "$priority"}, "count": {"$sum": 1}}},
+            ],
+            "legal": [
+                {"$match": {"kind": "legal"}},
+                {"$group": {"_id": "$building_id", "count": {"$sum": 1}}},
+            ],
+            "outages": [
+                {"$match": {"kind": "status", "outages.0": {"$exists": True}}},
+                {"$project": {"_id": "$building_id", "features": "$outages.feature"}},
+            ],
+        }},
+    ]
+
+
+def _finance_pipeline(now: datetime) -> List[dict]:
+    """Vadesi gelmiş aidatlar: son bir yılın tahsilatı ve tüm ödenmemiş borç, binaya göre"""
+    window_start = now - COLLECTION_WINDOW
+    return [
+        {"$match": {"due_date": {"$lte": now}, "$or": [{"paid": False}, {"due_date": {"$gte": window_start}}]}},
+        {"$project": {"apartment_id": 1, "amount": 1, "paid": 1, "due_date": 1}},
+        *_APARTMENT_BUILDING,
+        {"$facet": {
+            "collection": [
+                {"$match": {"due_date": {"$gte": window_start}}},
+                {"$group": {
+                    "_id": "$building_id",
+                    "billed": {"$sum": "$amount"},
+                    "collected": {"$sum": {"$cond": ["$paid", "$amount", 0]}},
+                }},
+            ],
+            "outstanding": [
+                {"$match": {"paid": False}},
+                {"$group": {"_id": "$building_id", "amount": {"$sum": "$amount"}, "dues": {"$sum": 1}}},
+            ],
+        }},
+    ]
+
+
+class MotorPortfolioRepository(PortfolioRepository):
+    def __init__(self, database, users_database=None):
+        self.collection = database.portfolio_stats
+        self.buildings = database.buildings
+        self.requests = database.requests
+        self.users = (users_database or database).users
+        self.dues = database.dues
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([(field, ASCENDING), ("_id", ASCENDING)], name=f"sort_{name}")
+            for name, field in PORTFOLIO_SORT_FIELDS.items()
+        ])
+
+    async def refresh(self, now):
+        buildings, activity, finance = await asyncio.gather(
+            self.buildings.find({}, {"name": 1}).to_list(None),
+            self.requests.aggregate(_activity_pipeline(), allowDiskUse=True).to_list(1),
+            self.dues.aggregate(_finance_pipeline(now), allowDiskUse=True).to_list(1),
+        )
+        building_ids = [str(b["_id"]) for b in buildings]
+        residents = await self.users.aggregate(_residents_pipeline(building_ids)).to_list(None)
+        activity = dict(activity[0] if activity else {}, residents=residents)
+        rows = portfolio_rows(buildings, activity, finance[0] if finance else {}, now)
+        if rows:
+            await self.collection.bulk_write(
+                [ReplaceOne({"_id": row["_id"]}, row, upsert=True) for row in rows], ordered=False
+            )
+        # Silinmiş binaların eski satırları
+        await self.collection.delete_many({"refreshed_at": {"$lt": now}})
+        return len(rows)
+
+    async def list(self, sort, descending, cursor=None, limit=50):
+        field = PORTFOLIO_SORT_FIELDS[sort]
+        direction = DESCENDING if descending else ASCENDING
+        query = {}
+        if cursor is not None:
+            operator = "$lt" if descending else "$gt"
+            query = {"$or": [
+                {field: {operator: cursor["value"]}},
+                {field: cursor["value"], "_id": {operator: cursor["id"]}},
+            ]}
+        documents = self.collection.find(query).sort([(field, direction), ("_id", direction)])
+        return [serialize(d) for d in await documents.to_list(limit)]
+
+    async def count(self):
+        return await self.collection.estimated_document_count()
+
+
+# ========== BELLEK İÇİ UYGULAMALAR ==========
+
+def _changed_after(since: Optional[datetime], after_id: Optional[str] = None, field: str = "updated_at"):
+    """`_after_position` koşulunun bellek içi karşılığı"""
+    if since is None:
+        return None
+    if after_id is None:
+        return lambda doc: doc.get(field) is not None and doc[field] > since
+    return lambda doc: doc.get(field) is not None and (doc[field], doc["_id"]) > (since, after_id)
+
+
+class InMemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.users = InMemoryCollection(unique=["phone_number"], sorted_indexes=[("building_id", "_id")])
+
+    async def get(self, user_id):
+        return self.users.get(user_id)
+
+    async def find_by_phone(self, phone_number):
+        return self.users.get_by("phone_number", phone_number)
+
+    async def create(self, user):
+        try:
+            stored = self.users.insert(user)
+        except ValueError as e:
+            # Mongo'daki benzersiz indeks gibi davran
+            raise DuplicateKeyError(str(e)) from e
+        user["_id"] = stored["_id"]
+        return user
+
+    async def list_ids_for_building(self, building_id, after_id=None, limit=500):
+        users = self.users.find("building_id", building_id, "_id", limit=limit,
+                                where=lambda u: after_id is None or u["_id"] > after_id)
+        return [user["_id"] for user in users]
+
+    async def count_for_building(self, building_id):
+        return len(self.users.sorted[("building_id", "_id")].ids(building_id))
+
+    async def upsert_many(self, users):
+        now = datetime.utcnow()
+        counts = {"inserted": 0, "updated": 0}
+        for user in users:
+            existing = self.users.get_by("phone_number", user["phone_number"])
+            if existing is None:
+                self.users.insert({**user, "created_at": now, "updated_at": now})
+                counts["inserted"] += 1
+                continue
+            fields = {**user, "updated_at": now}
+            if existing.get("role") in ADMIN_ROLES:
+                fields["role"] = existing["role"]
+            self.users.update(existing["_id"], fields)
+            counts["updated"] += 1
+        return counts
+
+
+class InMemoryBuildingRepository(BuildingRepository):
+    def __init__(self):
+        self.buildings = InMemoryCollection()
+        self.apartments = InMemoryCollection()
+        self.status = InMemoryCollection(unique=["building_id"])
+        # (building_id, gün) -> geçmiş kovası
+        self.history: Dict[Tuple[str, datetime], dict] = {}
+
+    async def list(self, limit=100):
+        return self.buildings.all(limit)
+
+    async def get(self, building_id):
+        return self.buildings.get(building_id)
+
+    async def first(self):
+        return self.buildings.first()
+
+    async def create(self, building):
+        building["_id"] = self.buildings.insert(building)["_id"]
+        return building
+
+    async def get_apartment(self, apartment_id):
+        return self.apartments.get(apartment_id)
+
+    async def create_apartment(self, apartment):
+        apartment["_id"] = self.apartments.insert(apartment)["_id"]
+        return apartment
+
+    async def delete_apartment(self, apartment_id):
+        return self.apartments.delete(apartment_id)
+
+    async def upsert_apartments(self, building_id, apartments):
+        now = datetime.utcnow()
+        ids: Dict[Tuple[str, int], str] = {}
+        for apartment in self.apartments.docs.values():
+            if apartment.get("building_id") == building_id:
+                ids.setdefault((apartment.get("block"), apartment.get("apartment_number")), apartment["_id"])
+        counts = {"inserted": 0, "updated": 0}
+        for apartment in apartments:
+            key = (apartment["block"], apartment["apartment_number"])
+            if key in ids:
+                self.apartments.update(ids[key], _apartment_set(apartment, now))
+                counts["updated"] += 1
+            else:
+                ids[key] = self.apartments.insert({
+                    "building_id": building_id, **apartment, "created_at": now, "updated_at": now
+                })["_id"]
+                counts["inserted"] += 1
+        return ids, counts
+
+    async def get_status(self, building_id):
+        return self.status.get_by("building_id", building_id)
+
+    async def list_statuses(self, building_ids):
+        return [s for s in (self.status.get_by("building_id", b) for b in building_ids) if s is not None]
+
+    async def get_or_create_status(self, building_id, defaults):
+        existing = self.status.get_by("building_id", building_id)
+        if existing is not None:
+            return existing
+        return self.status.insert(with_updated_at(dict(defaults, building_id=building_id)))
+
+    async def update_status(self, building_id, fields):
+        existing = self.status.get_by("building_id", building_id)
+        if existing is None:
+            return None
+        return self.status.update(existing["_id"], fields)
+
+    async def change_status(self, building_id, fields):
+        existing = self.status.get_by("building_id", building_id)
+        if existing is None:
+            return None
+        return existing, self.status.update(existing["_id"], fields)
+
+    async def append_status_history(self, building_id, at, changes, opening):
+        day = history_day(at)
+        bucket = self.history.setdefault((building_id, day), {
+            "building_id": building_id, "day": day, "opening": dict(opening), "events": []
+        })
+        bucket["events"].extend({"feature": feature, "status": status, "at": at} for feature, status in changes.items())
+
+    async def status_uptime(self, building_id, start, end):
+        days = sorted(day for b, day in self.history if b == building_id)
+        anchor = [day for day in days if day <= start]
+        first_day = anchor[-1] if anchor else history_day(start)
+        buckets = [self.history[(building_id, day)] for day in days if first_day <= day < end]
+        return status_uptime(buckets, start, end)
+
+
+class InMemoryDueRepository(DueRepository):
+    def __init__(self, apartments: Optional[InMemoryCollection] = None):
+        self.dues = InMemoryCollection(sorted_indexes=[("apartment_id", "due_date"), ("apartment_id", "updated_at")])
+        self.archive = InMemoryCollection()
+        # Borç haritası daire bilgilerine ihtiyaç duyar; bina repository'siyle aynı koleksiyon
+        self.apartments = apartments if apartments is not None else InMemoryCollection()
+        self.debt_maps = InMemoryCollection(unique=["building_id"])
+
+    async def list_for_apartment(self, apartment_id, limit=100):
+        return self.dues.find("apartment_id", apartment_id, "due_date", descending=True, limit=limit)
+
+    async def list_unpaid(self, apartment_id, limit=100):
+        return self.dues.find("apartment_id", apartment_id, "due_date", limit=limit,
+                              where=lambda d: d.get("paid") is False)
+
+    async def get(self, due_id):
+        return self.dues.get(due_id) or self.archive.get(due_id)
+
+    async def archive_paid(self, before, batch_size=500):
+        return _move_in_memory(self.dues, self.archive, lambda d: d.get("paid") is True and d.get("due_date") is not None and d["due_date"] < before)
+
+    async def has_archived(self, apartment_id):
+        return any(d.get("apartment_id") == apartment_id for d in self.archive.docs.values())
+
+    async def create_many(self, dues):
+        for due in dues:
+            due["_id"] = self.dues.insert(with_updated_at(due))["_id"]
+        return dues
+
+    def _payable(self, apartment_id: str, due_ids: List[str], claimable) -> bool:
+        dues = [self.dues.docs.get(str(due_id)) for due_id in due_ids]
+        return bool(dues) and all(
+            d is not None and d.get("apartment_id") == apartment_id and d.get("paid") is False and claimable(d)
+            for d in dues
+        )
+
+    async def claim_for_payment(self, apartment_id, due_ids, payment_key, until, now):
+        def claimable(due):
+            claim = due.get("payment_claim")
+            return claim is None or claim["until"] <= now or claim["key"] == payment_key
+
+        if not self._payable(apartment_id, due_ids, claimable):
+            return False
+        for due_id in due_ids:
+            self.dues.update(due_id, {"payment_claim": {"key": payment_key, "until": until}})
+        return True
+
+    async def release_payment_claim(self, due_ids, payment_key):
+        for due_id in due_ids:
+            self.dues.update(due_id, {"payment_claim": None},
+                             where=lambda d: (d.get("payment_claim") or {}).get("key") == payment_key)
+
+    async def mark_many_paid(self, apartment_id, due_ids, fields, payment_key):
+        if not self._payable(apartment_id, due_ids,
+                             lambda d: (d.get("payment_claim") or {}).get("key") == payment_key):
+            return False
+        for due_id in due_ids:
+            self.dues.update(due_id, {**fields, "paid": True, "payment_claim": None})
+        return True
+
+    async def list_changed(self, apartment_id, since, limit=500, after_id=None):
+        return self.dues.find("apartment_id", apartment_id, "updated_at", limit=limit,
+                              where=_changed_after(since, after_id))
+
+    def _debt_cell(self, apartment: dict) -> dict:
+        unpaid = self.dues.find("apartment_id", apartment["_id"], "due_date", where=lambda d: d.get("paid") is False)
+        return _debt_cell({
+            **apartment,
+            "outstanding": sum(d.get("amount", 0) for d in unpaid),
+            "unpaid_due_dates": [d.get("due_date") for d in unpaid],
+        })
+
+    async def get_debt_map(self, building_id):
+        return self.debt_maps.get_by("building_id", building_id)
+
+    async def rebuild_debt_map(self, building_id):
+        cells = {
+            apartment["_id"]: self._debt_cell(apartment)
+            for apartment in self.apartments.docs.values() if apartment.get("building_id") == building_id
+        }
+        fields = {"apartments": cells, "refreshed_at": datetime.utcnow()}
+        existing = self.debt_maps.get_by("building_id", building_id)
+        if existing is None:
+            return self.debt_maps.insert({"building_id": building_id, **fields})
+        return self.debt_maps.update(existing["_id"], fields)
+
+    async def refresh_debt_map(self, apartment_id):
+        apartment = self.apartments.get(apartment_id)
+        existing = self.debt_maps.get_by("building_id", apartment.get("building_id")) if apartment else None
+        if existing is None:
+            return
+        self.debt_maps.update(existing["_id"], {
+            f"apartments.{apartment_id}": self._debt_cell(apartment), "refreshed_at": datetime.utcnow()
+        })
+
+    async def list_overdue_apartments(self, now, min_count=2, after=None, limit=500):
+        overdue = defaultdict(list)
+        for due in self.dues.docs.values():
+            if due.get("paid") is False and due.get("due_date") is not None and due["due_date"] < now:
+                if after is None or due["apartment_id"] > after:
+                    overdue[due["apartment_id"]].append(due.get("amount", 0))
+        return [
+            {"apartment_id": apartment_id, "total_debt": sum(amounts), "overdue_months": len(amounts)}
+            for apartment_id, amounts in sorted(overdue.items()) if len(amounts) >= min_count
+        ][:limit]
+
+
+def _move_in_memory(source: InMemoryCollection, archive: InMemoryCollection, where) -> int:
+    now = datetime.utcnow()
+    moved = [source.delete(doc_id) for doc_id, doc in list(source.docs.items()) if where(doc)]
+    for doc in moved:
+        archive.delete(doc["_id"])
+        archive.insert({**doc, "archived_at": now})
+    return len(moved)
+
+
+class InMemoryAnnouncementRepository(AnnouncementRepository):
+    def __init__(self):
+        self.announcements = InMemoryCollection(sorted_indexes=[("building_id", "created_at"), ("building_id", "updated_at")])
+        # (announcement_id, user_id) -> read_at / ilk okuma zamanı
+        self.reads: Dict[Tuple[str, str], datetime] = {}
+        self.first_reads: Dict[Tuple[str, str], datetime] = {}
+        self.reads_by_user: Dict[str, set] = defaultdict(set)
+        # (announcement_id, user_id) -> arşivlenmiş okundu kaydı
+        self.reads_archive: Dict[Tuple[str, str], dict] = {}
+
+    async def list_for_building(self, building_id, category=None, limit=100):
+        where = (lambda a: a.get("category") == category) if category else None
+        return self.announcements.find("building_id", building_id, "created_at",
+                                       descending=True, limit=limit, where=where)
+
+    async def get(self, announcement_id):
+        return self.announcements.get(announcement_id)
+
+    async def create(self, announcement):
+        announcement["_id"] = self.announcements.insert(with_search_index(with_updated_at(announcement), "content"))["_id"]
+        announcement.pop("search_index")
+        return announcement
+
+    async def delete(self, announcement_id):
+        return self.announcements.delete(announcement_id)
+
+    async def list_changed(self, building_id, since, limit=500, after_id=None):
+        return self.announcements.find("building_id", building_id, "updated_at", limit=limit,
+                                       where=_changed_after(since, after_id))
+
+    async def create_many(self, announcements):
+        for announcement in announcements:
+            await self.create(announcement)
+        return announcements
+
+    async def claim_delivery(self, now, lease_until):
+        due = [
+            a for a in self.announcements.docs.values()
+            if a.get("delivery", {}).get("pending") and a["delivery"]["next_attempt_at"] <= now
+        ]
+        if not due:
+            return None
+        job = min(due, key=lambda a: a["delivery"]["next_attempt_at"])
+        return self.announcements.update(job["_id"], {
+            "delivery.status": "processing",
+            "delivery.next_attempt_at": lease_until,
+            "delivery.attempts": job["delivery"].get("attempts", 0) + 1,
+        })
+
+    async def update_delivery(self, announcement_id, fields):
+        self.announcements.update(announcement_id, {f"delivery.{key}": value for key, value in fields.items()})
+
+    async def search(self, query_terms, filters, sort="relevance", cursor=None, limit=20):
+        return self.announcements.search("announcement", query_terms, filters, sort, cursor, limit)
+
+    async def mark_read(self, announcement_id, user_id, read_at):
+        first_read = (announcement_id, user_id) not in self.reads
+        self.reads[(announcement_id, user_id)] = read_at
+        self.first_reads.setdefault((announcement_id, user_id), read_at)
+        self.reads_by_user[user_id].add(announcement_id)
+        return first_read
+
+    async def unread_count(self, user_id, building_id):
+        announcement_ids = self.announcements.sorted[("building_id", "created_at")].ids(building_id)
+        read_ids = self.reads_by_user.get(user_id, set())
+        return sum(1 for announcement_id in announcement_ids
+                   if announcement_id not in read_ids and "reads_archived_at" not in self.announcements.docs[announcement_id])
+
+    async def record_first_read(self, announcement_id, read_at):
+        announcement = self.announcements.docs.get(announcement_id)
+        if announcement is None or "reads_archived_at" in announcement:
+            return
+        stats = announcement.get("stats") or empty_read_stats()
+        stats["read_count"] += 1
+        stats["last_read_at"] = max(filter(None, [stats["last_read_at"], read_at]))
+        bucket = read_time_bucket(announcement.get("created_at"), read_at)
+        stats["time_to_read"][bucket] = stats["time_to_read"].get(bucket, 0) + 1
+        self.announcements.update(announcement_id, {"stats": stats})
+
+    async def rebuild_stats(self, announcement_id):
+        announcement = self.announcements.get(announcement_id)
+        if announcement is None:
+            return None
+        stats = empty_read_stats()
+        for (read_announcement_id, _), read_at in self.first_reads.items():
+            if read_announcement_id == announcement_id:
+                stats["read_count"] += 1
+                stats["last_read_at"] = max(filter(None, [stats["last_read_at"], read_at]))
+                stats["time_to_read"][read_time_bucket(announcement.get("created_at"), read_at)] += 1
+        self.announcements.update(announcement_id, {"stats": stats})
+        return stats
+
+    async def list_stats_for_building(self, building_id, limit=20):
+        fields = ("_id", "title", "category", "priority", "created_at", "stats")
+        announcements = self.announcements.find("building_id", building_id, "created_at", descending=True, limit=limit)
+        return [{field: a[field] for field in fields if field in a} for a in announcements]
+
+    def _archive_read(self, key: Tuple[str, str], now: datetime) -> None:
+        announcement_id, user_id = key
+        self.reads_archive[key] = {
+            "announcement_id": announcement_id,
+            "user_id": user_id,
+            "read_at": self.reads.pop(key),
+            "first_read_at": self.first_reads.pop(key, None),
+            "archived_at": now,
+        }
+        self.reads_by_user[user_id].discard(announcement_id)
+
+    async def archive_reads(self, before, batch_size=500):
+        now = datetime.utcnow()
+        expired = {
+            announcement_id for announcement_id, a in self.announcements.docs.items()
+            if a.get("created_at") and a["created_at"] < before and "reads_archived_at" not in a
+        }
+        for announcement_id in expired:
+            self.announcements.update(announcement_id, {"reads_archived_at": now})
+        keys = [
+            key for key in self.reads
+            if key[0] in expired or (self.first_reads.get(key) or self.reads[key]) < before
+        ]
+        for key in keys:
+            self._archive_read(key, now)
+        return len(keys)
+
+
+class InMemoryRequestRepository(RequestRepository):
+    def __init__(self):
+        self.requests = InMemoryCollection(sorted_indexes=[
+            ("user_id", "created_at"), ("building_id", "created_at"), ("user_id", "updated_at")
+        ])
+        self.archive = InMemoryCollection()
+
+    async def list_for_user(self, user_id, limit=100):
+        return self.requests.find("user_id", user_id, "created_at", descending=True, limit=limit)
+
+    async def list_for_building(self, building_id, filters, cursor=None, limit=50):
+        wanted = {field: filters[field] for field in QUEUE_FILTERS if filters.get(field) is not None}
+        return self.requests.find(
+            "building_id", building_id, "created_at", descending=True, limit=limit,
+            where=lambda r: all(r.get(f) == v for f, v in wanted.items()) and pagination.is_after_cursor(
+                "request", r.get("created_at"), r["_id"], cursor
+            )
+        )
+
+    async def count_for_building(self, building_id, filters):
+        wanted = {field: filters[field] for field in ("priority", "category") if filters.get(field) is not None}
+        counts: Dict[str, Dict[str, int]] = {"status": defaultdict(int), "priority": defaultdict(int)}
+        for request in self.requests.find("building_id", building_id, "created_at"):
+            if all(request.get(f) == v for f, v in wanted.items()):
+                counts["status"][request.get("status")] += 1
+                counts["priority"][request.get("priority")] += 1
+        return {name: dict(groups) for name, groups in counts.items()}
+
+    async def get(self, request_id):
+        return self.requests.get(request_id) or self.archive.get(request_id)
+
+    async def archive_resolved(self, before, batch_size=500):
+        def resolved_before(request):
+            resolved_at = request.get("resolved_at") or request.get("updated_at")
+            return request.get("status") == "resolved" and resolved_at is not None and resolved_at < before
+
+        return _move_in_memory(self.requests, self.archive, resolved_before)
+
+    async def has_archived(self, user_id):
+        return any(r.get("user_id") == user_id for r in self.archive.docs.values())
+
+    async def create(self, request):
+        request["_id"] = self.requests.insert(with_search_index(with_updated_at(request), "description"))["_id"]
+        request.pop("search_index")
+        return request
+
+    async def list_changed(self, user_id, since, limit=500, after_id=None):
+        return self.requests.find("user_id", user_id, "updated_at", limit=limit,
+                                  where=_changed_after(since, after_id))
+
+    async def create_many(self, requests):
+        for request in requests:
+            await self.create(request)
+        return requests
+
+    async def update(self, request_id, fields, allowed_statuses=None, building_id=None):
+        def where(request):
+            return ((allowed_statuses is None or request.get("status") in allowed_statuses)
+                    and (building_id is None or request.get("building_id") == building_id))
+        return self.requests.update(request_id, fields, where=where)
+
+    async def add_attachments(self, request_id, attachments, updated_at):
+        existing = self.requests.get(request_id)
+        if existing is None:
+            return None
+        return self.requests.update(request_id, {
+            "attachments": existing.get("attachments", []) + attachments,
+            "updated_at": updated_at
+        })
+
+    async def transition_many(self, changes, building_id=None):
+        results = {}
+        for request_id, allowed, fields in changes:
+            existing = self.requests.get(request_id)
+            if existing is None or (building_id is not None and existing.get("building_id") != building_id):
+                results[request_id] = (False, None)
+                continue
+            updated = self.requests.update(request_id, fields, where=lambda r: r.get("status") in allowed)
+            results[request_id] = (updated is not None, (updated or existing)["status"])
+        return results
+
+    async def search(self, query_terms, filters, sort="relevance", cursor=None, limit=20):
+        return self.requests.search("request", query_terms, filters, sort, cursor, limit)
+
+
+class InMemoryLegalProcessRepository(LegalProcessRepository):
+    def __init__(self):
+        self.legal_processes = InMemoryCollection(unique=["apartment_id"])
+
+    async def get_for_apartment(self, apartment_id):
+        return self.legal_processes.get_by("apartment_id", apartment_id)
+
+    async def create(self, legal_process):
+        legal_process["_id"] = self.legal_processes.insert(with_updated_at(legal_process))["_id"]
+        return legal_process
+
+    async def create_many(self, legal_processes):
+        return [await self.create(p) for p in legal_processes]
+
+    async def apartment_ids_with_process(self, apartment_ids):
+        return {a for a in apartment_ids if a in self.legal_processes.unique["apartment_id"]}
+
+
+class InMemoryTombstoneRepository(TombstoneRepository):
+    def __init__(self):
+        self.tombstones = InMemoryCollection(sorted_indexes=[("scope", "deleted_at")])
+
+    async def record(self, kind, doc_id, scope, deleted_at):
+        self.tombstones.insert({"kind": kind, "doc_id": doc_id, "scope": scope, "deleted_at": deleted_at})
+
+    async def list_since(self, scopes, since, limit=500, after_id=None):
+        where = _changed_after(since, after_id, "deleted_at")
+        found = [t for scope in scopes for t in self.tombstones.find("scope", scope, "deleted_at", where=where)]
+        found.sort(key=lambda t: (t["deleted_at"], t["_id"]))
+        return [{"_id": t["_id"], "kind": t["kind"], "doc_id": t["doc_id"], "deleted_at": t["deleted_at"]}
+                for t in found[:limit]]
+
+
+class InMemoryPortfolioRepository(PortfolioRepository):
+    """Aggregation çıktılarının aynısını bellek içi koleksiyonlardan Python ile üretir"""
+
+    def __init__(self, users: "InMemoryUserRepository", buildings: "InMemoryBuildingRepository",
+                 dues: "InMemoryDueRepository", requests: "InMemoryRequestRepository",
+                 legal_processes: "InMemoryLegalProcessRepository"):
+        self.sources = (users, buildings, dues, requests, legal_processes)
+        self.rows: Dict[str, dict] = {}
+
+    async def refresh(self, now):
+        users, buildings, dues, requests, legal_processes = self.sources
+        apartments = buildings.apartments.docs
+
+        def building_of(apartment_id):
+            return apartments.get(str(apartment_id), {}).get("building_id")
+
+        def group(keys) -> List[dict]:
+            counts: Dict[Any, int] = defaultdict(int)
+            for key in keys:
+                if key is not None:
+                    counts[key] += 1
+            return [{"_id": key, "count": count} for key, count in counts.items()]
+
+        activity = {
+            "residents": group(u.get("building_id") for u in users.users.docs.values() if u.get("role") in RESIDENT_ROLES),
+            "requests": [
+                {"_id": {"building_id": g["_id"][0], "priority": g["_id"][1]}, "count": g["count"]}
+                for g in group(
+                    (r.get("building_id"), r.get("priority")) for r in requests.requests.docs.values()
+                    if r.get("status") != "resolved" and r.get("building_id")
+                )
+            ],
+            "legal": group(building_of(p.get("apartment_id")) for p in legal_processes.legal_processes.docs.values()
+                           if p.get("status") not in LEGAL_CLOSED_STATUSES),
+            "outages": [
+                {"_id": status["building_id"], "features": features}
+                for status in buildings.status.docs.values()
+                for features in [[f for f in STATUS_FEATURES if (status.get(f) or {}).get("status", "active") != "active"]]
+                if features
+            ],
+        }
+
+        window_start = now - COLLECTION_WINDOW
+        collection: Dict[str, dict] = {}
+        outstanding: Dict[str, dict] = {}
+        for due in dues.dues.docs.values():
+            building_id = building_of(due.get("apartment_id"))
+            due_date = due.get("due_date")
+            if building_id is None or due_date is None or due_date > now:
+                continue
+            if due_date >= window_start:
+                entry = collection.setdefault(building_id, {"_id": building_id, "billed": 0, "collected": 0})
+                entry["billed"] += due.get("amount", 0)
+                entry["collected"] += due.get("amount", 0) if due.get("paid") else 0
+            if due.get("paid") is False:
+                entry = outstanding.setdefault(building_id, {"_id": building_id, "amount": 0, "dues": 0})
+                entry["amount"] += due.get("amount", 0)
+                entry["dues"] += 1
+        finance = {"collection": list(collection.values()), "outstanding": list(outstanding.values())}
+
+        rows = portfolio_rows(list(buildings.buildings.docs.values()), activity, finance, now)
+        self.rows = {row["_id"]: row for row in rows}
+        return len(rows)
+
+    async def list(self, sort, descending, cursor=None, limit=50):
+        path = PORTFOLIO_SORT_FIELDS[sort].split(".")
+
+        def key(row):
+            value = row
+            for part in path:
+                value = value[part]
+            return value, row["_id"]
+
+        rows = sorted(self.rows.values(), key=key, reverse=descending)
+        if cursor is not None:
+            after = (cursor["value"], cursor["id"])
+            rows = [row for row in rows if (key(row) < after if descending else key(row) > after)]
+        return copy.deepcopy(rows[:limit])
+
+    async def count(self):
+        return len(self.rows)
+
+
+# ========== OKUMA ÖNBELLEĞİ (READ-THROUGH) ==========
+
+class ReadThroughBuildingRepository(BuildingRepository):
+    """
+    Küçük ve sık okunan `buildings` ve `building_status` koleksiyonları için
+    bellek içi okuma önbelleği. Okumalar önbellekten, yazmalar kaynağa gider ve
+    önbelleği günceller. Diğer worker'lardaki yazmalar en geç `ttl` saniye
+    sonra görünür hale gelir.
+    """
+
+    def __init__(self, source: BuildingRepository, ttl: float = 10.0):
+        self.source = source
+        self.ttl = ttl
+        self._cache: Dict[Tuple[str, Any], Tuple[float, Any]] = {}
+        # Süresi dolan bir anahtara aynı anda gelen okumalar kaynağa tek çağrı yapar
+        self._flight = SingleFlight()
+
+    def _get_cached(self, key):
+        entry = self._cache.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return True, copy.deepcopy(entry[1])
+        return False, None
+
+    def _put(self, key, value):
+        self._cache[key] = (time.monotonic(), copy.deepcopy(value))
+        return value
+
+    def invalidate(self, building_id: Optional[str] = None) -> None:
+        if building_id is None:
+            self._cache.clear()
+            return
+        for key in [("building", building_id), ("status", building_id), ("list", None), ("first", None)]:
+            self._cache.pop(key, None)
+
+    async def _read(self, key, loader):
+        hit, value = self._get_cached(key)
+        if hit:
+            return value
+
+        async def load():
+            return self._put(key, await loader())
+
+        return copy.deepcopy(await self._flight.do(key, load))
+
+    async def list(self, limit=100):
+        buildings = await self._read(("list", None), lambda: self.source.list(limit))
+        return buildings[:limit]
+
+    async def get(self, building_id):
+        return await self._read(("building", building_id), lambda: self.source.get(building_id))
+
+    async def first(self):
+        return await self._read(("first", None), self.source.first)
+
+    async def create(self, building):
+        created = await self.source.create(building)
+        self.invalidate(created["_id"])
+        return created
+
+    async def get_apartment(self, apartment_id):
+        return await self.source.get_apartment(apartment_id)
+
+    async def create_apartment(self, apartment):
+        return await self.source.create_apartment(apartment)
+
+    async def delete_apartment(self, apartment_id):
+        return await self.source.delete_apartment(apartment_id)
+
+    async def upsert_apartments(self, building_id, apartments):
+        return await self.source.upsert_apartments(building_id, apartments)
+
+    async def get_status(self, building_id):
+        hit, value = self._get_cached(("status", building_id))
+        if hit and value is not None:
+            return value
+        # Kayıt yoksa önbelleğe alma; varsayılan durum hemen ardından oluşturulur
+        status = await self.source.get_status(building_id)
+        if status is not None:
+            self._put(("status", building_id), status)
+        return status
+
+    async def list_statuses(self, building_ids):
+        return await self.source.list_statuses(building_ids)
+
+    async def get_or_create_status(self, building_id, defaults):
+        hit, value = self._get_cached(("status", building_id))
+        if hit and value is not None:
+            return value
+
+        async def load():
+            return self._put(("status", building_id), await self.source.get_or_create_status(building_id, defaults))
+
+        return copy.deepcopy(await self._flight.do(("status", building_id), load))
+
+    async def update_status(self, building_id, fields):
+        updated = await self.source.update_status(building_id, fields)
+        if updated is not None:
+            self._put(("status", building_id), updated)
+        return updated
+
+    async def change_status(self, building_id, fields):
+        changed = await self.source.change_status(building_id, fields)
+        if changed is not None:
+            self._put(("status", building_id), changed[1])
+        return changed
+
+    async def append_status_history(self, building_id, at, changes, opening):
+        await self.source.append_status_history(building_id, at, changes, opening)
+
+    async def status_uptime(self, building_id, start, end):
+        return await self.source.status_uptime(building_id, start, end)
+
+    async def ensure_indexes(self):
+        await self.source.ensure_indexes()
+
+    async def warm_up(self):
+        """Bina listesini, binaları ve durumlarını iki sorguyla önbelleğe al (açılışta, trafikten önce)"""
+        # Liste anahtarı /buildings ile aynı sınırla doldurulur
+        buildings = await self.source.list(100)
+        self._put(("list", None), buildings)
+        if buildings:
+            self._put(("first", None), buildings[0])
+        for building in buildings:
+            self._put(("building", building["_id"]), building)
+        for status in await self.source.list_statuses([b["_id"] for b in buildings]):
+            self._put(("status", status["building_id"]), status)
+
+
+# ========== KAPSAYICI ==========
+
+@dataclass
+class Repositories:
+    """Handler'lara dependency injection ile verilen repository kümesi"""
+    users: UserRepository
+    buildings: BuildingRepository
+    dues: DueRepository
+    announcements: AnnouncementRepository
+    requests: RequestRepository
+    legal_processes: LegalProcessRepository
+    tombstones: TombstoneRepository
+    portfolio: PortfolioRepository
+
+    @classmethod
+    def motor(cls, database, hot_cache_ttl: float = 0, users_database=None) -> "Repositories":
+        """`users_database`: kullanıcılar başka veritabanındaysa (kiracı veritabanları, bkz. tenancy)"""
+        buildings: BuildingRepository = MotorBuildingRepository(database)
+        if hot_cache_ttl > 0:
+            buildings = ReadThroughBuildingRepository(buildings, ttl=hot_cache_ttl)
+        return cls(
+            users=MotorUserRepository(users_database or database),
+            buildings=buildings,
+            dues=MotorDueRepository(database),
+            announcements=MotorAnnouncementRepository(database),
+            requests=MotorRequestRepository(database),
+            legal_processes=MotorLegalProcessRepository(database),
+            tombstones=MotorTombstoneRepository(database),
+            portfolio=MotorPortfolioRepository(database, users_database),
+        )
+
+    def _all(self) -> Tuple[Repository, ...]:
+        return (self.users, self.buildings, self.dues, self.announcements,
+                self.requests, self.legal_processes, self.tombstones, self.portfolio)
+
+    async def ensure_indexes(self) -> None:
+        for repository in self._all():
+            await repository.ensure_indexes()
+
+    async def warm_up(self) -> None:
+        for repository in self._all():
+            await repository.warm_up()
+
+    @classmethod
+    def in_memory(cls) -> "Repositories":
+        users = InMemoryUserRepository()
+        buildings = InMemoryBuildingRepository()
+        dues = InMemoryDueRepository(apartments=buildings.apartments)
+        requests = InMemoryRequestRepository()
+        legal_processes = InMemoryLegalProcessRepository()
+        return cls(
+            users=users,
+            buildings=buildings,
+            dues=dues,
+            announcements=InMemoryAnnouncementRepository(),
+            requests=requests,
+            legal_processes=legal_processes,
+            tombstones=InMemoryTombstoneRepository(),
+            portfolio=InMemoryPortfolioRepository(users, buildings, dues, requests, legal_processes),
+        )
@@ -0,0 +1,411 @@
+"""
+Dağıtık zamanlanmış işler (cron + kiralık kilit)
+
+Periyodik işler (hukuki süreç başlatma, portföy önbelleği, arşivleme) her
+worker sürecinde tanımlanır ama her çalıştırmayı dağıtımda yalnızca bir
+worker yapar:
+
+- Her işin `job_locks` koleksiyonunda bir kilit belgesi vardır:
+
+      {"_id": "<iş adı>", "owner": ..., "lease_until": ..., "next_run_at": ..., "checkpoint": ...}
+
+  Zamanı gelen işi ilk kiralayan worker çalıştırır; çalışırken kirayı
+  düzenli olarak uzatır. Worker çökerse kira dolar ve iş başka bir worker'a geçer.
+- Büyük partiler üzerinde çalışan işler ilerlemelerini `JobContext.save` ile
+  kilit belgesine yazar; yarıda kalan çalıştırma kaldığı yerden devam eder.
+  Kayıt kiranın sahibine bağlıdır: kirası elinden alınmış bir worker ilerleme
+  yazamaz (`LeaseLost`).
+- Her çalıştırmanın sonucu, süresi ve hatası sınırlı boyutlu (capped)
+  `job_runs` koleksiyonunda tutulur; en eski kayıtlar kendiliğinden silinir.
+
+Zamanlar UTC'dir; cron ifadeleri beş alanlıdır (dakika saat gün ay haftanın-günü).
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_field(text: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        span, _, step = part.partition("/")
+        if span == "*":
+            start, end = low, high
+        elif "-" in span:
+            start, end = (int(v) for v in span.split("-", 1))
+        else:
+            start = end = int(span)
+            if step:
+                end = high
+        if not low <= start <= end <= high or (step and int(step) < 1):
+            raise ValueError(f"Geçersiz cron alanı: {text}")
+        values.update(range(start, end + 1, int(step or 1)))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """Beş alanlı cron ifadesi: `*`, `*/n`, `a-b`, `a-b/n` ve virgüllü listeler"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron ifadesi beş alanlı olmalı: {expression}")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        # 0 ve 7 pazar
+        self.weekdays = frozenset(d % 7 for d in _parse_field(fields[4], 0, 7))
+        self.any_day, self.any_weekday = fields[2] == "*", fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        # Cron kuralı: gün ve haftanın günü ikisi de kısıtlıysa biri yeterli
+        if not self.any_day and not self.any_weekday:
+            return day or weekday
+        return day and weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """`moment`ten sonraki ilk eşleşen dakika"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron ifadesi hiçbir zaman eşleşmiyor: {self.expression}")
+
+
+class LeaseLost(Exception):
+    """İşin kirası başka bir worker'a geçti; çalıştırma durdurulmalı"""
+
+
+class JobStore(ABC):
+    @abstractmethod
+    async def register(self, name: str, next_run_at: datetime) -> dict:
+        """İşin kilit belgesi yoksa oluştur; güncel belgeyi döndür"""
+
+    @abstractmethod
+    async def acquire(self, name: str, owner: str, now: datetime, lease_until: datetime) -> Optional[dict]:
+        """Zamanı geldiyse ve kira boşsa (ya da dolmuşsa) işi kirala; kilit belgesi ya da None"""
+
+    @abstractmethod
+    async def renew(self, name: str, owner: str, lease_until: datetime) -> bool:
+        """Kirayı uzat; kira artık bu worker'da değilse False"""
+
+    @abstractmethod
+    async def save_checkpoint(self, name: str, owner: str, checkpoint: Any) -> bool:
+        """İlerlemeyi yaz; kira artık bu worker'da değilse False"""
+
+    @abstractmethod
+    async def release(self, name: str, owner: str, fields: dict) -> None:
+        """Kirayı bırak ve sonuç alanlarını (next_run_at, checkpoint, last_*) yaz"""
+
+    @abstractmethod
+    async def list(self) -> List[dict]:
+        """Tüm işlerin kilit belgeleri"""
+
+    @abstractmethod
+    async def record_run(self, run: dict) -> None: ...
+
+    @abstractmethod
+    async def history(self, name: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """Son çalıştırmalar, en yeni önce"""
+
+    async def ensure_indexes(self) -> None:
+        """Gerekli koleksiyon ve indeksleri oluştur (bellek içi uygulamada gerek yok)"""
+
+
+class InMemoryJobStore(JobStore):
+    """Tek süreçlik kurulum ve testler için"""
+
+    def __init__(self, history_size: int = 1000):
+        self.locks: Dict[str, dict] = {}
+        self.runs: deque = deque(maxlen=history_size)
+
+    async def register(self, name, next_run_at):
+        lock = self.locks.setdefault(name, {
+            "_id": name, "owner": None, "lease_until": None, "next_run_at": next_run_at, "checkpoint": None
+        })
+        return dict(lock)
+
+    async def acquire(self, name, owner, now, lease_until):
+        lock = self.locks.get(name)
+        if lock is None or lock["next_run_at"] > now:
+            return None
+        if lock["lease_until"] is not None and lock["lease_until"] >= now:
+            return None
+        lock.update(owner=owner, lease_until=lease_until, started_at=now)
+        return dict(lock)
+
+    def _owned(self, name: str, owner: str) -> Optional[dict]:
+        lock = self.locks.get(name)
+        return lock if lock is not None and lock["owner"] == owner else None
+
+    async def renew(self, name, owner, lease_until):
+        lock = self._owned(name, owner)
+        if lock is None:
+            return False
+        lock["lease_until"] = lease_until
+        return True
+
+    async def save_checkpoint(self, name, owner, checkpoint):
+        lock = self._owned(name, owner)
+        if lock is None:
+            return False
+        lock.update(checkpoint=checkpoint, checkpoint_at=datetime.utcnow())
+        return True
+
+    async def release(self, name, owner, fields):
+        lock = self._owned(name, owner)
+        if lock is not None:
+            lock.update(fields, owner=None, lease_until=None)
+
+    async def list(self):
+        return [dict(lock) for lock in self.locks.values()]
+
+    async def record_run(self, run):
+        self.runs.append(dict(run))
+
+    async def history(self, name=None, limit=50):
+        return [dict(r) for r in reversed(self.runs) if name is None or r["job"] == name][:limit]
+
+
+class MongoJobStore(JobStore):
+    """
+    Worker'lar arası ortak kilitler. Kiralama tek bir koşullu
+    find_one_and_update ile atomiktir; ilerleme ve bırakma yalnızca kiranın
+    sahibi tarafından yazılabilir.
+    """
+
+    def __init__(self, database, history_bytes: int = 16 * 1024 * 1024, history_size: int = 10_000):
+        self.database = database
+        self.locks = database.job_locks
+        self.runs = database.job_runs
+        self.history_bytes = history_bytes
+        self.history_size = history_size
+
+    async def ensure_indexes(self):
+        try:
+            await self.database.create_collection(
+                "job_runs", capped=True, size=self.history_bytes, max=self.history_size
+            )
+        except CollectionInvalid:
+            pass
+
+    async def register(self, name, next_run_at):
+        try:
+            return await self.locks.find_one_and_update(
+                {"_id": name},
+                {"$setOnInsert": {"owner": None, "lease_until": None, "next_run_at": next_run_at, "checkpoint": None}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Aynı anda açılan başka bir worker oluşturdu
+            return await self.locks.find_one({"_id": name})
+
+    async def acquire(self, name, owner, now, lease_until):
+        return await self.locks.find_one_and_update(
+            {"_id": name, "next_run_at": {"$lte": now},
+             "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"owner": owner, "lease_until": lease_until, "started_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renew(self, name, owner, lease_until):
+        result = await self.locks.update_one({"_id": name, "owner": owner}, {"$set": {"lease_until": lease_until}})
+        return result.matched_count == 1
+
+    async def save_checkpoint(self, name, owner, checkpoint):
+        result = await self.locks.update_one(
+            {"_id": name, "owner": owner},
+            {"$set": {"checkpoint": checkpoint, "checkpoint_at": datetime.utcnow()}}
+        )
+        return result.matched_count == 1
+
+    async def release(self, name, owner, fields):
+        await self.locks.update_one(
+            {"_id": name, "owner": owner},
+            {"$set": {**fields, "owner": None, "lease_until": None}}
+        )
+
+    async def list(self):
+        return await self.locks.find({}).sort("_id", 1).to_list(None)
+
+    async def record_run(self, run):
+        await self.runs.insert_one(dict(run))
+
+    async def history(self, name=None, limit=50):
+        # Capped koleksiyonda doğal sıra ekleme sırasıdır
+        cursor = self.runs.find({"job": name} if name else {}, {"_id": 0}).sort("$natural", -1)
+        return await cursor.to_list(limit)
+
+
+class JobContext:
+    """Çalışan işin ilerleme kaydı: `checkpoint` önceki yarım çalıştırmadan kalan değer (yoksa None)"""
+
+    def __init__(self, store: JobStore, name: str, owner: str, checkpoint: Any = None):
+        self.store = store
+        self.name = name
+        self.owner = owner
+        self.checkpoint = checkpoint
+        self.resumed = checkpoint is not None
+
+    async def save(self, checkpoint: Any) -> None:
+        """İlerlemeyi kaydet (parti sonrası); çökme sonrası iş buradan devam eder"""
+        if not await self.store.save_checkpoint(self.name, self.owner, checkpoint):
+            raise LeaseLost(self.name)
+        self.checkpoint = checkpoint
+
+
+@dataclass
+class Job:
+    name: str
+    schedule: CronSchedule
+    func: Callable[[JobContext], Awaitable[Any]]
+    lease_seconds: float = 120.0
+    # Başarısız çalıştırma bir sonraki cron zamanını beklemeden bu kadar sonra yeniden denenir
+    retry_seconds: float = 300.0
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Scheduler:
+    def __init__(self, store: JobStore, owner: Optional[str] = None, poll_interval: float = 30.0):
+        self.store = store
+        self.owner = owner or default_owner()
+        self.poll_interval = poll_interval
+        self.jobs: Dict[str, Job] = {}
+        # Kilit belgesinden bilinen bir sonraki çalıştırma zamanı; erken kiralama denemesi yapılmaz
+        self._next_run: Dict[str, datetime] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, cron: str, func: Callable[[JobContext], Awaitable[Any]],
+            lease_seconds: float = 120.0, retry_seconds: float = 300.0) -> None:
+        self.jobs[name] = Job(name, CronSchedule(cron), func, lease_seconds, retry_seconds)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="job-scheduler")
+
+    async def stop(self) -> None:
+        """Döngüyü ve süren işleri durdur; yarım işler ilerlemesiyle hemen başka worker'a bırakılır"""
+        tasks = [t for t in (self._task, *self._running.values()) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._running = {}
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Zamanlayıcı hatası: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def tick(self, now: Optional[datetime] = None) -> List[str]:
+        """Zamanı gelen ve kiralanabilen işleri başlat; başlatılan işlerin adları"""
+        now = now or datetime.utcnow()
+        started = []
+        for job in self.jobs.values():
+            if job.name in self._running:
+                continue
+            if job.name not in self._next_run:
+                lock = await self.store.register(job.name, job.schedule.next_after(now))
+                self._next_run[job.name] = lock["next_run_at"]
+            if self._next_run[job.name] > now:
+                continue
+            lock = await self.store.acquire(job.name, self.owner, now, now + timedelta(seconds=job.lease_seconds))
+            if lock is None:
+                # Başka bir worker çalıştırıyor ya da çalıştırıp sonraki zamanı ileri aldı
+                self._next_run.pop(job.name)
+                continue
+            self._running[job.name] = asyncio.create_task(self._execute(job, lock), name=f"job-{job.name}")
+            started.append(job.name)
+        return started
+
+    async def _heartbeat(self, job: Job, work: asyncio.Task) -> None:
+        while True:
+            await asyncio.sleep(job.lease_seconds / 3)
+            lease_until = datetime.utcnow() + timedelta(seconds=job.lease_seconds)
+            if not await self.store.renew(job.name, self.owner, lease_until):
+                logger.error(f"'{job.name}' işinin kirası kaybedildi, durduruluyor")
+                work.cancel()
+                return
+
+    async def _execute(self, job: Job, lock: dict) -> dict:
+        context = JobContext(self.store, job.name, self.owner, lock.get("checkpoint"))
+        started_at, started = datetime.utcnow(), time.perf_counter()
+        run = {"job": job.name, "owner": self.owner, "started_at": started_at, "resumed": context.resumed}
+        work = asyncio.ensure_future(job.func(context))
+        heartbeat = asyncio.create_task(self._heartbeat(job, work), name=f"job-heartbeat-{job.name}")
+        release: Optional[dict] = None
+        try:
+            result = await asyncio.shield(work)
+            finished_at = datetime.utcnow()
+            run.update(status="succeeded", result=result)
+            release = {"next_run_at": job.schedule.next_after(finished_at), "checkpoint": None}
+        except asyncio.CancelledError:
+            if not heartbeat.done():
+                # Kapanış: iş hemen başka bir worker'da, kaydedilen ilerlemeden devam eder
+                work.cancel()
+                run.update(status="interrupted")
+                release = {}
+                raise
+            # Kira başka worker'a geçti (heartbeat işi durdurdu): ilerleme onun, bırakılacak bir şey yok
+            run.update(status="lease_lost")
+        except LeaseLost:
+            run.update(status="lease_lost")
+        except Exception as e:
+            logger.error(f"'{job.name}' işi başarısız: {str(e)}")
+            run.update(status="failed", error=str(e) or type(e).__name__)
+            # İlerleme korunur; yeniden deneme kaldığı yerden başlar
+            release = {"next_run_at": datetime.utcnow() + timedelta(seconds=job.retry_seconds)}
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(work, heartbeat, return_exceptions=True)
+            run.update(finished_at=datetime.utcnow(), duration_ms=round((time.perf_counter() - started) * 1000))
+            if release is not None:
+                await self.store.release(job.name, self.owner, {
+                    **release,
+                    "last_status": run["status"],
+                    "last_finished_at": run["finished_at"],
+                    "last_duration_ms": run["duration_ms"],
+                    "last_error": run.get("error"),
+                })
+                if "next_run_at" in release:
+                    self._next_run[job.name] = release["next_run_at"]
+            await self.store.record_run(run)
+            self._running.pop(job.name, None)
+            logger.info(f"'{job.name}' işi: {run['status']} ({run['duration_ms']} ms)")
+        return run
@@ -1,25 +1,342 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Depends, Request, Query, UploadFile, File
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import math
+import time
+import uuid
+import asyncio
 import logging
+from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+from dataclasses import asdict
 from bson import ObjectId
 
+import jwt
+import jobs
+import pagination
+from auth import TokenClaims, decode_token, ensure_apartment, ensure_building, ensure_user, issue_tokens, \
+    optional_claims, require_admin, require_claims, routing_claims
+import text_search
+import onboarding
+from logs import REQUEST_ID_HEADER, RequestLogMiddleware, setup_logging
+import payments
+from notifications import OutboxWorker, StubNotificationSender, new_delivery
+from portfolio import PortfolioRefresher
+from rate_limit import BucketLimit, InMemoryBucketStore, MongoBucketStore, RateLimiter, RateLimitMiddleware
+from receipts import FORMATS as RECEIPT_FORMATS, ReceiptRenderer, receipt_fields, receipt_key
+from scheduler import InMemoryJobStore, JobStore, MongoJobStore, Scheduler
+from repositories import PORTFOLIO_SORT_FIELDS, STATUS_FEATURES, TOMBSTONE_RETENTION, DuplicateIndexKeys, \
+    Repositories, empty_read_stats
+from singleflight import SingleFlight
+from storage import ALLOWED_CONTENT_TYPES, LocalObjectStore, RangeNotSatisfiable, UploadTooLarge, \
+    content_type_for, parse_range
+from tenancy import DEFAULT_TENANT, TenantRouter
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+logger = logging.getLogger(__name__)
+
+
+def create_repositories(database, users_database=None) -> Repositories:
+    """REPOSITORY_BACKEND=memory ile tamamen bellekte çalışır (testler, benchmark'lar)"""
+    if database is None:
+        return Repositories.in_memory()
+    # buildings ve building_status okumaları HOT_CACHE_TTL saniye boyunca bellekten servis edilir
+    return Repositories.motor(database, hot_cache_ttl=float(os.environ.get('HOT_CACHE_TTL', '10')),
+                              users_database=users_database)
+
+
+def create_mongo_client(mongo_url: str) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        mongo_url,
+        maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+        minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+    )
+
+
+async def warm_up(clients: List[AsyncIOMotorClient], tenants: TenantRouter, job_store: JobStore) -> None:
+    """Rota tablosunu yükle, bağlantı havuzlarını aç, indeksleri oluştur ve sıcak önbellekleri doldur"""
+    await tenants.load()
+    for client in clients:
+        # Eşzamanlı ping'ler havuzda en az MONGO_MIN_POOL_SIZE bağlantıyı şimdiden açar
+        pings = max(1, client.options.pool_options.min_pool_size)
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(pings)))
+    # İndeks oluşturma idempotenttir, worker'lar aynı anda çağırabilir. Çok worker'lı
+    # dağıtımlarda STARTUP_ENSURE_INDEXES=0 ile kapatılıp `manage.py ensure-indexes` bir kez çalıştırılabilir
+    index_error = None
+    if os.environ.get('STARTUP_ENSURE_INDEXES', '1') == '1':
+        try:
+            await rate_limiter.store.ensure_indexes()
+            await job_store.ensure_indexes()
+            await tenants.fan_out(lambda repositories: repositories.ensure_indexes())
+        except DuplicateIndexKeys as e:
+            # Giriş telefon numarasının tekilliğine dayanır: ısınma tamamlanır ama worker hazır sayılmaz
+            index_error = e
+        except Exception as e:
+            # Örn. eski mükerrer okundu kayıtları benzersiz indeksi engelleyebilir; uygulama yine açılır
+            logger.error(f"İndeks oluşturma hatası: {str(e)}")
+    await tenants.fan_out(lambda repositories: repositories.warm_up())
+    if index_error is not None:
+        raise index_error
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Worker süreci başına kaynaklar. Her worker (uvicorn --workers, gunicorn) log
+    dinleyicisini, Mongo bağlantı havuzlarını ve arka plan görevlerini fork'tan
+    sonra kendi event loop'unda kurar; import sırasında bağlantı ya da iş
+    parçacığı açılmaz. Isınma bitene kadar /readyz 503 döner; kapanışta önce
+    hazırlık düşer, kaynaklar açılış sırasının tersine kapatılır.
+    """
+    app.state.ready = False
+    app.state.startup_error = None
+    async with AsyncExitStack() as stack:
+        # Configure logging: JSON, kuyruk üzerinden ayrı iş parçacığında yazılır
+        log_listener = setup_logging(
+            level=getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+            rate_limit=BucketLimit.parse(os.environ.get('LOG_RATE_LIMIT', '50/10'))
+        )
+        # Kuyrukta kalan kayıtları yazıp dinleyiciyi en son durdur
+        stack.callback(log_listener.stop)
+
+        # Mongo URL'si başına bir bağlantı havuzu: aynı kümedeki kiracılar havuzu paylaşır
+        clients: Dict[str, AsyncIOMotorClient] = {}
+        control_url, database = None, None
+        if os.environ.get('REPOSITORY_BACKEND', 'motor') != 'memory':
+            control_url = os.environ['MONGO_URL']
+            clients[control_url] = create_mongo_client(control_url)
+            stack.callback(clients[control_url].close)
+            database = clients[control_url][os.environ['DB_NAME']]
+            if os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'mongo':
+                rate_limiter.store = MongoBucketStore(database)
+        repositories = create_repositories(database)
+        app.state.repositories = repositories
+        app.state.payment_gateway = create_payment_gateway()
+        stack.callback(receipt_renderer.shutdown)
+
+        def connect_tenant(mongo_url: Optional[str], db_name: str) -> Repositories:
+            mongo_url = mongo_url or control_url
+            if mongo_url not in clients:
+                clients[mongo_url] = create_mongo_client(mongo_url)
+                stack.callback(clients[mongo_url].close)
+            # Kullanıcılar (giriş) kiracıdan bağımsız olarak kontrol veritabanında kalır
+            return create_repositories(clients[mongo_url][db_name], users_database=database)
+
+        # Duyuru bildirimleri: her kiracının outbox kayıtlarını arka planda sakinlere dağıtan worker
+        # (kayıtlar kiralanarak alındığı için tüm worker süreçlerinde güvenle çalışır)
+        notification_sender = StubNotificationSender()
+        outbox_workers: Dict[str, OutboxWorker] = {}
+        # Taşınan kiracıların durdurulan eski worker'ları: event loop görevleri zayıf referansla tuttuğundan
+        # referans burada saklanır, kapanışta beklenir
+        stopping: Set[asyncio.Task] = set()
+
+        def stopped(task: asyncio.Task) -> None:
+            stopping.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Outbox worker durdurma hatası: {str(task.exception())}")
+
+        def start_outbox_worker(tenant_id: str, tenant_repositories: Repositories) -> None:
+            previous = outbox_workers.get(tenant_id)
+            if previous is not None:
+                # Kiracı başka bir veritabanına taşındı
+                task = asyncio.create_task(previous.stop(), name=f"outbox-stop-{tenant_id}")
+                stopping.add(task)
+                task.add_done_callback(stopped)
+            outbox_workers[tenant_id] = OutboxWorker(
+                tenant_repositories,
+                notification_sender,
+                workers=int(os.environ.get('NOTIFICATION_WORKERS', '2')),
+                batch_size=int(os.environ.get('NOTIFICATION_BATCH_SIZE', '500'))
+            )
+            outbox_workers[tenant_id].start()
+
+        async def stop_outbox_workers() -> None:
+            await asyncio.gather(*(worker.stop() for worker in outbox_workers.values()))
+            # Hatalar done callback'inde loglanır
+            await asyncio.gather(*stopping, return_exceptions=True)
+
+        stack.push_async_callback(stop_outbox_workers)
+        app.state.outbox_workers = outbox_workers
+
+        # Bina -> kiracı veritabanı yönlendirmesi; rota tablosu TENANT_ROUTES_TTL saniyede bir yenilenir
+        tenants = TenantRouter(
+            repositories,
+            routes=database.tenant_routes if database is not None else None,
+            connect=connect_tenant,
+            ttl=float(os.environ.get('TENANT_ROUTES_TTL', '60')),
+            on_tenant=start_outbox_worker
+        )
+        app.state.tenants = tenants
+        # Zamanlanmış işlerin kilitleri ve geçmişi kontrol veritabanında (tüm worker'lar arasında ortak)
+        job_store = MongoJobStore(database) if database is not None else InMemoryJobStore()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(warm_up(list(clients.values()), tenants, job_store),
+                                   timeout=float(os.environ.get('WARMUP_TIMEOUT', '30')))
+            logger.info(f"Isınma tamamlandı ({time.perf_counter() - started:.2f} sn)")
+        except DuplicateIndexKeys as e:
+            # Veri düzeltilene kadar /readyz 503 döner (orkestratör bu worker'a trafik yönlendirmez)
+            logger.critical(f"Isınma hatası: {str(e)}")
+            app.state.startup_error = str(e)
+        except Exception as e:
+            # Soğuk başlamak hiç başlamamaktan iyidir: istekler yine de kabul edilir
+            logger.error(f"Isınma hatası: {str(e) or type(e).__name__}")
+
+        start_outbox_worker(DEFAULT_TENANT, repositories)
+        # super_admin portföy göstergeleri: zamanlanmış işle ve ilk açılışta istek üzerine yenilenir
+        portfolio_refresher = PortfolioRefresher(tenants)
+        app.state.portfolio_refresher = portfolio_refresher
+
+        # Periyodik işler: her çalıştırmayı kilidi kiralayan tek worker yapar.
+        # Zamanlar JOB_<AD>_CRON ile (UTC) değiştirilebilir; boş değer işi kapatır
+        scheduler = Scheduler(job_store, poll_interval=float(os.environ.get('SCHEDULER_POLL_SECONDS', '30')))
+        for name, default_cron, func in (
+            ("legal-escalation", "0 6 * * *", lambda context: jobs.escalate_overdue(tenants, context)),
+            ("portfolio-refresh", "*/10 * * * *",
+             lambda context: jobs.refresh_portfolio(portfolio_refresher, context)),
+            ("archival", "30 3 * * 0", lambda context: jobs.archive_old_records(tenants, context)),
+        ):
+            cron = os.environ.get(f"JOB_{name.upper().replace('-', '_')}_CRON", default_cron)
+            if cron:
+                scheduler.add(name, cron, func)
+        if os.environ.get('SCHEDULER_ENABLED', '1') == '1':
+            scheduler.start()
+        stack.push_async_callback(scheduler.stop)
+        app.state.scheduler = scheduler
+
+        app.state.ready = app.state.startup_error is None
+        try:
+            yield
+        finally:
+            app.state.ready = False
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Sık okunan uçlarda eşzamanlı aynı okumalar tek veritabanı çağrısını paylaşır
+hot_reads = SingleFlight()
+
+# Boş listelerde örnek aidat/duyuru/talep üretimi (geliştirme ve demo için); DEMO_DATA=0 kapatır
+DEMO_DATA = os.environ.get('DEMO_DATA', '1') == '1'
+
+def create_payment_gateway() -> payments.PaymentGateway:
+    """
+    Ödeme sağlayıcısı: zaman aşımı, eşzamanlılık sınırı ve devre kesici ile (yavaş sağlayıcı
+    yalnızca ödemeleri etkiler). Semafor worker'ın event loop'una bağlı olduğundan lifespan içinde kurulur
+    """
+    return payments.PaymentGateway(
+        payments.create_provider(
+            os.environ.get('PAYMENT_PROVIDER', 'stub'),
+            latency=os.environ.get('PAYMENT_STUB_LATENCY', '0')
+        ),
+        timeout=float(os.environ.get('PAYMENT_TIMEOUT', '10')),
+        max_concurrency=int(os.environ.get('PAYMENT_MAX_CONCURRENCY', '20')),
+        retries=int(os.environ.get('PAYMENT_RETRIES', '2')),
+        breaker=payments.CircuitBreaker(
+            failure_threshold=int(os.environ.get('PAYMENT_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.environ.get('PAYMENT_BREAKER_RESET', '30'))
+        )
+    )
+
+# Talep ekleri için dosya deposu (belgelerde yalnızca referans tutulur)
+object_store = LocalObjectStore(
+    Path(os.environ.get('UPLOAD_DIR', ROOT_DIR / 'uploads')),
+    max_upload_bytes=int(os.environ.get('MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+)
+
+# Ödeme makbuzları: süreç havuzunda çizilir, diskte içerik adresli saklanır
+receipt_renderer = ReceiptRenderer(
+    Path(os.environ.get('RECEIPT_DIR', ROOT_DIR / 'receipts')),
+    workers=int(os.environ.get('RECEIPT_WORKERS', '2'))
+)
+
+# İstek sınırlama: RATE_LIMIT_BACKEND=mongo ile kovalar tüm worker'lar arasında ortak
+# (Mongo kovası veritabanı bağlantısıyla birlikte lifespan içinde takılır)
+rate_limiter = RateLimiter(
+    InMemoryBucketStore(),
+    limits={
+        "login": BucketLimit.parse(os.environ.get('RATE_LIMIT_LOGIN', '10/60')),
+        "write": BucketLimit.parse(os.environ.get('RATE_LIMIT_WRITE', '60/60')),
+        "read": BucketLimit.parse(os.environ.get('RATE_LIMIT_READ', '300/60')),
+    },
+    phone_limit=BucketLimit.parse(os.environ.get('RATE_LIMIT_PHONE', '5/300')),
+    max_in_flight=int(os.environ.get('RATE_LIMIT_MAX_IN_FLIGHT', '200'))
+)
+
+# Kiracıyı belirleyen varlık parametreleri (yol ya da sorgu), öncelik sırasıyla
+TENANT_ENTITY_PARAMS = (("apartment_id", "apartment"), ("due_id", "due"), ("request_id", "request"),
+                        ("announcement_id", "announcement"), ("user_id", "user"))
+
+async def request_building(request: Request, tenants: TenantRouter, claims: Optional[TokenClaims]) -> Optional[str]:
+    """İsteğin binası: yoldaki ya da sorgudaki building_id, yoksa varlığın binası, yoksa token'daki bina"""
+    for params in (request.path_params, request.query_params):
+        if params.get("building_id"):
+            return params["building_id"]
+    for params in (request.path_params, request.query_params):
+        for name, kind in TENANT_ENTITY_PARAMS:
+            if params.get(name):
+                building_id = await tenants.building_of(kind, params[name])
+                if building_id is not None:
+                    return building_id
+    return claims.building_id if claims else None
+
+async def get_repositories(request: Request,
+                           claims: Optional[TokenClaims] = Depends(routing_claims)) -> Repositories:
+    """
+    Handler'lara isteğin kiracısının repository kümesini ver (bkz. request_building; testlerde
+    dependency_overrides ile değiştirilebilir). Seçilen kiracı request.state.tenant_id'de tutulur
+    """
+    tenants: TenantRouter = request.app.state.tenants
+    building_id = await request_building(request, tenants, claims)
+    repositories = await tenants.for_building(building_id)
+    request.state.tenant_id = tenants.tenant_of(building_id)
+    return repositories
+
+async def repositories_for(request: Request, repos: Repositories, building_id: Optional[str]) -> Repositories:
+    """Binanın kiracısının repository'leri; istek zaten o kiracıya yönlendiyse verilen `repos`"""
+    tenants: TenantRouter = request.app.state.tenants
+    tenant_id = tenants.tenant_of(building_id)
+    if tenant_id == getattr(request.state, "tenant_id", DEFAULT_TENANT):
+        return repos
+    return await tenants.for_building(building_id)
 
-# Create the main app without a prefix
-app = FastAPI()
+def get_tenants(request: Request) -> TenantRouter:
+    """Tüm kiracılara yayılan raporlar için (super_admin)"""
+    return request.app.state.tenants
+
+def get_payment_gateway(request: Request) -> payments.PaymentGateway:
+    return request.app.state.payment_gateway
+
+async def authorize_apartment(claims: Optional[TokenClaims], repos: Repositories, apartment_id: str) -> None:
+    """Daire erişimi; dairenin binası yalnızca başka daireye bakan bina yöneticisi için okunur"""
+    building_id = None
+    if claims is not None and claims.role == "building_admin" and claims.apartment_id != apartment_id:
+        apartment = await repos.buildings.get_apartment(apartment_id)
+        building_id = apartment.get("building_id") if apartment else None
+    ensure_apartment(claims, apartment_id, building_id)
+
+async def authorize_user(claims: Optional[TokenClaims], repos: Repositories, user_id: Optional[str]) -> Optional[str]:
+    """Kullanıcı erişimi; kullanıcının binası yalnızca başka kullanıcıya bakan bina yöneticisi için okunur"""
+    building_id = None
+    if claims is not None and claims.role == "building_admin" and user_id not in (None, claims.user_id):
+        user = await repos.users.get(user_id)
+        building_id = user.get("building_id") if user else None
+    return ensure_user(claims, user_id, building_id)
+
+def authorize_request(claims: Optional[TokenClaims], request: dict) -> None:
+    """Talebi sahibi ve talebin binasının yöneticisi görebilir"""
+    if claims is not None and request.get("user_id") != claims.user_id and not claims.manages(request.get("building_id")):
+        raise HTTPException(status_code=403, detail="Bu kaynağa erişim yetkiniz yok")
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -91,6 +408,38 @@ class LoginResponse(BaseModel):
     success: bool
     message: str
     user: Optional[dict] = None
+    access_token: Optional[str] = None
+    refresh_token: Optional[str] = None
+    token_type: Optional[str] = None
+    expires_in: Optional[int] = None
+
+# Token Yenileme İsteği
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+# Talep Durum Değişikliği
+class RequestStatusChange(BaseModel):
+    request_id: str
+    status: str
+
+# Duyuru Oluşturma İsteği
+class AnnouncementCreate(BaseModel):
+    title: str = Field(..., min_length=1)
+    content: str = Field(..., min_length=1)
+    category: str = "general"
+    priority: str = "normal"
+    created_by: str = "Site Yönetimi"
+
+# Toplu Talep Durum Güncellemesi
+class BulkRequestStatusUpdate(BaseModel):
+    items: List[RequestStatusChange] = Field(..., min_length=1, max_length=500)
+
+# Toplu Aidat Ödemesi: aidat id'leri ya da tutar (en eski aidattan başlayarak dağıtılır)
+class BulkDuePayment(BaseModel):
+    due_ids: Optional[List[str]] = Field(default=None, min_length=1, max_length=100)
+    amount: Optional[float] = Field(default=None, gt=0)
+    method: str = "test"
+    idempotency_key: Optional[str] = None
 
 # ========== ENDPOINTS ==========
 
@@ -100,33 +449,37 @@ async def root():
 
 # AUTH ENDPOINTS
 @api_router.post("/auth/login", response_model=LoginResponse)
-async def login(request: LoginRequest):
+async def login(request: LoginRequest, repos: Repositories = Depends(get_repositories)):
     """
     Basit giriş sistemi (SMS doğrulama sonra eklenecek)
     """
     try:
+        # Aynı numaraya yönelik deneme/hesap oluşturma selini sınırla
+        retry_after = await rate_limiter.check_phone(request.phone_number)
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=429,
+                detail="Bu numara için çok fazla giriş denemesi, lütfen daha sonra tekrar deneyin",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+        
         # Kullanıcıyı telefon numarasına göre bul
-        user_data = await db.users.find_one({"phone_number": request.phone_number})
+        user_data = await repos.users.find_by_phone(request.phone_number)
         
         if user_data:
             # Kullanıcı var, bilgileri döndür
-            user_data["_id"] = str(user_data["_id"])
-            if user_data.get("building_id"):
-                user_data["building_id"] = str(user_data["building_id"])
-            if user_data.get("apartment_id"):
-                user_data["apartment_id"] = str(user_data["apartment_id"])
-            
             return LoginResponse(
                 success=True,
                 message="Giriş başarılı",
-                user=user_data
+                user=user_data,
+                **issue_tokens(user_data)
             )
         else:
             # Yeni kullanıcı oluştur (demo için)
             # Gerçek uygulamada bu aşama farklı olacak
             
             # İlk binayı bul veya oluştur
-            building = await db.buildings.find_one()
+            building = await repos.buildings.first()
             if not building:
                 # Demo bina oluştur
                 building_data = {
@@ -136,10 +489,8 @@ async def login(request: LoginRequest):
                     "apartment_count": 20,
                     "created_at": datetime.utcnow()
                 }
-                result = await db.buildings.insert_one(building_data)
-                building_id = str(result.inserted_id)
-            else:
-                building_id = str(building["_id"])
+                building = await repos.buildings.create(building_data)
+            building_id = building["_id"]
             
             # Demo daire oluştur
             apartment_data = {
@@ -149,8 +500,8 @@ async def login(request: LoginRequest):
                 "floor": 2,
                 "created_at": datetime.utcnow()
             }
-            apartment_result = await db.apartments.insert_one(apartment_data)
-            apartment_id = str(apartment_result.inserted_id)
+            apartment = await repos.buildings.create_apartment(apartment_data)
+            apartment_id = apartment["_id"]
             
             # Yeni kullanıcı oluştur
             new_user = {
@@ -162,128 +513,246 @@ async def login(request: LoginRequest):
                 "created_at": datetime.utcnow()
             }
             
-            result = await db.users.insert_one(new_user)
-            new_user["_id"] = str(result.inserted_id)
-            new_user["building_id"] = building_id
-            new_user["apartment_id"] = apartment_id
+            try:
+                await repos.users.create(new_user)
+            except DuplicateKeyError:
+                # Aynı numarayla eşzamanlı ilk giriş: kazanan kaydı kullan, bu isteğin dairesi silinir
+                await repos.buildings.delete_apartment(apartment_id)
+                existing = await repos.users.find_by_phone(request.phone_number)
+                if not existing:
+                    raise
+                return LoginResponse(
+                    success=True,
+                    message="Giriş başarılı",
+                    user=existing,
+                    **issue_tokens(existing)
+                )
             
             return LoginResponse(
                 success=True,
                 message="Hesap oluşturuldu ve giriş yapıldı",
-                user=new_user
+                user=new_user,
+                **issue_tokens(new_user)
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Giriş hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/auth/refresh")
+async def refresh_tokens(request: RefreshRequest, repos: Repositories = Depends(get_repositories)):
+    """Yenileme token'ı ile yeni token çifti al; rol/bina bilgisi kullanıcı kaydından tazelenir"""
+    try:
+        payload = decode_token(request.refresh_token, "refresh")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Geçersiz veya süresi dolmuş oturum",
+                            headers={"WWW-Authenticate": "Bearer"})
+    
+    user = await repos.users.get(payload["sub"])
+    if not user:
+        raise HTTPException(status_code=401, detail="Kullanıcı bulunamadı", headers={"WWW-Authenticate": "Bearer"})
+    
+    return {"success": True, **issue_tokens(user)}
+
+@api_router.get("/auth/me")
+async def get_current_session(claims: TokenClaims = Depends(require_claims)):
+    """Oturumdaki kullanıcının kimlik bilgileri (veritabanına gitmeden, token'dan)"""
+    return asdict(claims)
+
 # BUILDING ENDPOINTS
 @api_router.get("/buildings")
-async def get_buildings():
-    """Tüm binaları getir"""
-    buildings = await db.buildings.find().to_list(100)
-    for building in buildings:
-        building["_id"] = str(building["_id"])
-    return buildings
+async def get_buildings(request: Request, repos: Repositories = Depends(get_repositories),
+                        claims: Optional[TokenClaims] = Depends(routing_claims)):
+    """Tüm binaları getir (super_admin için tüm kiracılardan)"""
+    if claims is not None and claims.is_super_admin:
+        pages = await request.app.state.tenants.fan_out(lambda tenant: tenant.buildings.list(100))
+        return [building for buildings in pages.values() for building in buildings]
+    return await repos.buildings.list(100)
+
+def portfolio_sort_value(row: dict, sort: str):
+    value = row
+    for part in PORTFOLIO_SORT_FIELDS[sort].split("."):
+        value = value[part]
+    return value
+
+@api_router.get("/portfolio")
+async def get_portfolio(
+    request: Request,
+    sort: str = "outstanding_debt",
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    tenants: TenantRouter = Depends(get_tenants),
+    claims: TokenClaims = Depends(require_claims)
+):
+    """Tüm binaların özet göstergeleri (super_admin için): tüm kiracılardan, sıralı, keyset sayfalı"""
+    if claims.role != "super_admin":
+        raise HTTPException(status_code=403, detail="Bu işlem için yetkiniz yok")
+    if sort not in PORTFOLIO_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Geçersiz sıralama: {sort}")
+    
+    try:
+        try:
+            after = pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        descending = order == "desc"
+        
+        async def page(repos: Repositories):
+            return await asyncio.gather(repos.portfolio.list(sort, descending, after, limit + 1), repos.portfolio.count())
+        
+        pages = await tenants.fan_out(page)
+        if after is None and not any(rows for rows, _ in pages.values()):
+            # Henüz hiç hesaplanmadı (ilk açılış): şimdi hesapla
+            await request.app.state.portfolio_refresher.refresh()
+            pages = await tenants.fan_out(page)
+        
+        # Her kiracının sayfası aynı düzende sıralı: birleştirip ilk limit + 1 satırı al (null değerler önce)
+        def key(row: dict):
+            value = portfolio_sort_value(row, sort)
+            return value is not None, value, row["_id"]
+        
+        buildings = sorted((row for rows, _ in pages.values() for row in rows), key=key, reverse=descending)
+        total = sum(count for _, count in pages.values())
+        
+        next_cursor = None
+        if len(buildings) > limit:
+            buildings = buildings[:limit]
+            next_cursor = pagination.encode_cursor(
+                portfolio_sort_value(buildings[-1], sort), "building", buildings[-1]["_id"]
+            )
+        
+        return {
+            "buildings": buildings,
+            "total": total,
+            "refreshed_at": buildings[0]["refreshed_at"] if buildings else None,
+            "next_cursor": next_cursor
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Portföy hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/jobs")
+async def get_jobs(request: Request, job: Optional[str] = None, limit: int = Query(50, ge=1, le=500),
+                   claims: TokenClaims = Depends(require_claims)):
+    """Zamanlanmış işlerin durumu ve son çalıştırmaları (super_admin için)"""
+    if claims.role != "super_admin":
+        raise HTTPException(status_code=403, detail="Bu işlem için yetkiniz yok")
+
+    try:
+        store = request.app.state.scheduler.store
+        locks, runs = await asyncio.gather(store.list(), store.history(job, limit))
+        return {"jobs": locks, "runs": runs}
+
+    except Exception as e:
+        logging.error(f"İş geçmişi hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/buildings/{building_id}")
-async def get_building(building_id: str):
+async def get_building(building_id: str, repos: Repositories = Depends(get_repositories)):
     """Belirli bir binayı getir"""
-    building = await db.buildings.find_one({"_id": ObjectId(building_id)})
+    building = await repos.buildings.get(building_id)
     if building:
-        building["_id"] = str(building["_id"])
         return building
     raise HTTPException(status_code=404, detail="Bina bulunamadı")
 
 # USER ENDPOINTS
 @api_router.get("/users/{user_id}")
-async def get_user(user_id: str):
+async def get_user(user_id: str, repos: Repositories = Depends(get_repositories),
+                   claims: Optional[TokenClaims] = Depends(optional_claims)):
     """Kullanıcı bilgilerini getir"""
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    await authorize_user(claims, repos, user_id)
+    user = await repos.users.get(user_id)
     if user:
-        user["_id"] = str(user["_id"])
-        if user.get("building_id"):
-            user["building_id"] = str(user["building_id"])
-        if user.get("apartment_id"):
-            user["apartment_id"] = str(user["apartment_id"])
         return user
     raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
 
 # BUILDING STATUS ENDPOINTS
+def default_building_status() -> dict:
+    """Durum kaydı olmayan bina için varsayılan özellik durumları"""
+    now = datetime.utcnow()
+    return {
+        "wifi": {
+            "status": "active",  # active, inactive, maintenance
+            "last_updated": now
+        },
+        "elevator": {
+            "status": "inactive",
+            "last_updated": now
+        },
+        "electricity": {
+            "status": "active",
+            "last_updated": now
+        },
+        "water": {
+            "status": "active",
+            "last_updated": now
+        },
+        "cleaning": {
+            "status": "active",
+            "last_updated": now
+        },
+        "created_at": now
+    }
+
 @api_router.get("/buildings/{building_id}/status")
-async def get_building_status(building_id: str):
+async def get_building_status(building_id: str, repos: Repositories = Depends(get_repositories)):
     """Bina özelliklerinin durumunu getir"""
     try:
-        # Bina özellik durumunu kontrol et
-        status = await db.building_status.find_one({"building_id": building_id})
-        
-        if not status:
-            # Eğer kayıt yoksa, varsayılan durum oluştur
-            default_status = {
-                "building_id": building_id,
-                "wifi": {
-                    "status": "active",  # active, inactive, maintenance
-                    "last_updated": datetime.utcnow()
-                },
-                "elevator": {
-                    "status": "inactive",
-                    "last_updated": datetime.utcnow()
-                },
-                "electricity": {
-                    "status": "active",
-                    "last_updated": datetime.utcnow()
-                },
-                "water": {
-                    "status": "active",
-                    "last_updated": datetime.utcnow()
-                },
-                "cleaning": {
-                    "status": "active",
-                    "last_updated": datetime.utcnow()
-                },
-                "created_at": datetime.utcnow()
-            }
-            
-            await db.building_status.insert_one(default_status)
-            status = default_status
-        
-        # ObjectId'leri stringe çevir
-        if status.get("_id"):
-            status["_id"] = str(status["_id"])
-        
-        return status
+        # Kayıt yoksa varsayılan durum oluşturulur; aynı anda gelen istekler tek çağrıyı paylaşır
+        return await hot_reads.do(
+            ("building_status", building_id),
+            lambda: repos.buildings.get_or_create_status(building_id, default_building_status())
+        )
         
     except Exception as e:
         logging.error(f"Bina durumu getirme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.put("/buildings/{building_id}/status")
-async def update_building_status(building_id: str, status_update: dict):
+async def update_building_status(building_id: str, status_update: dict,
+                                 repos: Repositories = Depends(get_repositories),
+                                 claims: TokenClaims = Depends(require_admin)):
     """Bina özellik durumunu güncelle (Admin için)"""
+    ensure_building(claims, building_id)
+    
     try:
-        # Mevcut durumu getir
-        current_status = await db.building_status.find_one({"building_id": building_id})
-        
-        if not current_status:
-            raise HTTPException(status_code=404, detail="Bina durumu bulunamadı")
-        
         # Güncelleme yap
+        now = datetime.utcnow()
         update_data = {}
         for key, value in status_update.items():
-            if key in ["wifi", "elevator", "electricity", "water", "cleaning"]:
+            if key in STATUS_FEATURES:
                 update_data[f"{key}.status"] = value
-                update_data[f"{key}.last_updated"] = datetime.utcnow()
-        
+                update_data[f"{key}.last_updated"] = now
         if update_data:
-            await db.building_status.update_one(
-                {"building_id": building_id},
-                {"$set": update_data}
-            )
+            update_data["updated_at"] = now
+        
+        if not update_data:
+            updated_status = await repos.buildings.get_status(building_id)
+            if not updated_status:
+                raise HTTPException(status_code=404, detail="Bina durumu bulunamadı")
+            return updated_status
+        
+        # Güncelleme; önceki ve güncel durum tek çağrıda
+        changed = await repos.buildings.change_status(building_id, update_data)
+        
+        if not changed:
+            raise HTTPException(status_code=404, detail="Bina durumu bulunamadı")
+        
+        previous_status, updated_status = changed
         
-        # Güncellenmiş durumu getir
-        updated_status = await db.building_status.find_one({"building_id": building_id})
-        if updated_status.get("_id"):
-            updated_status["_id"] = str(updated_status["_id"])
+        # Gerçek geçişleri günlük geçmiş kovasına ekle (kesinti analizi için)
+        opening = {f: previous_status[f]["status"] for f in STATUS_FEATURES if f in previous_status}
+        transitions = {f: updated_status[f]["status"] for f in STATUS_FEATURES
+                       if f in status_update and opening.get(f) != updated_status[f]["status"]}
+        if transitions:
+            await repos.buildings.append_status_history(building_id, now, transitions, opening)
         
         return updated_status
         
@@ -293,15 +762,169 @@ async def update_building_status(building_id: str, status_update: dict):
         logging.error(f"Bina durumu güncelleme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/buildings/{building_id}/status/uptime")
+async def get_building_uptime(building_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                              repos: Repositories = Depends(get_repositories)):
+    """Özellik başına çalışma oranı, kesinti sayısı ve ortalama onarım süresi (varsayılan: son 30 gün)"""
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Başlangıç bitişten önce olmalı")
+    
+    try:
+        totals = await repos.buildings.status_uptime(building_id, start, end)
+        
+        features = {}
+        for feature in STATUS_FEATURES:
+            feature_totals = totals.get(feature)
+            if not feature_totals or not feature_totals["observed_ms"]:
+                # Bu aralıkta kayıtlı geçmiş yok
+                features[feature] = {"uptime_percentage": None, "outage_count": 0, "mttr_minutes": None,
+                                     "downtime_minutes": 0, "observed_minutes": 0}
+                continue
+            outages = feature_totals["outages"]
+            features[feature] = {
+                "uptime_percentage": round(100 * (1 - feature_totals["down_ms"] / feature_totals["observed_ms"]), 3),
+                "outage_count": outages,
+                "mttr_minutes": round(feature_totals["down_ms"] / outages / 60000, 1) if outages else None,
+                "downtime_minutes": round(feature_totals["down_ms"] / 60000, 1),
+                "observed_minutes": round(feature_totals["observed_ms"] / 60000, 1)
+            }
+        
+        return {"building_id": building_id, "start": start, "end": end, "features": features}
+        
+    except Exception as e:
+        logging.error(f"Bina çalışma oranı hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ONBOARDING (TOPLU AKTARIM) ENDPOINTS
+MAX_IMPORT_BYTES = 5 * 1024 * 1024
+
+@api_router.post("/buildings/{building_id}/import")
+async def import_building_residents(building_id: str, background_tasks: BackgroundTasks,
+                                    file: UploadFile = File(...), dry_run: bool = False,
+                                    repos: Repositories = Depends(get_repositories),
+                                    claims: TokenClaims = Depends(require_admin)):
+    """Daire ve sakinleri CSV/XLSX dosyasından toplu aktar (Admin için); satır bazlı hata raporu döner"""
+    ensure_building(claims, building_id)
+    
+    try:
+        if not await repos.buildings.get(building_id):
+            raise HTTPException(status_code=404, detail="Bina bulunamadı")
+        
+        content = await file.read(MAX_IMPORT_BYTES + 1)
+        if len(content) > MAX_IMPORT_BYTES:
+            raise HTTPException(status_code=413, detail="Dosya çok büyük")
+        
+        # Ayrıştırma CPU yoğun; event loop'u bloklamasın
+        try:
+            frame = await asyncio.to_thread(onboarding.read_table, content, file.filename or "")
+        except onboarding.ImportFileError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        parsed = await asyncio.to_thread(onboarding.parse, frame)
+        
+        report = await onboarding.import_residents(repos, building_id, parsed, dry_run)
+        if not dry_run and report["apartments"]["inserted"]:
+            # Yeni daireler borç haritasında boş hücre olarak görünsün
+            background_tasks.add_task(refresh_debt_map, repos, building_id=building_id)
+        
+        return {"success": True, **report}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Toplu aktarım hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # DUES (AİDAT) ENDPOINTS
+async def refresh_debt_map(repos: Repositories, apartment_id: Optional[str] = None,
+                           building_id: Optional[str] = None):
+    """Ödeme/tahakkuk sonrası borç haritasını güncelle (yanıt gönderildikten sonra çalışır)"""
+    try:
+        if apartment_id is not None:
+            await repos.dues.refresh_debt_map(apartment_id)
+        elif await repos.dues.get_debt_map(building_id) is not None:
+            await repos.dues.rebuild_debt_map(building_id)
+    except Exception as e:
+        # Harita bir sonraki yeniden oluşturmada düzelir; ödeme akışını etkilemesin
+        logging.warning(f"Borç haritası güncelleme hatası: {str(e)}")
+
+def debt_grid(debt_map: dict, now: datetime) -> dict:
+    """Materialize harita -> blok / kat / daire ızgarası (vadesi geçmiş ay sayısı okuma anında hesaplanır)"""
+    blocks = {}
+    totals = {"outstanding": 0.0, "overdue_months": 0, "apartments_in_debt": 0}
+    for apartment_id, cell in (debt_map.get("apartments") or {}).items():
+        overdue_months = len([d for d in cell.get("unpaid_due_dates", []) if d < now])
+        outstanding = cell.get("outstanding") or 0
+        block = blocks.setdefault(cell.get("block"), {"block": cell.get("block"), "outstanding": 0.0, "floors": {}})
+        floor = block["floors"].setdefault(cell.get("floor"), {"floor": cell.get("floor"), "outstanding": 0.0, "apartments": []})
+        floor["apartments"].append({
+            "apartment_id": apartment_id,
+            "apartment_number": cell.get("apartment_number"),
+            "outstanding": outstanding,
+            "overdue_months": overdue_months
+        })
+        floor["outstanding"] += outstanding
+        block["outstanding"] += outstanding
+        totals["outstanding"] += outstanding
+        totals["overdue_months"] += overdue_months
+        totals["apartments_in_debt"] += 1 if outstanding > 0 else 0
+    
+    def order(value):
+        # Blok/kat bilgisi eksik daireler en sona
+        return (value is None, value if value is not None else 0)
+    
+    for block in blocks.values():
+        for floor in block["floors"].values():
+            floor["apartments"].sort(key=lambda a: order(a["apartment_number"]))
+        block["floors"] = [block["floors"][f] for f in sorted(block["floors"], key=order)]
+    return {
+        "building_id": debt_map.get("building_id"),
+        "refreshed_at": debt_map.get("refreshed_at"),
+        "totals": totals,
+        "blocks": [blocks[b] for b in sorted(blocks, key=lambda b: (b is None, b or ""))]
+    }
+
+@api_router.get("/buildings/{building_id}/debt-map")
+async def get_building_debt_map(building_id: str, refresh: bool = False,
+                                repos: Repositories = Depends(get_repositories),
+                                claims: TokenClaims = Depends(require_admin)):
+    """Bina borç haritası: blok/kat/daire bazında ödenmemiş tutar ve gecikmiş ay sayısı (Admin için)"""
+    ensure_building(claims, building_id)
+    
+    try:
+        # Harita ödeme/tahakkuklarda güncellenir; normalde tek belge okuması
+        debt_map = None if refresh else await hot_reads.do(
+            ("debt_map", building_id), lambda: repos.dues.get_debt_map(building_id)
+        )
+        if debt_map is None:
+            if not await repos.buildings.get(building_id):
+                raise HTTPException(status_code=404, detail="Bina bulunamadı")
+            debt_map = await hot_reads.do(
+                ("debt_map_rebuild", building_id), lambda: repos.dues.rebuild_debt_map(building_id)
+            )
+        
+        return debt_grid(debt_map, datetime.utcnow())
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Borç haritası hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.get("/apartments/{apartment_id}/dues")
-async def get_apartment_dues(apartment_id: str):
+async def get_apartment_dues(apartment_id: str, background_tasks: BackgroundTasks,
+                             repos: Repositories = Depends(get_repositories),
+                             claims: Optional[TokenClaims] = Depends(optional_claims)):
     """Daire için aidat bilgilerini getir"""
+    await authorize_apartment(claims, repos, apartment_id)
+    
     try:
         # Aidat tahakkuklarını getir
-        dues = await db.dues.find({"apartment_id": apartment_id}).sort("due_date", -1).to_list(100)
+        dues = await repos.dues.list_for_apartment(apartment_id, 100)
         
-        if not dues:
+        # Aidatları arşivlenmiş daire yeni hesap değildir: örnek veri üretilmez
+        if not dues and DEMO_DATA and not await repos.dues.has_archived(apartment_id):
             # Demo aidat oluştur
             demo_dues = []
             current_date = datetime.utcnow()
@@ -324,16 +947,10 @@ async def get_apartment_dues(apartment_id: str):
                     "created_at": datetime.utcnow()
                 }
                 
-                result = await db.dues.insert_one(due_doc)
-                due_doc["_id"] = str(result.inserted_id)
                 demo_dues.append(due_doc)
             
-            dues = demo_dues
-        
-        # ObjectId'leri stringe çevir
-        for due in dues:
-            if due.get("_id"):
-                due["_id"] = str(due["_id"])
+            dues = await repos.dues.create_many(demo_dues)
+            background_tasks.add_task(refresh_debt_map, repos, apartment_id=apartment_id)
         
         # Toplam borç hesapla
         total_debt = sum(due["amount"] for due in dues if not due.get("paid"))
@@ -348,50 +965,125 @@ async def get_apartment_dues(apartment_id: str):
         logging.error(f"Aidat getirme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Çekim öncesi aidat ayırmasının süresi: sağlayıcı zaman aşımı ve yeniden denemelerinden uzun olmalı
+PAYMENT_CLAIM_TTL = timedelta(seconds=int(os.environ.get('PAYMENT_CLAIM_SECONDS', '120')))
+
+def payment_key_for(due_ids: List[str]) -> str:
+    """Aidat kümesinin ödeme anahtarı; tekli ve toplu ödeme aynı küme için aynı anahtarı üretir"""
+    return "dues-" + "-".join(sorted(due_ids))
+
+def payment_unavailable(e: payments.PaymentUnavailable) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e),
+                         headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
+async def collect_dues(repos: Repositories, payment_gateway: payments.PaymentGateway, apartment_id: str,
+                       dues: List[dict], payment_key: str, method: str) -> Tuple[payments.PaymentResult, Optional[dict]]:
+    """
+    Aidatları ödeme anahtarına ayır, çek ve ödendi işaretle. Ayırma alınamazsa çekim yapılmadan 409;
+    reddedilen ödemede ayırma bırakılır ve alanlar None döner. Çekimden sonra işaretleme başarısız
+    olursa (ayırma süresi dolup başka ödemeye geçtiyse) tahsilat iade edilir ve 409 döner; işaretleme
+    hata verirse de tahsilat iade edilip ayırma bırakılır ve 500 döner.
+    """
+    due_ids = [due["_id"] for due in dues]
+    now = datetime.utcnow()
+    if not await repos.dues.claim_for_payment(apartment_id, due_ids, payment_key, now + PAYMENT_CLAIM_TTL, now):
+        raise HTTPException(status_code=409, detail="Aidatlardan biri ödenmiş ya da başka bir ödeme için ayrılmış")
+    
+    total = round(sum(due["amount"] for due in dues), 2)
+    try:
+        payment = await payment_gateway.charge(
+            payment_key, total, method=method,
+            metadata={"apartment_id": apartment_id, "due_ids": ",".join(due_ids)}
+        )
+    except payments.PaymentUnavailable as e:
+        # Çağrı sağlayıcıya ulaştıysa sonuç belirsiz: ayırma süresi dolana kadar yalnızca
+        # aynı anahtarla yeniden denenebilir (sağlayıcı ilk sonucu döndürür)
+        if not e.sent:
+            await repos.dues.release_payment_claim(due_ids, payment_key)
+        raise payment_unavailable(e)
+    if not payment.success:
+        await repos.dues.release_payment_claim(due_ids, payment_key)
+        return payment, None
+    
+    now = datetime.utcnow()
+    fields = {
+        "payment_date": now,
+        "payment_method": method,
+        "transaction_id": payment.transaction_id,
+        "updated_at": now
+    }
+    failed = False
+    try:
+        if await repos.dues.mark_many_paid(apartment_id, due_ids, fields, payment_key):
+            return payment, fields
+    except Exception as e:
+        # Yazımın uygulanıp uygulanmadığı bilinmiyor; aşağıda kayıttan bakılır
+        logging.error(f"Ödeme işaretleme hatası ({payment.transaction_id}): {str(e)}")
+        failed = True
+    
+    try:
+        current = await asyncio.gather(*(repos.dues.get(due_id) for due_id in due_ids))
+    except Exception as e:
+        logging.error(f"Ödeme işaretleme kontrol hatası ({payment.transaction_id}): {str(e)}")
+        current, failed = [], True
+    if current and all(due and due.get("paid") and due.get("transaction_id") == payment.transaction_id
+                       for due in current):
+        # Aynı anahtarla eşzamanlı tekrar ya da hata öncesi uygulanmış yazım: tahsilat aidatlara bağlı
+        return payment, {name: current[0].get(name) for name in fields}
+    
+    outcome = "tahsilat iade edildi"
+    try:
+        refund = await payment_gateway.refund(f"refund-{payment.transaction_id}", payment.transaction_id, total)
+        if not refund.success:
+            raise payments.PaymentError(refund.message or "İade reddedildi")
+    except (payments.PaymentError, payments.PaymentUnavailable) as e:
+        logging.error(f"İade hatası ({payment.transaction_id}, {total}): {str(e)}")
+        outcome = "iade başlatılamadı, destek ekibine iletildi"
+    try:
+        await repos.dues.release_payment_claim(due_ids, payment_key)
+    except Exception as e:
+        # Ayırma süresi dolunca kendiliğinden bırakılır
+        logging.error(f"Ödeme ayırması bırakılamadı ({payment_key}): {str(e)}")
+    if failed:
+        raise HTTPException(status_code=500, detail=f"Ödeme kaydedilemedi, {outcome}")
+    raise HTTPException(status_code=409, detail=f"Aidatlardan biri bu sırada ödenmiş; hiçbiri işaretlenmedi, {outcome}")
+
 @api_router.post("/dues/{due_id}/pay")
-async def pay_due(due_id: str, payment_info: dict):
+async def pay_due(due_id: str, payment_info: dict, background_tasks: BackgroundTasks,
+                  repos: Repositories = Depends(get_repositories),
+                  payment_gateway: payments.PaymentGateway = Depends(get_payment_gateway),
+                  claims: Optional[TokenClaims] = Depends(optional_claims)):
     """Aidat ödemesi yap (Test ödeme)"""
     try:
         # Aidat kaydını bul
-        due = await db.dues.find_one({"_id": ObjectId(due_id)})
+        due = await repos.dues.get(due_id)
         
         if not due:
             raise HTTPException(status_code=404, detail="Aidat kaydı bulunamadı")
+        await authorize_apartment(claims, repos, due.get("apartment_id"))
         
         if due.get("paid"):
             raise HTTPException(status_code=400, detail="Bu aidat zaten ödenmiş")
         
-        # Test ödeme - gerçek ödeme entegrasyonu sonra eklenecek
-        # Şimdilik her zaman başarılı kabul ediyoruz
-        payment_successful = True
+        # Aidat önce ödeme anahtarına ayrılır: aynı aidatı içeren tekli ve toplu ödemeler ikinci kez çekim yapmaz
+        payment, fields = await collect_dues(
+            repos, payment_gateway, due["apartment_id"], [due],
+            payment_info.get("idempotency_key") or payment_key_for([due_id]),
+            payment_info.get("method", "test")
+        )
         
-        if payment_successful:
-            # Ödemeyi işaretle
-            await db.dues.update_one(
-                {"_id": ObjectId(due_id)},
-                {
-                    "$set": {
-                        "paid": True,
-                        "payment_date": datetime.utcnow(),
-                        "payment_method": payment_info.get("method", "test"),
-                        "transaction_id": f"TEST-{datetime.utcnow().timestamp()}"
-                    }
-                }
-            )
-            
-            # Güncellenmiş kaydı getir
-            updated_due = await db.dues.find_one({"_id": ObjectId(due_id)})
-            updated_due["_id"] = str(updated_due["_id"])
+        if fields:
+            background_tasks.add_task(refresh_debt_map, repos, apartment_id=due["apartment_id"])
             
             return {
                 "success": True,
                 "message": "Ödeme başarılı",
-                "due": updated_due
+                "due": {**due, **fields, "paid": True}
             }
         else:
             return {
                 "success": False,
-                "message": "Ödeme başarısız"
+                "message": payment.message or "Ödeme başarısız"
             }
         
     except HTTPException:
@@ -400,16 +1092,94 @@ async def pay_due(due_id: str, payment_info: dict):
         logging.error(f"Ödeme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def allocate_dues(unpaid: List[dict], payment: BulkDuePayment) -> List[dict]:
+    """Ödenecek aidatlar, en eski vade önce; tutar verilirse yalnızca tamamı karşılanan aidatlar"""
+    if payment.due_ids is not None:
+        wanted = set(payment.due_ids)
+        selected = [due for due in unpaid if due["_id"] in wanted]
+        missing = wanted - {due["_id"] for due in selected}
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Ödenmemiş aidat bulunamadı: {', '.join(sorted(missing))}")
+        return selected
+    selected, remaining = [], payment.amount
+    for due in unpaid:
+        if due["amount"] > remaining + 0.005:
+            break
+        selected.append(due)
+        remaining -= due["amount"]
+    if not selected:
+        raise HTTPException(status_code=400, detail="Tutar en eski aidatı karşılamıyor")
+    return selected
+
+@api_router.post("/apartments/{apartment_id}/dues/pay")
+async def pay_apartment_dues(apartment_id: str, payment_info: BulkDuePayment, background_tasks: BackgroundTasks,
+                             repos: Repositories = Depends(get_repositories),
+                             payment_gateway: payments.PaymentGateway = Depends(get_payment_gateway),
+                             claims: Optional[TokenClaims] = Depends(optional_claims)):
+    """Birden fazla aidatı tek ödemeyle öde: hepsi ödenir ya da hiçbiri"""
+    await authorize_apartment(claims, repos, apartment_id)
+    if (payment_info.due_ids is None) == (payment_info.amount is None):
+        raise HTTPException(status_code=400, detail="due_ids ya da amount alanlarından biri gönderilmeli")
+    
+    try:
+        unpaid = await repos.dues.list_unpaid(apartment_id, 100)
+        selected = allocate_dues(unpaid, payment_info)
+        total = round(sum(due["amount"] for due in selected), 2)
+        
+        # Aidatlar önce ödeme anahtarına ayrılır: aynı aidat kümesi için tekrarlanan istek ikinci kez çekim yapmaz
+        due_ids = [due["_id"] for due in selected]
+        payment, fields = await collect_dues(
+            repos, payment_gateway, apartment_id, selected,
+            payment_info.idempotency_key or payment_key_for(due_ids), payment_info.method
+        )
+        if not fields:
+            return {
+                "success": False,
+                "message": payment.message or "Ödeme başarısız"
+            }
+        
+        now = datetime.utcnow()
+        background_tasks.add_task(refresh_debt_map, repos, apartment_id=apartment_id)
+        
+        paid_ids = set(due_ids)
+        remaining = [due for due in unpaid if due["_id"] not in paid_ids]
+        return {
+            "success": True,
+            "message": "Ödeme başarılı",
+            "transaction_id": payment.transaction_id,
+            "total_paid": total,
+            "unallocated": round(payment_info.amount - total, 2) if payment_info.amount is not None else 0,
+            "dues": [{**due, **fields, "paid": True} for due in selected],
+            "balance": {
+                "total_debt": round(sum(due["amount"] for due in remaining), 2),
+                "unpaid_count": len(remaining),
+                "overdue_count": len([d for d in remaining if d.get("due_date") and d["due_date"] < now])
+            }
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Toplu ödeme hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/payments/health")
+async def get_payment_health(payment_gateway: payments.PaymentGateway = Depends(get_payment_gateway),
+                             claims: TokenClaims = Depends(require_admin)):
+    """Ödeme sağlayıcısı devre durumu ve gecikme metrikleri (Admin için)"""
+    return payment_gateway.health()
+
 @api_router.get("/dues/{due_id}")
-async def get_due_detail(due_id: str):
+async def get_due_detail(due_id: str, repos: Repositories = Depends(get_repositories),
+                         claims: Optional[TokenClaims] = Depends(optional_claims)):
     """Aidat detayını getir"""
     try:
-        due = await db.dues.find_one({"_id": ObjectId(due_id)})
+        due = await repos.dues.get(due_id)
         
         if not due:
             raise HTTPException(status_code=404, detail="Aidat kaydı bulunamadı")
+        await authorize_apartment(claims, repos, due.get("apartment_id"))
         
-        due["_id"] = str(due["_id"])
         return due
         
     except HTTPException:
@@ -418,19 +1188,63 @@ async def get_due_detail(due_id: str):
         logging.error(f"Aidat detay hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/dues/{due_id}/receipt.{fmt}")
+async def get_due_receipt(due_id: str, fmt: str, request: Request, v: Optional[str] = None,
+                          repos: Repositories = Depends(get_repositories),
+                          claims: Optional[TokenClaims] = Depends(optional_claims)):
+    """Ödeme makbuzu (PDF/PNG); içerik adresli adresten uzun süreli önbellekle servis edilir"""
+    try:
+        if fmt not in RECEIPT_FORMATS:
+            raise HTTPException(status_code=404, detail="Makbuz bulunamadı")
+        
+        due = await repos.dues.get(due_id)
+        
+        if not due or not due.get("paid"):
+            raise HTTPException(status_code=404, detail="Makbuz bulunamadı")
+        await authorize_apartment(claims, repos, due.get("apartment_id"))
+        
+        key = receipt_key(due)
+        if v != key:
+            # Değişmez adrese yönlendir; ödeme düzeltilirse anahtar, dolayısıyla adres de değişir
+            return RedirectResponse(f"{request.url.path}?v={key}", status_code=307)
+        
+        headers = {"ETag": f'"{key}"', "Cache-Control": "private, max-age=31536000, immutable"}
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        
+        path = receipt_renderer.path_for(key, fmt)
+        if not await asyncio.to_thread(path.exists):
+            apartment = await repos.buildings.get_apartment(due["apartment_id"])
+            building = await repos.buildings.get(apartment["building_id"]) if apartment else None
+            await receipt_renderer.render(key, fmt, receipt_fields(due, building, apartment))
+        
+        return FileResponse(
+            path,
+            media_type=RECEIPT_FORMATS[fmt],
+            headers=headers,
+            filename=f"makbuz-{due_id}.{fmt}",
+            content_disposition_type="inline"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Makbuz oluşturma hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ANNOUNCEMENTS (DUYURULAR) ENDPOINTS
 @api_router.get("/buildings/{building_id}/announcements")
-async def get_building_announcements(building_id: str, category: Optional[str] = None):
+async def get_building_announcements(building_id: str, category: Optional[str] = None,
+                                     repos: Repositories = Depends(get_repositories)):
     """Bina duyurularını getir"""
     try:
         # Duyuruları getir
-        query = {"building_id": building_id}
-        if category and category != "all":
-            query["category"] = category
+        if category == "all":
+            category = None
         
-        announcements = await db.announcements.find(query).sort("created_at", -1).to_list(100)
+        announcements = await repos.announcements.list_for_building(building_id, category, 100)
         
-        if not announcements:
+        if not announcements and DEMO_DATA:
             # Demo duyurular oluştur
             demo_announcements = [
                 {
@@ -480,16 +1294,7 @@ async def get_building_announcements(building_id: str, category: Optional[str] =
                 }
             ]
             
-            for announcement in demo_announcements:
-                result = await db.announcements.insert_one(announcement)
-                announcement["_id"] = str(result.inserted_id)
-            
-            announcements = demo_announcements
-        
-        # ObjectId'leri stringe çevir
-        for announcement in announcements:
-            if announcement.get("_id"):
-                announcement["_id"] = str(announcement["_id"])
+            announcements = await repos.announcements.create_many(demo_announcements)
         
         return announcements
         
@@ -497,16 +1302,52 @@ async def get_building_announcements(building_id: str, category: Optional[str] =
         logging.error(f"Duyuru getirme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/buildings/{building_id}/announcements")
+async def create_announcement(building_id: str, announcement: AnnouncementCreate, request: Request,
+                              repos: Repositories = Depends(get_repositories),
+                              claims: TokenClaims = Depends(require_admin)):
+    """Duyuru oluştur (Admin için); sakinlere bildirim arka planda gönderilir"""
+    ensure_building(claims, building_id)
+    
+    try:
+        if not await repos.buildings.get(building_id):
+            raise HTTPException(status_code=404, detail="Bina bulunamadı")
+        
+        now = datetime.utcnow()
+        new_announcement = {
+            "building_id": building_id,
+            **announcement.model_dump(),
+            "created_at": now,
+            # Outbox kaydı duyuruyla aynı belgede: tek atomik yazım
+            "delivery": new_delivery(now)
+        }
+        
+        await repos.announcements.create(new_announcement)
+        worker = request.app.state.outbox_workers.get(request.app.state.tenants.tenant_of(building_id))
+        if worker is not None:
+            worker.wake()
+        
+        return {
+            "success": True,
+            "message": "Duyuru oluşturuldu, bildirimler gönderiliyor",
+            "announcement": new_announcement
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Duyuru oluşturma hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.get("/announcements/{announcement_id}")
-async def get_announcement_detail(announcement_id: str):
+async def get_announcement_detail(announcement_id: str, repos: Repositories = Depends(get_repositories)):
     """Duyuru detayını getir"""
     try:
-        announcement = await db.announcements.find_one({"_id": ObjectId(announcement_id)})
+        announcement = await repos.announcements.get(announcement_id)
         
         if not announcement:
             raise HTTPException(status_code=404, detail="Duyuru bulunamadı")
         
-        announcement["_id"] = str(announcement["_id"])
         return announcement
         
     except HTTPException:
@@ -515,30 +1356,49 @@ async def get_announcement_detail(announcement_id: str):
         logging.error(f"Duyuru detay hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.post("/announcements/{announcement_id}/read")
-async def mark_announcement_read(announcement_id: str, user_id: str):
-    """Duyuruyu okundu olarak işaretle"""
+@api_router.delete("/announcements/{announcement_id}")
+async def delete_announcement(announcement_id: str, repos: Repositories = Depends(get_repositories),
+                              claims: TokenClaims = Depends(require_admin)):
+    """Duyuruyu sil (Admin için); istemciler silmeyi senkronizasyonda öğrenir"""
     try:
-        # Okundu kaydı oluştur veya güncelle
-        read_record = {
-            "announcement_id": announcement_id,
-            "user_id": user_id,
-            "read_at": datetime.utcnow()
-        }
+        if not claims.is_super_admin:
+            # Bina yöneticisi yalnızca kendi binasının duyurusunu silebilir
+            announcement = await repos.announcements.get(announcement_id)
+            if not announcement:
+                raise HTTPException(status_code=404, detail="Duyuru bulunamadı")
+            ensure_building(claims, announcement["building_id"])
         
-        # Mevcut kayıt var mı kontrol et
-        existing = await db.announcement_reads.find_one({
-            "announcement_id": announcement_id,
-            "user_id": user_id
-        })
+        deleted = await repos.announcements.delete(announcement_id)
         
-        if not existing:
-            await db.announcement_reads.insert_one(read_record)
-        else:
-            await db.announcement_reads.update_one(
-                {"announcement_id": announcement_id, "user_id": user_id},
-                {"$set": {"read_at": datetime.utcnow()}}
-            )
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Duyuru bulunamadı")
+        
+        await repos.tombstones.record("announcement", announcement_id, f"building:{deleted['building_id']}",
+                                      datetime.utcnow())
+        
+        return {"success": True, "message": "Duyuru silindi"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Duyuru silme hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/announcements/{announcement_id}/read")
+async def mark_announcement_read(announcement_id: str, user_id: Optional[str] = None,
+                                 repos: Repositories = Depends(get_repositories),
+                                 claims: Optional[TokenClaims] = Depends(optional_claims)):
+    """Duyuruyu okundu olarak işaretle (oturum varsa kullanıcı token'dan)"""
+    user_id = await authorize_user(claims, repos, user_id)
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id gerekli")
+    
+    try:
+        # Okundu kaydı oluştur veya güncelle (tek upsert)
+        read_at = datetime.utcnow()
+        if await repos.announcements.mark_read(announcement_id, user_id, read_at):
+            # İlk okuma: duyurunun okunma sayaçlarını artır
+            await repos.announcements.record_first_read(announcement_id, read_at)
         
         return {"success": True, "message": "Duyuru okundu olarak işaretlendi"}
         
@@ -546,19 +1406,100 @@ async def mark_announcement_read(announcement_id: str, user_id: str):
         logging.error(f"Duyuru okundu işaretleme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/users/{user_id}/announcements/unread-count")
-async def get_unread_announcements_count(user_id: str, building_id: str):
-    """Okunmamış duyuru sayısını getir"""
+def announcement_stats(announcement: dict, resident_count: int) -> dict:
+    """Duyurunun okunma istatistiği; oran binadaki sakin sayısına göre"""
+    stats = announcement.get("stats") or empty_read_stats()
+    return {
+        "announcement_id": announcement["_id"],
+        "title": announcement.get("title"),
+        "priority": announcement.get("priority"),
+        "created_at": announcement.get("created_at"),
+        "read_count": stats["read_count"],
+        "resident_count": resident_count,
+        "read_percentage": round(stats["read_count"] * 100 / resident_count, 1) if resident_count else 0.0,
+        "last_read_at": stats.get("last_read_at"),
+        "time_to_read": stats["time_to_read"]
+    }
+
+@api_router.get("/announcements/{announcement_id}/stats")
+async def get_announcement_stats(announcement_id: str, repos: Repositories = Depends(get_repositories),
+                                 claims: TokenClaims = Depends(require_admin)):
+    """Duyuru okunma istatistiği (Yönetici için)"""
     try:
-        # Tüm duyuruları getir
-        all_announcements = await db.announcements.find({"building_id": building_id}).to_list(100)
+        announcement = await repos.announcements.get(announcement_id)
+        
+        if not announcement:
+            raise HTTPException(status_code=404, detail="Duyuru bulunamadı")
+        ensure_building(claims, announcement["building_id"])
         
-        # Okunan duyuruları getir
-        read_announcements = await db.announcement_reads.find({"user_id": user_id}).to_list(100)
-        read_ids = [r["announcement_id"] for r in read_announcements]
+        resident_count = await repos.users.count_for_building(announcement["building_id"])
         
-        # Okunmamış sayısını hesapla
-        unread_count = len([a for a in all_announcements if str(a["_id"]) not in read_ids])
+        return announcement_stats(announcement, resident_count)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Duyuru istatistik hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/announcements/{announcement_id}/stats/rebuild")
+async def rebuild_announcement_stats(announcement_id: str, repos: Repositories = Depends(get_repositories),
+                                     claims: TokenClaims = Depends(require_admin)):
+    """Okunma sayaçlarını okundu kayıtlarından yeniden hesapla (Yönetici için)"""
+    try:
+        if not claims.is_super_admin:
+            announcement = await repos.announcements.get(announcement_id)
+            if not announcement:
+                raise HTTPException(status_code=404, detail="Duyuru bulunamadı")
+            ensure_building(claims, announcement["building_id"])
+        
+        stats = await repos.announcements.rebuild_stats(announcement_id)
+        
+        if stats is None:
+            raise HTTPException(status_code=404, detail="Duyuru bulunamadı")
+        
+        return {"success": True, "stats": stats}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Duyuru istatistik yeniden hesaplama hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/buildings/{building_id}/announcements/stats")
+async def get_building_announcement_stats(building_id: str, limit: int = Query(20, ge=1, le=100),
+                                          repos: Repositories = Depends(get_repositories),
+                                          claims: TokenClaims = Depends(require_admin)):
+    """Binanın son duyurularının okunma istatistikleri (sayaçlar duyuru belgesinde, tek sorgu)"""
+    ensure_building(claims, building_id)
+    
+    try:
+        announcements, resident_count = await asyncio.gather(
+            repos.announcements.list_stats_for_building(building_id, limit),
+            repos.users.count_for_building(building_id)
+        )
+        
+        return {
+            "resident_count": resident_count,
+            "announcements": [announcement_stats(a, resident_count) for a in announcements]
+        }
+        
+    except Exception as e:
+        logging.error(f"Bina duyuru istatistik hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/users/{user_id}/announcements/unread-count")
+async def get_unread_announcements_count(user_id: str, building_id: Optional[str] = None,
+                                         repos: Repositories = Depends(get_repositories),
+                                         claims: Optional[TokenClaims] = Depends(optional_claims)):
+    """Okunmamış duyuru sayısını getir (oturum varsa bina token'dan)"""
+    await authorize_user(claims, repos, user_id)
+    building_id = building_id or (claims.building_id if claims else None)
+    if not building_id:
+        raise HTTPException(status_code=400, detail="building_id gerekli")
+    
+    try:
+        unread_count = await repos.announcements.unread_count(user_id, building_id)
         
         return {"unread_count": unread_count}
         
@@ -566,18 +1507,118 @@ async def get_unread_announcements_count(user_id: str, building_id: str):
         logging.error(f"Okunmamış duyuru sayısı hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# SYNC (SENKRONİZASYON) ENDPOINTS
+# Token'dan hemen önce başlayıp bitmemiş yazmaları kaçırmamak için örtüşme; istemci kayıtları _id ile birleştirir
+SYNC_OVERLAP = timedelta(seconds=5)
+SYNC_PAGE_SIZE = 500
+# Sayfalanan akışlar ve konum alanları
+SYNC_STREAMS = {"announcements": "updated_at", "dues": "updated_at", "requests": "updated_at", "deleted": "deleted_at"}
+
+async def no_changes() -> List[dict]:
+    return []
+
+@api_router.get("/users/{user_id}/sync")
+async def sync_user_data(user_id: str, since: Optional[str] = None,
+                         repos: Repositories = Depends(get_repositories),
+                         claims: Optional[TokenClaims] = Depends(optional_claims)):
+    """Delta senkronizasyon: son token'dan beri eklenen, değişen ve silinen kayıtlar ile yeni token"""
+    await authorize_user(claims, repos, user_id)
+    try:
+        token = pagination.decode_sync_token(since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        if claims is not None and claims.user_id == user_id:
+            building_id, apartment_id = claims.building_id, claims.apartment_id
+        else:
+            user = await repos.users.get(user_id)
+            if not user:
+                raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
+            building_id, apartment_id = user.get("building_id"), user.get("apartment_id")
+        
+        continuation = bool(token and token["positions"])
+        if continuation:
+            # Devam sayfası: yalnızca sayfası dolan akışlar, kaldıkları (zaman, _id) konumundan;
+            # örtüşme geri sarmaz, böylece aynı anda yazılmış çok sayıda kayıt da sonunda tükenir
+            synced_at, after, reset = token["synced_at"], token["after"], False
+            pending = token["positions"]
+        else:
+            synced_at = datetime.utcnow()
+            # İlk senkronizasyon ya da silme izleri temizlenmiş kadar eski token: her şey baştan
+            reset = token is None or synced_at - token["synced_at"] > TOMBSTONE_RETENTION - SYNC_OVERLAP
+            after = None if reset else token["synced_at"] - SYNC_OVERLAP
+            pending = {stream: (after, None) for stream in SYNC_STREAMS if after is not None or stream != "deleted"}
+        scopes = [f"building:{building_id}", f"apartment:{apartment_id}", f"user:{user_id}"]
+        
+        fetchers = {
+            "announcements": lambda at, doc_id: repos.announcements.list_changed(building_id, at, SYNC_PAGE_SIZE, doc_id),
+            "dues": lambda at, doc_id: repos.dues.list_changed(apartment_id, at, SYNC_PAGE_SIZE, doc_id),
+            "requests": lambda at, doc_id: repos.requests.list_changed(user_id, at, SYNC_PAGE_SIZE, doc_id),
+            "deleted": lambda at, doc_id: repos.tombstones.list_since(scopes, at, SYNC_PAGE_SIZE, doc_id),
+        }
+        # Tek kayıtlık durumlar yalnızca zincirin ilk sayfasında okunur
+        singles = [] if continuation else [repos.legal_processes.get_for_apartment(apartment_id),
+                                           repos.buildings.get_status(building_id)]
+        results = await asyncio.gather(
+            *[fetchers[stream](*pending[stream]) if stream in pending else no_changes() for stream in SYNC_STREAMS],
+            *singles
+        )
+        pages = dict(zip(SYNC_STREAMS, results))
+        legal_process, building_status = results[len(SYNC_STREAMS):] or (None, None)
+        
+        # Dolan sayfaların son konumu devam token'ına yazılır; istemci hemen tekrar çağırır.
+        # Son token zincirin başladığı an: aradaki yazmalar bir sonraki deltada (örtüşmeyle) gelir
+        positions = {
+            stream: (pages[stream][-1][field], pages[stream][-1]["_id"])
+            for stream, field in SYNC_STREAMS.items() if len(pages[stream]) >= SYNC_PAGE_SIZE
+        }
+        
+        def changed(doc: Optional[dict]) -> Optional[dict]:
+            if doc and (after is None or (doc.get("updated_at") and doc["updated_at"] > after)):
+                return doc
+            return None
+        
+        return {
+            "token": pagination.encode_sync_token(synced_at, after, positions),
+            "reset": reset,
+            "has_more": bool(positions),
+            "announcements": pages["announcements"],
+            "dues": pages["dues"],
+            "requests": pages["requests"],
+            "legal_process": changed(legal_process),
+            "building_status": changed(building_status),
+            "deleted": [{"type": t["kind"], "id": t["doc_id"], "deleted_at": t["deleted_at"]} for t in pages["deleted"]]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Senkronizasyon hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # REQUESTS (TALEP & ŞİKAYET) ENDPOINTS
 @api_router.get("/users/{user_id}/requests")
-async def get_user_requests(user_id: str):
+async def get_user_requests(user_id: str, repos: Repositories = Depends(get_repositories),
+                            claims: Optional[TokenClaims] = Depends(optional_claims)):
     """Kullanıcının tüm taleplerinı getir"""
+    await authorize_user(claims, repos, user_id)
+    
     try:
-        requests = await db.requests.find({"user_id": user_id}).sort("created_at", -1).to_list(100)
+        requests = await repos.requests.list_for_user(user_id, 100)
         
-        if not requests:
-            # Demo talepler oluştur
+        # Talepleri arşivlenmiş kullanıcı yeni hesap değildir: örnek veri üretilmez
+        if not requests and DEMO_DATA and not await repos.requests.has_archived(user_id):
+            # Demo talepler oluştur (bina kuyruğunda görünmeleri için kullanıcının binasıyla)
+            if claims is not None and claims.user_id == user_id:
+                building_id = claims.building_id
+            else:
+                user = await repos.users.get(user_id)
+                building_id = user.get("building_id") if user else None
             demo_requests = [
                 {
                     "user_id": user_id,
+                    "building_id": building_id,
                     "category": "maintenance",
                     "title": "Asansör Arızası",
                     "description": "A Blok asansörü çalışmıyor. Lütfen en kısa sürede bakımını yapın.",
@@ -589,6 +1630,7 @@ async def get_user_requests(user_id: str):
                 },
                 {
                     "user_id": user_id,
+                    "building_id": building_id,
                     "category": "cleaning",
                     "title": "Merdiven Temizliği",
                     "description": "5. kattaki merdiven boşluğu temizlenmeye ihtiyacı var.",
@@ -601,6 +1643,7 @@ async def get_user_requests(user_id: str):
                 },
                 {
                     "user_id": user_id,
+                    "building_id": building_id,
                     "category": "security",
                     "title": "Güvenlik Kamerası Sorunu",
                     "description": "Giriş kapısındaki güvenlik kamerası çalışmıyor.",
@@ -612,16 +1655,7 @@ async def get_user_requests(user_id: str):
                 }
             ]
             
-            for request in demo_requests:
-                result = await db.requests.insert_one(request)
-                request["_id"] = str(result.inserted_id)
-            
-            requests = demo_requests
-        
-        # ObjectId'leri stringe çevir
-        for request in requests:
-            if request.get("_id"):
-                request["_id"] = str(request["_id"])
+            requests = await repos.requests.create_many(demo_requests)
         
         return requests
         
@@ -629,24 +1663,90 @@ async def get_user_requests(user_id: str):
         logging.error(f"Talep getirme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/buildings/{building_id}/requests")
+async def get_building_requests(
+    building_id: str,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    repos: Repositories = Depends(get_repositories),
+    claims: TokenClaims = Depends(require_admin)
+):
+    """Bina talep kuyruğu (Yönetici için): filtreli, keyset sayfalı, durum sayılarıyla"""
+    ensure_building(claims, building_id)
+    
+    try:
+        try:
+            after = pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        filters = {"status": status, "priority": priority, "category": category}
+        
+        # Sayfa ve sayılar iki bağımsız indeksli sorgu, paralel çalışır
+        requests, counts = await asyncio.gather(
+            repos.requests.list_for_building(building_id, filters, after, limit + 1),
+            repos.requests.count_for_building(building_id, filters)
+        )
+        
+        next_cursor = None
+        if len(requests) > limit:
+            requests = requests[:limit]
+            next_cursor = pagination.encode_cursor(requests[-1]["created_at"], "request", requests[-1]["_id"])
+        
+        return {
+            "requests": requests,
+            "counts": counts,
+            "next_cursor": next_cursor
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Bina talep kuyruğu hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.post("/requests")
-async def create_request(request_data: dict):
-    """Yeni talep oluştur"""
+async def create_request(request_data: dict, request: Request, repos: Repositories = Depends(get_repositories),
+                         claims: Optional[TokenClaims] = Depends(optional_claims)):
+    """Yeni talep oluştur (oturum varsa kullanıcı ve bina token'dan)"""
     try:
+        # Görseller belgeye gömülmez; dosyalar /requests/{id}/attachments ile yüklenir
+        images = request_data.get("images", [])
+        if any(not isinstance(image, str) or image.startswith("data:") for image in images):
+            raise HTTPException(
+                status_code=400,
+                detail="Görseller talep oluşturulduktan sonra ek olarak yüklenmelidir"
+            )
+        
+        # Talebi kullanıcının binasına bağla (yönetici kuyruğu building_id üzerinden çalışır)
+        user_id = await authorize_user(claims, repos, request_data.get("user_id"))
+        if claims is not None and user_id == claims.user_id:
+            building_id = claims.building_id
+        else:
+            # Bina yalnızca kayıtlı kullanıcıdan gelir; gövdedeki building_id kiracı seçtirmez
+            user = await repos.users.get(user_id) if user_id else None
+            building_id = user.get("building_id") if user else None
+        # Talep binanın kiracısına yazılır (token'sız istek yolundan kiracı seçilemez)
+        repos = await repositories_for(request, repos, building_id)
+        
         new_request = {
-            "user_id": request_data.get("user_id"),
+            "user_id": user_id,
+            "building_id": building_id,
             "category": request_data.get("category"),
             "title": request_data.get("title"),
             "description": request_data.get("description"),
             "status": "received",
             "priority": request_data.get("priority", "normal"),
-            "images": request_data.get("images", []),
+            "images": images,
+            "attachments": [],
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
         
-        result = await db.requests.insert_one(new_request)
-        new_request["_id"] = str(result.inserted_id)
+        await repos.requests.create(new_request)
         
         return {
             "success": True,
@@ -654,20 +1754,23 @@ async def create_request(request_data: dict):
             "request": new_request
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Talep oluşturma hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/requests/{request_id}")
-async def get_request_detail(request_id: str):
+async def get_request_detail(request_id: str, repos: Repositories = Depends(get_repositories),
+                             claims: Optional[TokenClaims] = Depends(optional_claims)):
     """Talep detayını getir"""
     try:
-        request = await db.requests.find_one({"_id": ObjectId(request_id)})
+        request = await repos.requests.get(request_id)
         
         if not request:
             raise HTTPException(status_code=404, detail="Talep bulunamadı")
+        authorize_request(claims, request)
         
-        request["_id"] = str(request["_id"])
         return request
         
     except HTTPException:
@@ -676,103 +1779,353 @@ async def get_request_detail(request_id: str):
         logging.error(f"Talep detay hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.put("/requests/{request_id}/status")
-async def update_request_status(request_id: str, status_data: dict):
-    """Talep durumunu güncelle (Admin için)"""
+# Talep durum makinesi: received -> in_progress -> resolved (yalnızca ileri yönde)
+REQUEST_STATUS_FLOW = ["received", "in_progress", "resolved"]
+
+def allowed_previous_statuses(new_status: str) -> List[str]:
+    """Hedef duruma hangi durumlardan geçilebilir"""
+    return REQUEST_STATUS_FLOW[:REQUEST_STATUS_FLOW.index(new_status)]
+
+def admin_building_scope(claims: TokenClaims) -> Optional[str]:
+    """Durum güncellemelerinin kısıtlandığı bina: bina yöneticisi için kendi binası, super_admin için yok"""
+    if claims.is_super_admin:
+        return None
+    if not claims.building_id:
+        raise HTTPException(status_code=403, detail="Bu kaynağa erişim yetkiniz yok")
+    return claims.building_id
+
+def request_status_fields(new_status: str, now: datetime) -> dict:
+    """Durum geçişinde yazılacak alanlar; tüm zaman damgaları aynı andan"""
+    fields = {"status": new_status, "updated_at": now}
+    if new_status == "resolved":
+        fields["resolved_at"] = now
+    return fields
+
+@api_router.put("/requests/status:bulk")
+async def bulk_update_request_status(update: BulkRequestStatusUpdate, request: Request,
+                                     repos: Repositories = Depends(get_repositories),
+                                     claims: TokenClaims = Depends(require_admin)):
+    """Birden fazla talebin durumunu tek seferde güncelle (Admin için; bina yöneticisi yalnızca kendi binası)"""
+    building_scope = admin_building_scope(claims)
+    
     try:
-        new_status = status_data.get("status")
+        now = datetime.utcnow()
+        results: List[dict] = []
+        changes = []
+        seen = set()
+        
+        for item in update.items:
+            result = {"request_id": item.request_id}
+            results.append(result)
+            if item.request_id in seen:
+                result.update(success=False, error="Aynı talep birden fazla kez gönderildi")
+            elif item.status not in REQUEST_STATUS_FLOW:
+                result.update(success=False, error="Geçersiz talep durumu")
+            else:
+                changes.append((
+                    item.request_id,
+                    allowed_previous_statuses(item.status),
+                    request_status_fields(item.status, now)
+                ))
+            seen.add(item.request_id)
+        
+        # Geçerli geçişler kiracı başına tek bulk_write ile uygulanır (bina yöneticisi tek kiracıdadır)
+        if changes:
+            routed = getattr(request.state, "tenant_id", DEFAULT_TENANT)
+            groups: Dict[str, list] = {routed: changes}
+            if building_scope is None:
+                # super_admin: talepler farklı kiracılarda olabilir; bulunamayanlar isteğin kiracısında kalır
+                tenants: TenantRouter = request.app.state.tenants
+                buildings = await asyncio.gather(*(tenants.building_of("request", change[0]) for change in changes))
+                groups = {}
+                for change, building_id in zip(changes, buildings):
+                    groups.setdefault(tenants.tenant_of(building_id) if building_id else routed, []).append(change)
+            outcomes = {}
+            for tenant_id, group in groups.items():
+                group_repos = repos if tenant_id == routed else request.app.state.tenants.repositories(tenant_id)
+                outcomes.update(await group_repos.requests.transition_many(group, building_scope))
+            targets = {request_id: fields for request_id, _, fields in changes}
+            for result in results:
+                if "success" in result:
+                    continue
+                fields = targets[result["request_id"]]
+                updated, current_status = outcomes[result["request_id"]]
+                if updated:
+                    result.update(success=True, status=fields["status"])
+                elif current_status is None:
+                    result.update(success=False, error="Talep bulunamadı")
+                else:
+                    result.update(
+                        success=False,
+                        status=current_status,
+                        error=f"Geçersiz durum geçişi: {current_status} → {fields['status']}"
+                    )
+        
+        updated_count = sum(1 for result in results if result["success"])
         
-        update_data = {
-            "status": new_status,
-            "updated_at": datetime.utcnow()
+        return {
+            "success": updated_count == len(results),
+            "updated": updated_count,
+            "failed": len(results) - updated_count,
+            "results": results
         }
         
-        if new_status == "resolved":
-            update_data["resolved_at"] = datetime.utcnow()
+    except Exception as e:
+        logging.error(f"Toplu talep durum güncelleme hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.put("/requests/{request_id}/status")
+async def update_request_status(request_id: str, status_data: dict,
+                                repos: Repositories = Depends(get_repositories),
+                                claims: TokenClaims = Depends(require_admin)):
+    """Talep durumunu güncelle (Admin için; bina yöneticisi yalnızca kendi binası)"""
+    building_scope = admin_building_scope(claims)
+    
+    try:
+        new_status = status_data.get("status")
         
-        await db.requests.update_one(
-            {"_id": ObjectId(request_id)},
-            {"$set": update_data}
+        if new_status not in REQUEST_STATUS_FLOW:
+            raise HTTPException(status_code=400, detail="Geçersiz talep durumu")
+        
+        # Güncelleme ve güncellenmiş talebi tek çağrıda al; yalnızca geçerli geçişte uygulanır
+        updated_request = await repos.requests.update(
+            request_id,
+            request_status_fields(new_status, datetime.utcnow()),
+            allowed_previous_statuses(new_status),
+            building_scope
         )
         
-        # Güncellenmiş talebi getir
-        updated_request = await db.requests.find_one({"_id": ObjectId(request_id)})
-        if updated_request.get("_id"):
-            updated_request["_id"] = str(updated_request["_id"])
+        if not updated_request:
+            current = await repos.requests.get(request_id)
+            if not current or building_scope not in (None, current.get("building_id")):
+                raise HTTPException(status_code=404, detail="Talep bulunamadı")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Geçersiz durum geçişi: {current['status']} → {new_status}"
+            )
         
         return updated_request
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Talep durum güncelleme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ATTACHMENTS (EKLER) ENDPOINTS
+MAX_ATTACHMENTS_PER_UPLOAD = 10
+
+@api_router.post("/requests/{request_id}/attachments")
+async def upload_request_attachments(request_id: str, files: List[UploadFile] = File(...),
+                                     repos: Repositories = Depends(get_repositories),
+                                     claims: Optional[TokenClaims] = Depends(optional_claims)):
+    """Talebe resim/dosya ekle (multipart); dosyalar diske parça parça yazılır"""
+    saved_keys = []
+    try:
+        if len(files) > MAX_ATTACHMENTS_PER_UPLOAD:
+            raise HTTPException(status_code=400, detail=f"En fazla {MAX_ATTACHMENTS_PER_UPLOAD} dosya yüklenebilir")
+        
+        for upload in files:
+            if upload.content_type not in ALLOWED_CONTENT_TYPES:
+                raise HTTPException(status_code=400, detail=f"Desteklenmeyen dosya türü: {upload.filename}")
+        
+        request = await repos.requests.get(request_id)
+        if not request:
+            raise HTTPException(status_code=404, detail="Talep bulunamadı")
+        authorize_request(claims, request)
+        
+        stored = []
+        for upload in files:
+            meta = await object_store.save_upload(upload, f"requests/{request_id}")
+            saved_keys.append(meta["key"])
+            stored.append((upload.filename, meta))
+        
+        # Küçük resimler thread havuzunda, paralel üretilir
+        try:
+            thumbnail_keys = await asyncio.gather(*[object_store.create_thumbnail(meta["key"]) for _, meta in stored])
+        except Exception:
+            raise HTTPException(status_code=400, detail="Geçersiz resim dosyası")
+        saved_keys.extend(key for key in thumbnail_keys if key)
+        
+        now = datetime.utcnow()
+        attachments = [
+            {
+                "id": uuid.uuid4().hex,
+                "filename": filename,
+                "content_type": meta["content_type"],
+                "size": meta["size"],
+                "sha256": meta["sha256"],
+                "url": f"/api/files/{meta['key']}",
+                "thumbnail_url": f"/api/files/{thumbnail_key}" if thumbnail_key else None,
+                "created_at": now
+            }
+            for (filename, meta), thumbnail_key in zip(stored, thumbnail_keys)
+        ]
+        
+        if not await repos.requests.add_attachments(request_id, attachments, now):
+            raise HTTPException(status_code=404, detail="Talep bulunamadı")
+        
+        return {"success": True, "attachments": attachments}
+        
+    except UploadTooLarge as e:
+        await asyncio.gather(*[object_store.delete(key) for key in saved_keys])
+        raise HTTPException(status_code=413, detail=f"Dosya çok büyük: {e}")
+    except HTTPException:
+        await asyncio.gather(*[object_store.delete(key) for key in saved_keys])
+        raise
+    except Exception as e:
+        await asyncio.gather(*[object_store.delete(key) for key in saved_keys])
+        logging.error(f"Ek yükleme hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/files/{key:path}")
+async def get_file(key: str, request: Request):
+    """Ek dosyayı servis et (Range destekli)"""
+    try:
+        file_stat = await object_store.stat(key)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="Dosya bulunamadı")
+    
+    size = file_stat.st_size
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{file_stat.st_mtime_ns:x}-{size:x}"',
+        # Anahtarlar benzersizdir, içerik hiç değişmez
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    
+    return StreamingResponse(
+        object_store.iter_range(key, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=content_type_for(key),
+        headers=headers
+    )
+
+# SEARCH (ARAMA) ENDPOINTS
+SEARCH_TYPES = {"requests": "request", "announcements": "announcement"}
+
+def search_scope(claims: TokenClaims, building_id: Optional[str],
+                 user_id: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Arama filtrelerinin (bina, talep sahibi) token'a göre zorlanmış hali; başka bina/kullanıcı 403"""
+    if claims.is_super_admin:
+        return building_id, user_id
+    if not claims.building_id or building_id not in (None, claims.building_id):
+        raise HTTPException(status_code=403, detail="Bu kaynağa erişim yetkiniz yok")
+    if claims.is_admin:
+        return claims.building_id, user_id
+    if user_id not in (None, claims.user_id):
+        raise HTTPException(status_code=403, detail="Bu kaynağa erişim yetkiniz yok")
+    return claims.building_id, claims.user_id
+
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=2),
+    types: str = "requests,announcements",
+    building_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    sort: str = Query("relevance", pattern="^(relevance|recent)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=50),
+    repos: Repositories = Depends(get_repositories),
+    claims: TokenClaims = Depends(require_claims)
+):
+    """
+    Talep ve duyurularda metin araması (Türkçe kök + aksan duyarsız, keyset sayfalama).
+    Arama token'ın binasıyla sınırlıdır; sakinler taleplerde yalnızca kendi taleplerini görür
+    """
+    building_id, user_id = search_scope(claims, building_id, user_id)
+    
+    try:
+        query_terms = text_search.terms(q)
+        if not query_terms:
+            raise HTTPException(status_code=400, detail="Arama ifadesi geçersiz")
+        
+        try:
+            after = pagination.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        kinds = [SEARCH_TYPES[t] for t in types.split(",") if t in SEARCH_TYPES]
+        if not kinds:
+            raise HTTPException(status_code=400, detail="Geçersiz arama türü")
+        
+        filters = {
+            "building_id": building_id,
+            "category": category,
+            "date_from": date_from,
+            "date_to": date_to
+        }
+        
+        # Her tür kendi indeksinden limit+1 sonuç getirir, sonra tek sırada birleştirilir
+        results = []
+        if "announcement" in kinds and status is None:
+            for doc in await repos.announcements.search(query_terms, filters, sort, after, limit + 1):
+                results.append(("announcement", doc))
+        if "request" in kinds:
+            request_filters = {**filters, "user_id": user_id, "status": status}
+            for doc in await repos.requests.search(query_terms, request_filters, sort, after, limit + 1):
+                results.append(("request", doc))
+        
+        key = "score" if sort == "relevance" else "created_at"
+        # Sıra: anahtar azalan, tür artan, _id azalan
+        results.sort(key=lambda r: r[1]["_id"], reverse=True)
+        results.sort(key=lambda r: r[0])
+        results.sort(key=lambda r: r[1][key], reverse=True)
+        
+        page = results[:limit]
+        next_cursor = None
+        if len(results) > limit:
+            kind, last = page[-1]
+            next_cursor = pagination.encode_cursor(last[key], kind, last["_id"])
+        
+        return {
+            "results": [{"type": kind, **doc} for kind, doc in page],
+            "next_cursor": next_cursor
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Arama hatası: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # LEGAL PROCESS (HUKUKİ SÜREÇ) ENDPOINTS
 @api_router.get("/apartments/{apartment_id}/legal-process")
-async def get_legal_process(apartment_id: str):
+async def get_legal_process(apartment_id: str, repos: Repositories = Depends(get_repositories),
+                            claims: Optional[TokenClaims] = Depends(optional_claims)):
     """Daire için hukuki süreç bilgilerini getir"""
+    await authorize_apartment(claims, repos, apartment_id)
+    
     try:
         # Hukuki süreç kaydını kontrol et
-        legal_process = await db.legal_processes.find_one({"apartment_id": apartment_id})
+        legal_process = await repos.legal_processes.get_for_apartment(apartment_id)
         
         if not legal_process:
             # Aidat borcu kontrol et
-            dues = await db.dues.find({
-                "apartment_id": apartment_id,
-                "paid": False
-            }).to_list(100)
+            dues = await repos.dues.list_unpaid(apartment_id, 100)
             
             total_debt = sum(due["amount"] for due in dues)
             overdue_months = len(dues)
             
-            # Eğer 2+ ay gecikme varsa demo süreç oluştur
-            if overdue_months >= 2:
-                legal_process = {
-                    "apartment_id": apartment_id,
-                    "status": "warning_sent",
-                    "total_debt": total_debt,
-                    "overdue_months": overdue_months,
-                    "timeline": [
-                        {
-                            "stage": "warning_sent",
-                            "title": "İhtar Gönderildi",
-                            "description": "Aidat borcu nedeniyle resmi ihtar gönderilmiştir.",
-                            "date": datetime.utcnow(),
-                            "completed": True
-                        },
-                        {
-                            "stage": "legal_notice",
-                            "title": "Yasal Bildirim",
-                            "description": "Ödeme yapılmaması durumunda yasal işlem başlatılacaktır.",
-                            "date": None,
-                            "completed": False
-                        },
-                        {
-                            "stage": "lawyer_assigned",
-                            "title": "Avukata Devredildi",
-                            "description": "Dosya hukuk danışmanına iletilmiştir.",
-                            "date": None,
-                            "completed": False
-                        },
-                        {
-                            "stage": "lawsuit_filed",
-                            "title": "Dava Açıldı",
-                            "description": "Mahkeme sürecine geçilmiştir.",
-                            "date": None,
-                            "completed": False
-                        }
-                    ],
-                    "contact": {
-                        "lawyer_name": "Av. Mehmet Yılmaz",
-                        "lawyer_phone": "0 (212) 555 01 01",
-                        "lawyer_email": "m.yilmaz@hukuk.com"
-                    },
-                    "notes": "Ödeme planı için yönetim ile görüşebilirsiniz.",
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                }
+            # Zamanlanmış iş (jobs.escalate_overdue) henüz çalışmadıysa süreci şimdi aç
+            if overdue_months >= jobs.LEGAL_ESCALATION_MIN_OVERDUE:
+                legal_process = jobs.new_legal_process(apartment_id, total_debt, overdue_months)
                 
-                result = await db.legal_processes.insert_one(legal_process)
-                legal_process["_id"] = str(result.inserted_id)
+                await repos.legal_processes.create(legal_process)
             else:
                 # Borç yok veya az, süreç yok
                 return {
@@ -782,10 +2135,6 @@ async def get_legal_process(apartment_id: str):
                     "message": "Hukuki süreç bulunmamaktadır."
                 }
         
-        # ObjectId'yi stringe çevir
-        if legal_process.get("_id"):
-            legal_process["_id"] = str(legal_process["_id"])
-        
         legal_process["has_process"] = True
         return legal_process
         
@@ -794,14 +2143,14 @@ async def get_legal_process(apartment_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/apartments/{apartment_id}/payment-plan")
-async def get_payment_plan(apartment_id: str):
+async def get_payment_plan(apartment_id: str, repos: Repositories = Depends(get_repositories),
+                           claims: Optional[TokenClaims] = Depends(optional_claims)):
     """Ödeme planı önerisi getir"""
+    await authorize_apartment(claims, repos, apartment_id)
+    
     try:
         # Ödenmemiş aidatları getir
-        dues = await db.dues.find({
-            "apartment_id": apartment_id,
-            "paid": False
-        }).sort("due_date", 1).to_list(100)
+        dues = await repos.dues.list_unpaid(apartment_id, 100)
         
         if not dues:
             return {
@@ -826,10 +2175,7 @@ async def get_payment_plan(apartment_id: str):
             "dues": []
         }
         
-        for due in dues:
-            if due.get("_id"):
-                due["_id"] = str(due["_id"])
-            payment_plan["dues"].append(due)
+        payment_plan["dues"] = dues
         
         return payment_plan
         
@@ -840,21 +2186,38 @@ async def get_payment_plan(apartment_id: str):
 # Include the router in the main app
 app.include_router(api_router)
 
+# CORS'tan önce eklenir: 429 yanıtları da CORS başlıklarını taşır
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=rate_limiter,
+    trust_forwarded=os.environ.get('TRUST_FORWARDED_FOR', '0') == '1'
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# En dışta: istek kimliği ve erişim kaydı, reddedilen (429) istekleri de kapsar
+app.add_middleware(
+    RequestLogMiddleware,
+    sample_rate=float(os.environ.get('LOG_ACCESS_SAMPLE', '1'))
 )
-logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+@app.get("/healthz")
+async def liveness():
+    """Süreç ayakta mı (yük dengeleyici / orkestratör için, istek sınırlamasına takılmaz)"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readiness(request: Request):
+    """Isınma bittiyse 200; açılışta, kapanışta ve veri hatasında 503 (trafik bu worker'a yönlendirilmesin)"""
+    if getattr(request.app.state, "startup_error", None):
+        return JSONResponse({"status": "failed", "detail": request.app.state.startup_error}, status_code=503)
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready"}
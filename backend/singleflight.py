@@ -0,0 +1,37 @@
+"""
+Eşzamanlı aynı okumaların birleştirilmesi (single-flight)
+
+Aynı anahtarla gelen eşzamanlı çağrılar tek bir veritabanı çağrısını paylaşır:
+ilk çağrı işi başlatır, diğerleri aynı sonucu (ya da hatayı) bekler. Sonuç
+saklanmaz; iş bittiği anda anahtar serbest kalır. Bekleyenlerden biri iptal
+edilirse (istemci bağlantıyı kesti) iş diğerleri için sürer.
+
+Paylaşılan sonuç tüm bekleyenlere aynı nesne olarak döner; değiştirilecekse
+çağıran kopyalamalıdır.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """`key` için uçuşta bir çağrı varsa onu bekle, yoksa `loader`'ı başlat"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Tüm bekleyenler iptal edildiyse hata kimse tarafından okunmaz; uyarı basılmasın
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
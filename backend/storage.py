@@ -0,0 +1,159 @@
+"""
+Ek dosya deposu (yerel object store)
+
+Talep ekleri belge içine gömülmez; dosyalar diskte `UPLOAD_DIR` altında
+anahtar (key) ile saklanır, talepte yalnızca referansları tutulur. Yüklemeler
+parça parça diske yazılır, küçük resimler (thumbnail) event loop dışında bir
+thread havuzunda üretilir ve dosyalar HTTP Range istekleriyle servis edilir.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+CHUNK_SIZE = 1024 * 1024
+THUMBNAIL_SIZE = (320, 320)
+
+# İzin verilen içerik türleri ve saklama uzantıları
+ALLOWED_CONTENT_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "application/pdf": ".pdf",
+}
+
+_CONTENT_TYPES_BY_EXTENSION = {extension: content_type for content_type, extension in ALLOWED_CONTENT_TYPES.items()}
+
+_thumbnail_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("THUMBNAIL_WORKERS", "2")),
+                                     thread_name_prefix="thumbnail")
+
+
+def content_type_for(key: str) -> str:
+    return _CONTENT_TYPES_BY_EXTENSION.get(os.path.splitext(key)[1], "application/octet-stream")
+
+
+def is_image(key: str) -> bool:
+    return content_type_for(key).startswith("image/")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _make_thumbnail(source: Path, target: Path) -> None:
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(THUMBNAIL_SIZE)
+        image.convert("RGB").save(target, "JPEG", quality=80, optimize=True)
+
+
+class LocalObjectStore:
+    def __init__(self, root: Path, max_upload_bytes: int = 10 * 1024 * 1024):
+        self.root = Path(root).resolve()
+        self.max_upload_bytes = max_upload_bytes
+
+    def path_for(self, key: str) -> Path:
+        """Anahtarın disk yolu; depo dışına çıkan anahtarları reddet"""
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise FileNotFoundError(key)
+        return path
+
+    async def save_upload(self, upload, prefix: str) -> dict:
+        """
+        UploadFile'ı parça parça diske yaz. Önce geçici dosyaya yazılır,
+        tamamlanınca yerine taşınır; yarım dosya hiç görünmez.
+        """
+        extension = ALLOWED_CONTENT_TYPES[upload.content_type]
+        key = f"{prefix}/{uuid.uuid4().hex}{extension}"
+        path = self.path_for(key)
+        temporary = path.with_suffix(path.suffix + ".part")
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        handle = await asyncio.to_thread(open, temporary, "wb")
+        try:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_upload_bytes:
+                    raise UploadTooLarge(upload.filename)
+                digest.update(chunk)
+                await asyncio.to_thread(handle.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(handle.close)
+            await asyncio.to_thread(temporary.unlink, True)
+            raise
+        await asyncio.to_thread(handle.close)
+        await asyncio.to_thread(os.replace, temporary, path)
+
+        return {
+            "key": key,
+            "size": size,
+            "content_type": upload.content_type,
+            "sha256": digest.hexdigest(),
+        }
+
+    async def create_thumbnail(self, key: str) -> Optional[str]:
+        """Resimler için küçük resim üret (thread havuzunda); resim değilse None"""
+        if not is_image(key):
+            return None
+        source = self.path_for(key)
+        thumbnail_key = f"{key.rsplit('.', 1)[0]}.thumb.jpg"
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_thumbnail_pool, _make_thumbnail, source, self.path_for(thumbnail_key))
+        return thumbnail_key
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.path_for(key).unlink, True)
+
+    async def stat(self, key: str) -> os.stat_result:
+        return await asyncio.to_thread(self.path_for(key).stat)
+
+    async def iter_range(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """[start, end] bayt aralığını parça parça oku"""
+        handle = await asyncio.to_thread(open, self.path_for(key), "rb")
+        try:
+            await asyncio.to_thread(handle.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(handle.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(handle.close)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Tek aralıklı `Range: bytes=...` başlığını çöz. Başlık yoksa ya da çoklu
+    aralıksa None (tüm dosya döner); karşılanamazsa RangeNotSatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # bytes=-500: son 500 bayt
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
@@ -0,0 +1,165 @@
+"""
+Kiracı (yönetim şirketi) bazlı veritabanı yönlendirme
+
+Bina verileri (binalar, daireler, aidatlar, duyurular, talepler, hukuki
+süreçler, durum kayıtları) binanın kiracısının veritabanında tutulur. Kiracı
+bir yönetim şirketidir; `tenant_routes` koleksiyonundaki rota belgesi
+şirketin binalarını ve verisinin nerede olduğunu söyler:
+
+    {"_id": "<şirket id>", "db_name": "...", "mongo_url": "mongodb://...", "building_ids": ["..."]}
+
+`mongo_url` yoksa veritabanı kontrol kümesindedir; ayrı bir küme verilirse o
+kümeye ayrı bir bağlantı havuzu açılır. Rota belgesi olmayan binalar varsayılan
+kiracıda (kontrol veritabanı, DB_NAME) kalır; tek kiracılı kurulumda hiçbir şey
+değişmez. Kullanıcılar (giriş, token yenileme) kiracıdan bağımsız olarak
+kontrol veritabanında tutulur.
+
+Rota tablosu bellekte tutulur ve `ttl` saniyede bir yenilenir; büyük bir
+müşteriyi ayrı bir MongoDB'ye taşımak için verisi kopyalanıp rota belgesi
+yazılır, kod değişikliği gerekmez.
+
+Yolunda bina olmayan uçlar (daire, aidat, talep, duyuru, kullanıcı) kiracıyı
+varlığın binasından bulur: varlık ilk istekte kiracılarda aranır ve binası
+bellekte tutulur (varlığın binası değişmez). Bulunamayan id'ler de kısa süre
+hatırlanır; var olmayan id'lerle gelen istekler her seferinde tüm kiracılara
+yayılmaz. Yönlendirilmiş bina yoksa arama yapılmaz.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from repositories import Repositories
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_TENANT = "default"
+
+# Varlık -> bina önbelleğinin en fazla kayıt sayısı (dolunca en eskiler atılır)
+ENTITY_CACHE_SIZE = 50000
+# Bulunamayan varlığın yeniden aranmadan önce beklenen süresi (saniye)
+MISSING_ENTITY_TTL = 5.0
+
+
+def _remember(cache: dict, key, value) -> None:
+    """Sınırlı önbelleğe yaz; dolunca en eski kaydı at"""
+    if key not in cache and len(cache) >= ENTITY_CACHE_SIZE:
+        del cache[next(iter(cache))]
+    cache[key] = value
+
+
+class TenantRouter:
+    def __init__(self, default: Repositories, routes=None,
+                 connect: Optional[Callable[[Optional[str], str], Repositories]] = None,
+                 ttl: float = 60.0, on_tenant: Optional[Callable[[str, Repositories], None]] = None):
+        self.default = default
+        # Kontrol veritabanındaki tenant_routes koleksiyonu; None ise tek kiracı
+        self.routes = routes
+        # (mongo_url, db_name) -> kiracı repository kümesi
+        self.connect = connect
+        self.ttl = ttl
+        # Yeni bir kiracı ilk kez bağlandığında (ör. arka plan worker'ını başlatmak için)
+        self.on_tenant = on_tenant
+        self._buildings: Dict[str, str] = {}
+        self._tenants: Dict[str, Repositories] = {}
+        self._locations: Dict[str, Tuple[Optional[str], str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._flight = SingleFlight()
+        self._entity_buildings: Dict[Tuple[str, str], str] = {}
+        # Bulunamayan varlık -> yeniden aranabileceği an (monotonic)
+        self._missing_entities: Dict[Tuple[str, str], float] = {}
+
+    async def load(self) -> None:
+        """Rota tablosunu oku; yeni ya da taşınmış kiracılar için repository'leri oluştur"""
+        if self.routes is None:
+            return
+        buildings, tenants, locations = {}, {}, {}
+        async for route in self.routes.find({}):
+            tenant_id = str(route["_id"])
+            location = (route.get("mongo_url"), route["db_name"])
+            if self._locations.get(tenant_id) == location:
+                tenants[tenant_id] = self._tenants[tenant_id]
+            else:
+                tenants[tenant_id] = self.connect(*location)
+                if self.on_tenant is not None:
+                    self.on_tenant(tenant_id, tenants[tenant_id])
+            locations[tenant_id] = location
+            for building_id in route.get("building_ids", []):
+                buildings[str(building_id)] = tenant_id
+        self._buildings, self._tenants, self._locations = buildings, tenants, locations
+        self._loaded_at = time.monotonic()
+
+    async def _refresh(self) -> None:
+        if self.routes is None:
+            return
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        try:
+            await self._flight.do("routes", self.load)
+        except Exception as e:
+            if self._loaded_at is None:
+                raise
+            # Eski tabloyla devam et; bir sonraki istekte yeniden denenir
+            logger.error(f"Kiracı rota tablosu yenileme hatası: {str(e)}")
+
+    def tenant_of(self, building_id: Optional[str]) -> str:
+        return self._buildings.get(building_id, DEFAULT_TENANT) if building_id else DEFAULT_TENANT
+
+    async def for_building(self, building_id: Optional[str]) -> Repositories:
+        """Binanın kiracısının repository'leri; bina bilinmiyorsa varsayılan kiracı"""
+        await self._refresh()
+        return self._tenants.get(self.tenant_of(building_id), self.default)
+
+    def repositories(self, tenant_id: str) -> Repositories:
+        return self._tenants.get(tenant_id, self.default)
+
+    async def building_of(self, kind: str, entity_id: str) -> Optional[str]:
+        """
+        Varlığın (`apartment`, `due`, `request`, `announcement`, `user`) binası; yönlendirilmiş
+        bina yoksa I/O yapmadan None. Bulunamayan varlık MISSING_ENTITY_TTL saniye boyunca yeniden aranmaz.
+        """
+        await self._refresh()
+        if not self._buildings:
+            return None
+        key = (kind, entity_id)
+        building_id = self._entity_buildings.get(key)
+        if building_id is None:
+            if self._missing_entities.get(key, 0.0) > time.monotonic():
+                return None
+            building_id = await self._flight.do(f"{kind}:{entity_id}", lambda: self._find_building(kind, entity_id))
+            if building_id is None:
+                _remember(self._missing_entities, key, time.monotonic() + MISSING_ENTITY_TTL)
+            else:
+                self._missing_entities.pop(key, None)
+                _remember(self._entity_buildings, key, building_id)
+        return building_id
+
+    async def _find_building(self, kind: str, entity_id: str) -> Optional[str]:
+        if kind == "user":
+            # Kullanıcılar kontrol veritabanında
+            user = await self.default.users.get(entity_id)
+            return user.get("building_id") if user else None
+        if kind == "due":
+            dues = await self.fan_out(lambda repositories: repositories.dues.get(entity_id))
+            apartment_id = next((due["apartment_id"] for due in dues.values() if due), None)
+            return await self.building_of("apartment", apartment_id) if apartment_id else None
+        lookup = {
+            "apartment": lambda repositories: repositories.buildings.get_apartment(entity_id),
+            "request": lambda repositories: repositories.requests.get(entity_id),
+            "announcement": lambda repositories: repositories.announcements.get(entity_id),
+        }[kind]
+        found = await self.fan_out(lookup)
+        return next((doc.get("building_id") for doc in found.values() if doc), None)
+
+    async def all(self) -> Dict[str, Repositories]:
+        await self._refresh()
+        return {DEFAULT_TENANT: self.default, **self._tenants}
+
+    async def fan_out(self, call: Callable[[Repositories], Awaitable[T]]) -> Dict[str, T]:
+        """Çağrıyı tüm kiracılarda paralel çalıştır (super_admin raporları); sonuçlar kiracı id'sine göre"""
+        tenants = await self.all()
+        results = await asyncio.gather(*(call(repositories) for repositories in tenants.values()))
+        return dict(zip(tenants, results))
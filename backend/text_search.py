@@ -0,0 +1,83 @@
+"""
+Türkçe metin arama yardımcıları
+
+Talep ve duyuru metinleri kayıt sırasında normalize edilip (küçük harf,
+ı/i ş/s ç/c ğ/g ö/o ü/u katlama) hafif bir Türkçe kök bulucudan geçirilir ve
+belgedeki `search_index` alanına yazılır. Mongo text indeksi bu alan üzerinde
+`default_language: "none"` ile çalışır; arama sorgusu da aynı işlemden geçer.
+Böylece "asansörü", "Asansor" ve "ASANSÖR" aynı köke eşlenir.
+"""
+import re
+from typing import Dict, List, Optional
+
+# Türkçe karakter katlama (büyük harfler önce Türkçe kurallarıyla küçültülür)
+_TURKISH_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+_FOLD = str.maketrans({
+    "ı": "i", "ş": "s", "ç": "c", "ğ": "g", "ö": "o", "ü": "u",
+    "â": "a", "î": "i", "û": "u",
+})
+_TOKEN = re.compile(r"[0-9a-z]+")
+
+# Katlanmış halde çekim ekleri, uzundan kısaya
+_SUFFIXES = sorted({
+    "lari", "leri", "lar", "ler",
+    "larin", "lerin", "nin", "nun", "in", "un",
+    "ndan", "nden", "dan", "den", "tan", "ten",
+    "nda", "nde", "da", "de", "ta", "te",
+    "ya", "ye", "yi", "yu", "na", "ne",
+    "si", "su", "sini", "sunu",
+    "i", "u", "a", "e",
+}, key=len, reverse=True)
+_MIN_STEM = 3
+# Ek alındıktan sonra yumuşamış sessizi geri sertleştir (temizliği -> temizlik)
+_HARDEN = {"g": "k", "b": "p", "d": "t"}
+
+TITLE_WEIGHT = 3
+BODY_WEIGHT = 1
+
+
+def normalize(text: Optional[str]) -> str:
+    """Türkçe küçük harfe çevir ve aksanları katla"""
+    if not text:
+        return ""
+    return text.translate(_TURKISH_LOWER).lower().translate(_FOLD)
+
+
+def stem(token: str) -> str:
+    """Hafif Türkçe kök bulucu: en fazla iki çekim ekini at"""
+    stripped = False
+    for _ in range(2):
+        for suffix in _SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM:
+                token = token[:-len(suffix)]
+                stripped = True
+                break
+        else:
+            break
+    if stripped and token[-1] in _HARDEN:
+        token = token[:-1] + _HARDEN[token[-1]]
+    return token
+
+
+def terms(text: Optional[str]) -> List[str]:
+    """Metni normalize edilmiş köklere ayır"""
+    return [stem(token) for token in _TOKEN.findall(normalize(text))]
+
+
+def build_search_index(title: Optional[str], body: Optional[str]) -> Dict[str, str]:
+    """Belgeye yazılacak `search_index` alt belgesi"""
+    return {"title": " ".join(terms(title)), "body": " ".join(terms(body))}
+
+
+def score(search_index: Optional[dict], query_terms: List[str]) -> float:
+    """Bellek içi arama için ağırlıklı terim frekansı skoru (Mongo textScore'a yakın)"""
+    if not search_index or not query_terms:
+        return 0.0
+    wanted = set(query_terms)
+    total = 0.0
+    for field, weight in (("title", TITLE_WEIGHT), ("body", BODY_WEIGHT)):
+        tokens = (search_index.get(field) or "").split()
+        if tokens:
+            hits = sum(1 for token in tokens if token in wanted)
+            total += weight * hits / len(tokens) * len(wanted)
+    return total
@@ -7,8 +7,15 @@ Tests the authentication, building, and user management APIs
 import requests
 import json
 import sys
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
 from datetime import datetime
 
+import httpx
+
 # Backend URL from frontend .env
 BACKEND_URL = "https://smartprop-6.preview.emergentagent.com/api"
 
@@ -489,10 +496,284 @@ class BackendTester:
                     print(f"   ❌ {result['test']}: {result['message']}")
             return False
 
+
+# Oturum akışında beklenen 4xx yanıtları: aynı aidata eşzamanlı iki ödemeden biri
+# ayırmaya (409) ya da ödenmiş aidata (400) takılabilir
+EXPECTED_CLIENT_ERRORS = {("POST /dues/{id}/pay", 400), ("POST /dues/{id}/pay", 409)}
+
+
+class ResidentSimulation:
+    """
+    Eşzamanlı sakin simülasyonu (ayın 1'i yükü)
+
+    Binlerce sanal sakin asyncio + httpx ile gerçekçi oturumlar çalıştırır:
+    giriş, ana sayfa, duyurular, aidat ödeme ve talep oluşturma. Sakinler
+    ramp-up süresi boyunca doğrusal olarak devreye girer; sonunda eşzamanlılık
+    altında doğruluk kontrolleri yapılır.
+    """
+
+    def __init__(self, residents=1000, ramp_up=60.0, concurrency=500,
+                 timeout=30.0, phone_prefix=None, seed=None):
+        self.residents = residents
+        self.ramp_up = ramp_up
+        self.concurrency = concurrency
+        self.timeout = timeout
+        # Her çalıştırma yeni telefon numaraları kullanır, böylece "yeni kullanıcı" yolu da yük altında kalır
+        self.phone_prefix = phone_prefix or f"59{int(time.time()) % 100:02d}"
+        self.random = random.Random(seed)
+
+        self.latencies = defaultdict(list)
+        self.http_errors = defaultdict(int)
+        self.client_errors = defaultdict(int)
+        self.violations = []
+        self.login_ids = defaultdict(set)
+        # Aidat -> başarılı ödeme yanıtlarındaki ve kayıttaki işlem (tahsilat) numaraları
+        self.payment_transactions = defaultdict(set)
+        self.completed_sessions = 0
+
+    def phone_for(self, index):
+        return f"{self.phone_prefix}{index:06d}"
+
+    async def call(self, http, name, method, path, **kwargs):
+        """Tek bir HTTP çağrısı yap, gecikmeyi ve hataları kaydet"""
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, f"{BACKEND_URL}{path}", **kwargs)
+        except httpx.HTTPError as e:
+            self.http_errors[f"{name}: {type(e).__name__}"] += 1
+            return None
+        finally:
+            self.latencies[name].append(time.perf_counter() - started)
+
+        if response.status_code >= 500:
+            self.http_errors[f"{name}: HTTP {response.status_code}"] += 1
+        elif response.status_code >= 400:
+            # 429 dahil: sınırlanan istekler simülasyonu gerçek yükten saptırır
+            self.client_errors[(name, response.status_code)] += 1
+        return response
+
+    def violation(self, rule, details):
+        self.violations.append({"rule": rule, "details": details})
+
+    async def login(self, http, phone):
+        response = await self.call(http, "POST /auth/login", "POST", "/auth/login",
+                                   json={"phone_number": phone, "role": self.random.choice(["tenant", "owner"])})
+        if response is None or response.status_code != 200:
+            return None
+        user = response.json().get("user")
+        if user:
+            self.login_ids[phone].add(user["_id"])
+        return user
+
+    async def session(self, http, index):
+        """Tek bir sakinin oturumu"""
+        phone = self.phone_for(index)
+
+        # Giriş: uygulama çift tetiklemesini taklit et, aynı numara için iki eşzamanlı istek
+        users = await asyncio.gather(self.login(http, phone), self.login(http, phone))
+        user = next((u for u in users if u), None)
+        if not user:
+            return
+
+        user_id = user["_id"]
+        building_id = user["building_id"]
+        apartment_id = user["apartment_id"]
+
+        # Ana sayfa
+        await self.call(http, "GET /buildings", "GET", "/buildings")
+        await self.call(http, "GET /buildings/{id}/status", "GET", f"/buildings/{building_id}/status")
+
+        # Duyurular
+        await self.read_announcements(http, user_id, building_id)
+
+        # Aidat ödeme
+        await self.pay_dues(http, apartment_id)
+
+        # Talep oluşturma
+        response = await self.call(http, "POST /requests", "POST", "/requests", json={
+            "user_id": user_id,
+            "category": self.random.choice(["maintenance", "cleaning", "security"]),
+            "title": f"Simülasyon talebi {index}",
+            "description": "Yük testi sırasında oluşturuldu.",
+            "priority": "normal"
+        })
+        if response is not None and response.status_code == 200:
+            created = response.json().get("request", {})
+            detail = await self.call(http, "GET /requests/{id}", "GET", f"/requests/{created.get('_id')}")
+            if detail is not None and detail.status_code != 200:
+                self.violation("created request not readable", {"request_id": created.get("_id")})
+
+        self.completed_sessions += 1
+
+    async def read_announcements(self, http, user_id, building_id):
+        response = await self.call(http, "GET /buildings/{id}/announcements", "GET",
+                                   f"/buildings/{building_id}/announcements")
+        if response is None or response.status_code != 200:
+            return
+        announcements = response.json()
+
+        unread_path = f"/users/{user_id}/announcements/unread-count"
+        before = await self.call(http, "GET /users/{id}/announcements/unread-count", "GET",
+                                 unread_path, params={"building_id": building_id})
+        if before is None or before.status_code != 200:
+            return
+
+        to_read = announcements[:self.random.randint(1, 3)]
+        results = await asyncio.gather(*[
+            self.call(http, "POST /announcements/{id}/read", "POST",
+                      f"/announcements/{a['_id']}/read", params={"user_id": user_id})
+            for a in to_read
+        ])
+        if any(r is None or r.status_code != 200 for r in results):
+            return
+
+        after = await self.call(http, "GET /users/{id}/announcements/unread-count", "GET",
+                                unread_path, params={"building_id": building_id})
+        if after is None or after.status_code != 200:
+            return
+
+        # Okunmamış sayısı tam olarak okunan duyuru kadar azalmalı
+        expected = before.json()["unread_count"] - len(to_read)
+        if after.json()["unread_count"] != expected:
+            self.violation("unread count mismatch", {
+                "user_id": user_id,
+                "expected": expected,
+                "got": after.json()["unread_count"]
+            })
+
+    async def pay_dues(self, http, apartment_id):
+        response = await self.call(http, "GET /apartments/{id}/dues", "GET", f"/apartments/{apartment_id}/dues")
+        if response is None or response.status_code != 200:
+            return
+        unpaid = [d for d in response.json().get("dues", []) if not d.get("paid")]
+        if not unpaid:
+            return
+
+        due_id = unpaid[0]["_id"]
+        # Çift dokunma: aynı aidat için iki eşzamanlı ödeme, yalnızca biri başarılı olmalı
+        results = await asyncio.gather(*[
+            self.call(http, "POST /dues/{id}/pay", "POST", f"/dues/{due_id}/pay", json={"method": "test"})
+            for _ in range(2)
+        ])
+        transactions = self.payment_transactions[due_id]
+        for r in results:
+            if r is not None and r.status_code == 200 and r.json().get("success"):
+                transactions.add(r.json()["due"].get("transaction_id"))
+        # Aynı anahtarla eşzamanlı iki ödeme de başarılı dönebilir (tek çekim); sayılan kayıttaki işlemdir
+        stored = await self.call(http, "GET /dues/{id}", "GET", f"/dues/{due_id}")
+        if stored is not None and stored.status_code == 200 and stored.json().get("paid"):
+            transactions.add(stored.json().get("transaction_id"))
+
+    async def run(self):
+        print(f"🏘️ Sakin simülasyonu: {self.residents} sakin, {self.ramp_up:.0f} sn ramp-up, "
+              f"en fazla {self.concurrency} eşzamanlı oturum")
+        print(f"📡 Backend URL: {BACKEND_URL}")
+        print("=" * 60)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        started = time.perf_counter()
+
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as http:
+            async def resident(index):
+                # Doğrusal ramp-up: i. sakin ramp_up * i / N saniyede başlar
+                await asyncio.sleep(self.ramp_up * index / max(self.residents, 1))
+                async with semaphore:
+                    try:
+                        await self.session(http, index)
+                    except Exception as e:
+                        self.http_errors[f"session: {type(e).__name__}"] += 1
+
+            await asyncio.gather(*[resident(i) for i in range(self.residents)])
+
+        elapsed = time.perf_counter() - started
+        self.check_invariants()
+        return self.report(elapsed)
+
+    def check_invariants(self):
+        """Eşzamanlılık altında doğruluk kontrolleri"""
+        user_owner = {}
+        for phone, ids in self.login_ids.items():
+            if len(ids) > 1:
+                self.violation("duplicate users", {"phone_number": phone, "user_ids": sorted(ids)})
+            for user_id in ids:
+                if user_id in user_owner and user_owner[user_id] != phone:
+                    self.violation("user shared between phones", {"user_id": user_id})
+                user_owner[user_id] = phone
+
+        for due_id, transactions in self.payment_transactions.items():
+            if len(transactions) > 1:
+                self.violation("double payment", {"due_id": due_id, "transactions": sorted(map(str, transactions))})
+
+    def report(self, elapsed):
+        total_calls = sum(len(v) for v in self.latencies.values())
+        print(f"⏱️ Süre: {elapsed:.1f} sn, {total_calls} istek ({total_calls / max(elapsed, 1e-9):.0f} istek/sn)")
+        print(f"👥 Tamamlanan oturum: {self.completed_sessions}/{self.residents}")
+        print("-" * 60)
+        print(f"{'Endpoint':45} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for name, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+            print(f"{name:45} {len(samples):>6} {pick(0.50):>6.0f}ms {pick(0.95):>6.0f}ms {pick(0.99):>6.0f}ms")
+
+        if self.http_errors:
+            print("-" * 60)
+            for name, count in sorted(self.http_errors.items()):
+                print(f"   ⚠️ {name}: {count}")
+
+        unexpected = {key: count for key, count in self.client_errors.items() if key not in EXPECTED_CLIENT_ERRORS}
+        if self.client_errors:
+            print("-" * 60)
+            for (name, status), count in sorted(self.client_errors.items()):
+                mark = "⚠️" if (name, status) in unexpected else "ℹ️"
+                print(f"   {mark} {name}: HTTP {status}: {count}")
+
+        print("=" * 60)
+        if self.violations:
+            by_rule = defaultdict(list)
+            for v in self.violations:
+                by_rule[v["rule"]].append(v["details"])
+            print("❌ Doğruluk ihlalleri bulundu:")
+            for rule, details in by_rule.items():
+                print(f"   ❌ {rule}: {len(details)} (ör. {details[0]})")
+            return False
+
+        if self.http_errors:
+            print("⚠️ Doğruluk ihlali yok, ancak HTTP hataları oluştu")
+            return False
+
+        if unexpected:
+            print("⚠️ Doğruluk ihlali yok, ancak beklenmeyen 4xx yanıtları oluştu (429: istek sınırına takıldı)")
+            return False
+
+        print("🎉 Simülasyon başarılı: çift ödeme, mükerrer kullanıcı veya okunmamış sayısı hatası yok")
+        return True
+
 def main():
     """Main test runner"""
-    tester = BackendTester()
-    success = tester.run_all_tests()
+    global BACKEND_URL
+
+    parser = argparse.ArgumentParser(description="Bina Yönetim Sistemi backend testleri")
+    parser.add_argument("--url", default=BACKEND_URL, help="Backend API adresi (/api dahil)")
+    parser.add_argument("--simulate", type=int, metavar="N",
+                        help="N sanal sakin ile eşzamanlı simülasyon çalıştır")
+    parser.add_argument("--ramp-up", type=float, default=60.0, help="Tüm sakinlerin devreye girme süresi (sn)")
+    parser.add_argument("--concurrency", type=int, default=500, help="En fazla eşzamanlı oturum")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    BACKEND_URL = args.url.rstrip("/")
+
+    if args.simulate:
+        simulation = ResidentSimulation(
+            residents=args.simulate,
+            ramp_up=args.ramp_up,
+            concurrency=args.concurrency,
+            seed=args.seed
+        )
+        success = asyncio.run(simulation.run())
+    else:
+        tester = BackendTester()
+        success = tester.run_all_tests()
     
     # Return appropriate exit code
     sys.exit(0 if success else 1)
@@ -0,0 +1,151 @@
+"""
+Veritabanı gidiş-dönüş bütçesi testleri için ortak düzen
+
+Uygulama varsayılan olarak bellek içi repository'lerle çalışır; her repository
+çağrısı bir gidiş-dönüş sayılır (Motor uygulamalarında çağrı başına bir komut).
+MONGO_TEST_URL tanımlıysa uygulama gerçek bir MongoDB'ye bağlanır ve sayım
+pymongo komut dinleyicisiyle yapılır. Her iki durumda da yalnızca istek
+yanıtlanana kadar yapılan çağrılar sayılır; yanıt sonrası arka plan görevleri
+(borç haritası yenileme gibi) ve worker'lar bütçeye girmez.
+"""
+import functools
+import inspect
+import os
+import sys
+import uuid
+from dataclasses import fields
+from pathlib import Path
+
+import pytest
+from pymongo import monitoring
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL")
+
+# server import edilmeden önce: .env değerlerinin önüne geçer
+os.environ.update({
+    "REPOSITORY_BACKEND": "motor" if MONGO_TEST_URL else "memory",
+    "MONGO_URL": MONGO_TEST_URL or "mongodb://localhost:27017",
+    "DB_NAME": f"round_trip_test_{uuid.uuid4().hex[:8]}",
+    "JWT_SECRET": "round-trip-budget-test-secret-0123456789",
+    "RATE_LIMIT_BACKEND": "memory",
+    "RATE_LIMIT_LOGIN": "1000/60",
+    "RATE_LIMIT_WRITE": "1000/60",
+    "RATE_LIMIT_READ": "1000/60",
+    "RATE_LIMIT_PHONE": "1000/60",
+    # Önbellek isabetleri sayımı değiştirmesin: bütçeler en kötü durum içindir
+    "HOT_CACHE_TTL": "0",
+    "LOG_LEVEL": "WARNING",
+})
+
+import server  # noqa: E402
+from repositories import Repositories  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+# Sürücünün kendi yönetim komutları; uygulamanın yaptığı gidiş-dönüşler değil
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+
+class RoundTripCounter:
+    """Yalnızca `active` iken kayıt tutar (istek başından yanıtın son parçasına kadar)"""
+
+    def __init__(self):
+        self.active = False
+        self.calls = []
+
+    def record(self, name: str) -> None:
+        if self.active:
+            self.calls.append(name)
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self, counter: RoundTripCounter):
+        self.counter = counter
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self.counter.record(f"{event.command_name} {event.command.get(event.command_name, '')}")
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class CountingRepository:
+    """Bellek içi repository vekili: dışarıdan yapılan her asenkron çağrı bir gidiş-dönüş"""
+
+    def __init__(self, target, counter: RoundTripCounter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name.startswith("_") or not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        async def counted(*args, **kwargs):
+            self._counter.record(f"{type(self._target).__name__}.{name}")
+            return await attribute(*args, **kwargs)
+
+        return counted
+
+
+class CountingApp:
+    """İstek süresince sayacı açan ASGI sarmalayıcı"""
+
+    def __init__(self, app, counter: RoundTripCounter):
+        self.app = app
+        self.counter = counter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_and_stop(message):
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                self.counter.active = False
+            await send(message)
+
+        self.counter.active = True
+        try:
+            await self.app(scope, receive, send_and_stop)
+        finally:
+            self.counter.active = False
+
+
+@pytest.fixture
+def counter():
+    return RoundTripCounter()
+
+
+@pytest.fixture
+def client(counter, monkeypatch):
+    if MONGO_TEST_URL:
+        motor_client = server.AsyncIOMotorClient
+        monkeypatch.setattr(server, "AsyncIOMotorClient",
+                            functools.partial(motor_client, event_listeners=[CommandCounter(counter)]))
+    with TestClient(CountingApp(server.app, counter)) as test_client:
+        state = server.app.state
+        # Bütçeler yalnızca istek yolunu kapsar: arka plan worker'ları durdurulur
+        for worker in state.outbox_workers.values():
+            test_client.portal.call(worker.stop)
+        test_client.portal.call(state.scheduler.stop)
+        if not MONGO_TEST_URL:
+            repositories = state.repositories
+            server.app.dependency_overrides[server.get_repositories] = lambda: Repositories(**{
+                field.name: CountingRepository(getattr(repositories, field.name), counter)
+                for field in fields(repositories)
+            })
+        try:
+            yield test_client
+        finally:
+            server.app.dependency_overrides.clear()
+            if MONGO_TEST_URL:
+                test_client.portal.call(state.repositories.users.collection.database.client.drop_database,
+                                        os.environ["DB_NAME"])
@@ -0,0 +1,47 @@
+"""
+Arşivleme: arşivlenen kayıtlar detayda görünür, boşalan listeler örnek veriyle doldurulmaz
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from archival import ArchivePolicy, run_archival
+
+NOW = datetime(2026, 6, 1)
+
+
+@pytest.fixture
+def archived(client):
+    """Tüm aidatları ve talepleri arşive taşınmış bir sakin"""
+    repositories = server.app.state.repositories
+    old = NOW - timedelta(days=365 * 3)
+    due = client.portal.call(repositories.dues.create_many, [{
+        "apartment_id": "apt-arsiv", "amount": 500.0, "paid": True, "due_date": old, "payment_date": old,
+        "created_at": old
+    }])[0]
+    request = client.portal.call(repositories.requests.create, {
+        "user_id": "user-arsiv", "building_id": "b1", "title": "Musluk", "description": "Damlatıyor",
+        "status": "resolved", "priority": "normal", "created_at": old, "updated_at": old, "resolved_at": old
+    })
+    moved = client.portal.call(run_archival, repositories, ArchivePolicy(), 500, NOW)
+    assert (moved["dues"], moved["requests"]) == (1, 1)
+    return {"due": due, "request": request}
+
+
+def test_archived_accounts_are_not_seeded(client, archived):
+    dues = client.get("/api/apartments/apt-arsiv/dues").json()
+    assert dues["dues"] == [] and dues["total_debt"] == 0
+    assert client.get("/api/users/user-arsiv/requests").json() == []
+    # Arşivlenen kayıtlar detaydan okunmaya devam eder
+    assert client.get(f"/api/dues/{archived['due']['_id']}").json()["paid"] is True
+    assert client.get(f"/api/requests/{archived['request']['_id']}").json()["status"] == "resolved"
+
+
+def test_demo_data_flag(client, monkeypatch):
+    assert len(client.get("/api/apartments/apt-yeni/dues").json()["dues"]) == 6
+
+    monkeypatch.setattr(server, "DEMO_DATA", False)
+    assert client.get("/api/apartments/apt-bos/dues").json()["dues"] == []
+    assert client.get("/api/users/user-bos/requests").json() == []
+    assert client.get("/api/buildings/bina-bos/announcements").json() == []
@@ -0,0 +1,187 @@
+"""
+Yetkilendirme: token'sız çağrılar (401), başka daire/bina kaynakları (403)
+"""
+from dataclasses import replace
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import auth
+import server
+from auth import issue_tokens
+
+
+def bearer(user: dict) -> dict:
+    return {"Authorization": f"Bearer {issue_tokens(user)['access_token']}"}
+
+
+@pytest.fixture
+def site(client):
+    """İki bina; her birinde bir daire, bir sakin ve bir bina yöneticisi"""
+    repositories = server.app.state.repositories
+    now = datetime.utcnow()
+    site = {}
+    for index, name in enumerate(("north", "south")):
+        building = client.portal.call(repositories.buildings.create, {"name": name, "created_at": now})
+        apartment = client.portal.call(repositories.buildings.create_apartment, {
+            "building_id": building["_id"], "block": "A", "apartment_number": 1, "floor": 1, "created_at": now
+        })
+        resident = client.portal.call(repositories.users.create, {
+            "phone_number": f"555100000{index}", "role": "tenant",
+            "building_id": building["_id"], "apartment_id": apartment["_id"]
+        })
+        admin = client.portal.call(repositories.users.create, {
+            "phone_number": f"555200000{index}", "role": "building_admin", "building_id": building["_id"]
+        })
+        due = client.portal.call(repositories.dues.create_many, [{
+            "apartment_id": apartment["_id"], "amount": 750.0, "paid": False, "due_date": now, "created_at": now
+        }])[0]
+        request = client.portal.call(repositories.requests.create, {
+            "user_id": resident["_id"], "building_id": building["_id"], "title": "Asansör", "description": "Arıza",
+            "status": "received", "priority": "normal", "created_at": now, "updated_at": now
+        })
+        site[name] = {"building": building, "apartment": apartment, "resident": resident, "admin": admin,
+                      "due": due, "request": request}
+    return site
+
+
+def admin_routes(place: dict):
+    building_id = place["building"]["_id"]
+    request_id = place["request"]["_id"]
+    return [
+        ("PUT", f"/api/buildings/{building_id}/status", {"json": {"wifi": "maintenance"}}),
+        ("GET", f"/api/buildings/{building_id}/debt-map", {}),
+        ("POST", f"/api/buildings/{building_id}/announcements",
+         {"json": {"title": "Duyuru", "content": "İçerik", "category": "general"}}),
+        ("GET", f"/api/buildings/{building_id}/announcements/stats", {}),
+        ("GET", f"/api/buildings/{building_id}/requests", {}),
+        ("PUT", f"/api/requests/{request_id}/status", {"json": {"status": "resolved"}}),
+        ("PUT", "/api/requests/status:bulk", {"json": {"items": [{"request_id": request_id, "status": "resolved"}]}}),
+        ("GET", "/api/payments/health", {}),
+    ]
+
+
+def test_admin_routes_require_token(client, site):
+    for method, url, kwargs in admin_routes(site["north"]):
+        response = client.request(method, url, **kwargs)
+        assert response.status_code == 401, (method, url, response.text)
+    response = client.post(f"/api/buildings/{site['north']['building']['_id']}/import",
+                           files={"file": ("sakinler.csv", b"block,apartment_number\n", "text/csv")})
+    assert response.status_code == 401
+
+
+def test_admin_routes_reject_residents(client, site):
+    headers = bearer(site["north"]["resident"])
+    for method, url, kwargs in admin_routes(site["north"]):
+        response = client.request(method, url, headers=headers, **kwargs)
+        assert response.status_code == 403, (method, url, response.text)
+
+
+def test_building_admin_is_limited_to_own_building(client, site):
+    headers = bearer(site["north"]["admin"])
+    south = site["south"]
+    for method, url, kwargs in admin_routes(south):
+        if "/api/requests/" in url or url == "/api/payments/health":
+            continue
+        response = client.request(method, url, headers=headers, **kwargs)
+        assert response.status_code == 403, (method, url, response.text)
+
+    # Durum güncellemeleri bina filtresiyle yapılır: başka binanın talebi yok sayılır
+    request_id = south["request"]["_id"]
+    assert client.put(f"/api/requests/{request_id}/status", json={"status": "resolved"},
+                      headers=headers).status_code == 404
+    body = client.put("/api/requests/status:bulk", headers=headers, json={
+        "items": [{"request_id": request_id, "status": "resolved"}]
+    }).json()
+    assert body["results"] == [{"request_id": request_id, "success": False, "error": "Talep bulunamadı"}]
+    assert client.portal.call(server.app.state.repositories.requests.get, request_id)["status"] == "received"
+
+    for url in (f"/api/apartments/{south['apartment']['_id']}/dues",
+                f"/api/dues/{south['due']['_id']}",
+                f"/api/users/{south['resident']['_id']}",
+                f"/api/requests/{south['request']['_id']}"):
+        assert client.get(url, headers=headers).status_code == 403, url
+
+
+def test_building_admin_manages_own_building(client, site):
+    north = site["north"]
+    headers = bearer(north["admin"])
+    assert client.get(f"/api/apartments/{north['apartment']['_id']}/dues", headers=headers).status_code == 200
+    assert client.get(f"/api/users/{north['resident']['_id']}", headers=headers).status_code == 200
+    response = client.put(f"/api/requests/{north['request']['_id']}/status", json={"status": "in_progress"},
+                          headers=headers)
+    assert response.status_code == 200 and response.json()["status"] == "in_progress"
+    created = client.post(f"/api/buildings/{north['building']['_id']}/announcements", headers=headers,
+                          json={"title": "Su kesintisi", "content": "Yarın 10:00", "category": "maintenance"})
+    assert created.status_code == 200, created.text
+
+
+def test_super_admin_reaches_every_building(client, site):
+    admin = client.portal.call(server.app.state.repositories.users.create, {
+        "phone_number": "5559999999", "role": "super_admin"
+    })
+    headers = bearer(admin)
+    south = site["south"]
+    assert client.get(f"/api/buildings/{south['building']['_id']}/requests", headers=headers).status_code == 200
+    response = client.put(f"/api/requests/{south['request']['_id']}/status", json={"status": "resolved"},
+                          headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_resident_cannot_reach_other_apartments(client, site):
+    north, south = site["north"], site["south"]
+    headers = bearer(north["resident"])
+    assert client.get(f"/api/apartments/{north['apartment']['_id']}/dues", headers=headers).status_code == 200
+    for method, url in (("GET", f"/api/apartments/{south['apartment']['_id']}/dues"),
+                        ("GET", f"/api/apartments/{south['apartment']['_id']}/legal-process"),
+                        ("GET", f"/api/dues/{south['due']['_id']}"),
+                        ("POST", f"/api/dues/{south['due']['_id']}/pay"),
+                        ("GET", f"/api/users/{south['resident']['_id']}/requests"),
+                        ("GET", f"/api/requests/{south['request']['_id']}")):
+        kwargs = {"json": {}} if method == "POST" else {}
+        response = client.request(method, url, headers=headers, **kwargs)
+        assert response.status_code == 403, (method, url, response.text)
+    assert client.portal.call(server.app.state.repositories.dues.get, south["due"]["_id"])["paid"] is False
+
+
+def test_delete_announcement_checks_building(client, site):
+    repositories = server.app.state.repositories
+    announcement = client.portal.call(repositories.announcements.create, {
+        "building_id": site["south"]["building"]["_id"], "title": "Toplantı", "content": "Cuma",
+        "created_at": datetime.utcnow()
+    })
+    url = f"/api/announcements/{announcement['_id']}"
+    assert client.delete(url).status_code == 401
+    assert client.delete(url, headers=bearer(site["north"]["admin"])).status_code == 403
+    assert client.delete(f"/api/announcements/{ObjectId()}", headers=bearer(site["south"]["admin"])).status_code == 404
+    assert client.delete(url, headers=bearer(site["south"]["admin"])).status_code == 200
+
+
+def test_anonymous_resident_calls_refused_when_disabled(client, site, monkeypatch):
+    apartment_id = site["north"]["apartment"]["_id"]
+    assert client.get(f"/api/apartments/{apartment_id}/dues").status_code == 200
+
+    disabled = replace(auth.settings(), allow_anonymous=False)
+    monkeypatch.setattr(auth, "settings", lambda: disabled)
+    assert client.get(f"/api/apartments/{apartment_id}/dues").status_code == 401
+    assert client.get(f"/api/apartments/{apartment_id}/dues", headers=bearer(site["north"]["resident"])).status_code == 200
+
+
+def test_concurrent_first_login_uses_the_winner(client, monkeypatch):
+    users = server.app.state.repositories.users
+    buildings = server.app.state.repositories.buildings
+    find_by_phone = users.find_by_phone
+
+    async def lost_race(phone_number):
+        # İlk okumadan sonra aynı numarayla başka bir giriş hesabı oluşturdu
+        monkeypatch.setattr(users, "find_by_phone", find_by_phone)
+        await users.create({"phone_number": phone_number, "role": "tenant", "name": "Kazanan"})
+        return None
+
+    monkeypatch.setattr(users, "find_by_phone", lost_race)
+    response = client.post("/api/auth/login", json={"phone_number": "5553330000", "role": "tenant"})
+    assert response.status_code == 200, response.text
+    assert response.json()["user"]["name"] == "Kazanan"
+    # Kaybeden isteğin örnek dairesi kalmaz
+    assert buildings.apartments.docs == {}
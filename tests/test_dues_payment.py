@@ -0,0 +1,220 @@
+"""
+Aidat ödemesi: çekim öncesi ayırma, çakışmada iade, tutara göre dağıtım ve
+işlem (transaction) desteklemeyen sunucuda toplu işaretleme
+"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import OperationFailure
+
+import payments
+import server
+from repositories import MotorDueRepository
+from server import BulkDuePayment, allocate_dues, payment_key_for
+
+APARTMENT_ID = "apt-1"
+
+
+@pytest.fixture
+def provider(client, monkeypatch):
+    provider = payments.StubPaymentProvider(decline_methods={"declined"})
+    monkeypatch.setattr(server.app.state, "payment_gateway", payments.PaymentGateway(provider))
+    return provider
+
+
+@pytest.fixture
+def dues(client):
+    start = datetime.utcnow() - timedelta(days=90)
+    return client.portal.call(server.app.state.repositories.dues.create_many, [
+        {"apartment_id": APARTMENT_ID, "amount": 400.0, "paid": False, "due_date": start + timedelta(days=30 * i),
+         "created_at": start} for i in range(3)
+    ])
+
+
+def get_due(client, due_id: str) -> dict:
+    return client.portal.call(server.app.state.repositories.dues.get, due_id)
+
+
+def test_claimed_due_is_not_charged_again(client, provider, dues):
+    repositories = server.app.state.repositories
+    now = datetime.utcnow()
+    # Tekli ödeme sürerken (ayırma aktif) aynı aidatı içeren toplu ödeme gelir
+    assert client.portal.call(repositories.dues.claim_for_payment, APARTMENT_ID, [dues[0]["_id"]],
+                              payment_key_for([dues[0]["_id"]]), now + timedelta(minutes=2), now)
+
+    response = client.post(f"/api/apartments/{APARTMENT_ID}/dues/pay",
+                           json={"due_ids": [due["_id"] for due in dues]})
+    assert response.status_code == 409
+    response = client.post(f"/api/dues/{dues[0]['_id']}/pay", json={"idempotency_key": "baska-istemci"})
+    assert response.status_code == 409
+    assert provider.charges == {}
+    # Ayırılmamış aidatlar da bırakılmış olmalı
+    assert client.post(f"/api/dues/{dues[1]['_id']}/pay", json={}).json()["success"] is True
+
+
+def test_single_then_bulk_charges_each_due_once(client, provider, dues):
+    assert client.post(f"/api/dues/{dues[0]['_id']}/pay", json={}).json()["success"] is True
+    body = client.post(f"/api/apartments/{APARTMENT_ID}/dues/pay", json={"amount": 2000}).json()
+    assert [due["_id"] for due in body["dues"]] == [dues[1]["_id"], dues[2]["_id"]]
+    assert sorted(result.transaction_id for result in provider.charges.values()) == sorted(
+        {get_due(client, due["_id"])["transaction_id"] for due in dues}
+    )
+    assert "payment_claim" not in get_due(client, dues[0]["_id"])
+
+
+def test_lost_claim_after_charge_is_refunded(client, provider, dues, monkeypatch):
+    repositories = server.app.state.repositories
+    due_id = dues[0]["_id"]
+    charge = provider.charge
+
+    async def slow_charge(*args, **kwargs):
+        # Çekim ayırma süresinden uzun sürdü; süresi dolan aidatı başka bir ödeme ayırdı
+        later = datetime.utcnow() + server.PAYMENT_CLAIM_TTL + timedelta(seconds=1)
+        assert await repositories.dues.claim_for_payment(APARTMENT_ID, [due_id], "other", later + timedelta(minutes=2),
+                                                         later)
+        return await charge(*args, **kwargs)
+
+    monkeypatch.setattr(provider, "charge", slow_charge)
+    response = client.post(f"/api/dues/{due_id}/pay", json={})
+    assert response.status_code == 409
+    assert "iade edildi" in response.json()["detail"]
+    (charged,) = provider.charges.values()
+    assert provider.refunded == {charged.transaction_id}
+    # Diğer ödemenin ayırmasına dokunulmaz
+    assert get_due(client, due_id)["paid"] is False
+    client.portal.call(repositories.dues.release_payment_claim, [due_id], "other")
+
+    # Aynı anahtarla tekrar iade edilmiş tahsilatı ödeme saymaz
+    monkeypatch.setattr(provider, "charge", charge)
+    body = client.post(f"/api/dues/{due_id}/pay", json={}).json()
+    assert body["success"] is False
+    assert get_due(client, due_id)["paid"] is False
+
+
+def test_failed_mark_after_charge_is_refunded(client, provider, dues, monkeypatch):
+    repositories = server.app.state.repositories
+    due_id = dues[0]["_id"]
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("bağlantı koptu")
+
+    monkeypatch.setattr(repositories.dues, "mark_many_paid", broken)
+    response = client.post(f"/api/dues/{due_id}/pay", json={})
+    assert response.status_code == 500
+    assert "iade edildi" in response.json()["detail"]
+    (charged,) = provider.charges.values()
+    assert provider.refunded == {charged.transaction_id}
+    # Ayırma bırakıldı: başka anahtarla hemen ödenebilir
+    assert repositories.dues.dues.docs[due_id].get("payment_claim") is None
+    monkeypatch.undo()
+    monkeypatch.setattr(server.app.state, "payment_gateway", payments.PaymentGateway(provider))
+    body = client.post(f"/api/dues/{due_id}/pay", json={"idempotency_key": "yeni-deneme"}).json()
+    assert body["success"] is True and body["due"]["paid"] is True
+
+
+def test_declined_payment_releases_claim(client, provider, dues):
+    body = client.post(f"/api/apartments/{APARTMENT_ID}/dues/pay",
+                       json={"due_ids": [dues[0]["_id"]], "method": "declined"}).json()
+    assert body["success"] is False
+    body = client.post(f"/api/dues/{dues[0]['_id']}/pay", json={"idempotency_key": "yeni-deneme"}).json()
+    assert body["success"] is True and body["due"]["paid"] is True
+
+
+def test_unreachable_provider_keeps_claim_only_if_sent(client, dues, monkeypatch):
+    class Unreachable(payments.StubPaymentProvider):
+        async def charge(self, *args, **kwargs):
+            raise payments.PaymentError("bağlantı koptu")
+
+    monkeypatch.setattr(server.app.state, "payment_gateway",
+                        payments.PaymentGateway(Unreachable(), retries=0, retry_base=0))
+    assert client.post(f"/api/dues/{dues[0]['_id']}/pay", json={}).status_code == 503
+    # Sonuç belirsiz: başka anahtarla çekim yapılamaz, aynı anahtarla yeniden denenebilir
+    assert client.post(f"/api/dues/{dues[0]['_id']}/pay", json={"idempotency_key": "x"}).status_code == 409
+
+    monkeypatch.setattr(server.app.state, "payment_gateway", payments.PaymentGateway(payments.StubPaymentProvider()))
+    assert client.post(f"/api/dues/{dues[0]['_id']}/pay", json={}).json()["success"] is True
+
+
+def test_amount_allocation_reports_unallocated(client, provider, dues):
+    body = client.post(f"/api/apartments/{APARTMENT_ID}/dues/pay", json={"amount": 1000}).json()
+    assert body["success"] is True
+    assert [due["_id"] for due in body["dues"]] == [dues[0]["_id"], dues[1]["_id"]]
+    assert (body["total_paid"], body["unallocated"]) == (800.0, 200.0)
+    assert body["balance"] == {"total_debt": 400.0, "unpaid_count": 1, "overdue_count": 1}
+
+
+def test_allocate_dues():
+    unpaid = [{"_id": f"d{i}", "amount": amount} for i, amount in enumerate((100.0, 250.0, 100.0))]
+    assert [d["_id"] for d in allocate_dues(unpaid, BulkDuePayment(amount=349.999))] == ["d0", "d1"]
+    # Karşılanamayan aidatta durur; sonraki küçük aidata atlamaz
+    assert [d["_id"] for d in allocate_dues(unpaid, BulkDuePayment(amount=300))] == ["d0"]
+    assert [d["_id"] for d in allocate_dues(unpaid, BulkDuePayment(due_ids=["d2"]))] == ["d2"]
+    for payment in (BulkDuePayment(amount=50), BulkDuePayment(due_ids=["d0", "yok"])):
+        with pytest.raises(HTTPException) as raised:
+            allocate_dues(unpaid, payment)
+        assert raised.value.status_code == 400
+
+
+class FakeCollection:
+    """update_many için yeterli kadar Mongo: eşitlik, noktalı alan ve $in; $set/$unset"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    @staticmethod
+    def _value(doc, path):
+        for part in path.split("."):
+            doc = doc.get(part) if isinstance(doc, dict) else None
+        return doc
+
+    def _matches(self, doc, query):
+        for path, condition in query.items():
+            value = self._value(doc, path)
+            if isinstance(condition, dict) and "$in" in condition:
+                if value not in condition["$in"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    async def update_many(self, query, update, session=None):
+        matched = [doc for doc in self.docs if self._matches(doc, query)]
+        for doc in matched:
+            doc.update(update.get("$set", {}))
+            for name in update.get("$unset", {}):
+                doc.pop(name, None)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+
+class NoTransactionsClient:
+    async def start_session(self):
+        raise OperationFailure("Transaction numbers are only allowed on a replica set member or mongos", code=20)
+
+
+def test_mark_many_paid_without_transactions_rolls_back():
+    ids = [ObjectId() for _ in range(3)]
+    docs = [{"_id": object_id, "apartment_id": APARTMENT_ID, "paid": False, "payment_claim": {"key": "k"}}
+            for object_id in ids]
+    # Üçüncü aidatın ayırması başka ödemeye geçmiş
+    docs[2]["payment_claim"] = {"key": "other"}
+    collection = FakeCollection(docs)
+    repository = MotorDueRepository(SimpleNamespace(dues=collection, dues_archive=None, apartments=None,
+                                                    debt_maps=None, client=NoTransactionsClient()))
+    fields = {"payment_date": datetime.utcnow(), "transaction_id": "TEST-1", "updated_at": datetime.utcnow()}
+
+    assert asyncio.run(repository.mark_many_paid(APARTMENT_ID, [str(i) for i in ids], fields, "k")) is False
+    assert repository._transactions is False
+    assert all(doc["paid"] is False and "transaction_id" not in doc and "payment_date" not in doc for doc in docs)
+    assert docs[2]["payment_claim"] == {"key": "other"}
+    # İşaretlenip geri alınanların ayırması süresi dolmuş olarak geri gelir
+    assert [doc["payment_claim"]["key"] for doc in docs[:2]] == ["k", "k"]
+    assert all(doc["payment_claim"]["until"] <= datetime.utcnow() for doc in docs[:2])
+
+    docs[2]["payment_claim"] = {"key": "k"}
+    assert asyncio.run(repository.mark_many_paid(APARTMENT_ID, [str(i) for i in ids], fields, "k")) is True
+    assert all(doc["paid"] is True and doc["transaction_id"] == "TEST-1" and "payment_claim" not in doc
+               for doc in docs)
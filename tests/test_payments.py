@@ -0,0 +1,194 @@
+"""
+Ödeme ağ geçidi: devre kesici geçişleri, yeniden deneme, sıra sınırı ve idempotency
+"""
+import asyncio
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import payments
+import server
+from payments import CircuitBreaker, PaymentError, PaymentGateway, PaymentUnavailable, StubPaymentProvider
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Yalnızca payments modülünün saati; istek sınırlayıcı gibi diğer kullanıcılar etkilenmez
+    monkeypatch.setattr(payments, "time", SimpleNamespace(monotonic=clock, perf_counter=time.perf_counter))
+    return clock
+
+
+class FlakyProvider(StubPaymentProvider):
+    """İlk `failures` çağrıda PaymentError; sonra StubPaymentProvider gibi"""
+
+    def __init__(self, failures: int, idempotent: bool = True):
+        super().__init__()
+        self.failures = failures
+        self.calls = 0
+        self.idempotent_charges = idempotent
+
+    async def charge(self, idempotency_key, amount, currency, method, metadata):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise PaymentError("bağlantı koptu")
+        return await super().charge(idempotency_key, amount, currency, method, metadata)
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now += 10
+    assert breaker.retry_after() == pytest.approx(20)
+
+
+def test_half_open_allows_a_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    # Deneme sağlayıcıya gitmediyse sıradaki çağrı deneme olabilir
+    breaker.release_probe()
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_and_successful_probe_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.retry_after() == pytest.approx(30)
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+    assert breaker.retry_after() == 0.0
+
+
+def test_idempotent_charge_is_retried():
+    provider = FlakyProvider(failures=2)
+    gateway = PaymentGateway(provider, retries=2, retry_base=0)
+    result = asyncio.run(gateway.charge("key-1", 100.0))
+    assert result.success and provider.calls == 3
+    assert gateway.health()["metrics"]["charge"]["errors"] == 2
+
+
+def test_non_idempotent_charge_is_not_retried():
+    provider = FlakyProvider(failures=1, idempotent=False)
+    gateway = PaymentGateway(provider, retries=2, retry_base=0)
+    with pytest.raises(PaymentUnavailable):
+        asyncio.run(gateway.charge("key-1", 100.0))
+    assert provider.calls == 1
+
+
+def test_open_breaker_rejects_without_calling_provider(clock):
+    provider = FlakyProvider(failures=10)
+    gateway = PaymentGateway(provider, retries=0, retry_base=0,
+                             breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    for _ in range(2):
+        with pytest.raises(PaymentUnavailable):
+            asyncio.run(gateway.charge("key-1", 100.0))
+    assert gateway.health()["circuit"] == "open"
+
+    clock.now += 5
+    with pytest.raises(PaymentUnavailable) as raised:
+        asyncio.run(gateway.charge("key-1", 100.0))
+    assert raised.value.retry_after == pytest.approx(25)
+    assert provider.calls == 2
+
+
+def test_full_queue_does_not_trip_breaker():
+    async def scenario():
+        gateway = PaymentGateway(StubPaymentProvider(latency=0.2), max_concurrency=1, queue_timeout=0.01)
+        first = asyncio.create_task(gateway.charge("key-1", 100.0))
+        await asyncio.sleep(0)
+        with pytest.raises(PaymentUnavailable):
+            await gateway.charge("key-2", 100.0)
+        await first
+        return gateway
+
+    gateway = asyncio.run(scenario())
+    assert (gateway.breaker.state, gateway.breaker.failures) == ("closed", 0)
+
+
+def test_cancelled_probe_releases_half_open(clock):
+    async def scenario():
+        gateway = PaymentGateway(StubPaymentProvider(latency=0.2), max_concurrency=1, retries=0,
+                                 breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30))
+        gateway.breaker.record_failure()
+        clock.now += 30
+        # Deneme sağlayıcıyı beklerken iptal edilir
+        probe = asyncio.create_task(gateway.charge("key-1", 100.0))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert gateway.breaker.state == "half_open" and not gateway.breaker._probing
+
+        # Deneme sıra beklerken iptal edilir
+        await gateway._slots.acquire()
+        probe = asyncio.create_task(gateway.charge("key-2", 100.0))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        gateway._slots.release()
+        assert not gateway.breaker._probing
+        assert (await gateway.charge("key-3", 100.0)).success
+        assert gateway.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_timeout_counts_as_failure():
+    gateway = PaymentGateway(StubPaymentProvider(latency=0.2), timeout=0.01, retries=0)
+    with pytest.raises(PaymentUnavailable):
+        asyncio.run(gateway.charge("key-1", 100.0))
+    assert gateway.breaker.failures == 1
+    assert gateway.health()["metrics"]["charge"]["timeouts"] == 1
+
+
+def test_same_idempotency_key_replays_the_charge():
+    provider = StubPaymentProvider()
+    gateway = PaymentGateway(provider)
+    first = asyncio.run(gateway.charge("key-1", 100.0))
+    again = asyncio.run(gateway.charge("key-1", 100.0))
+    assert first == again and len(provider.charges) == 1
+    assert asyncio.run(gateway.get_status("key-1")) == first
+    assert asyncio.run(gateway.get_status("unknown")) is None
+
+
+def test_unavailable_gateway_maps_to_503_with_retry_after(client, monkeypatch, clock):
+    repositories = server.app.state.repositories
+    due = client.portal.call(repositories.dues.create_many, [{
+        "apartment_id": "apt-1", "amount": 750.0, "paid": False, "due_date": datetime.utcnow(),
+        "created_at": datetime.utcnow()
+    }])[0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=42)
+    breaker.record_failure()
+    monkeypatch.setattr(server.app.state, "payment_gateway", PaymentGateway(StubPaymentProvider(), breaker=breaker))
+
+    response = client.post(f"/api/dues/{due['_id']}/pay", json={"method": "card"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "42"
+    assert client.portal.call(repositories.dues.get, due["_id"])["paid"] is False
@@ -0,0 +1,123 @@
+"""
+Talep durum makinesi: tekil ve toplu geçişlerin doğrulanması
+"""
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import server
+from auth import issue_tokens
+
+
+@pytest.fixture
+def building(client):
+    repositories = server.app.state.repositories
+    return client.portal.call(repositories.buildings.create, {"name": "Talep Sitesi", "created_at": datetime.utcnow()})
+
+
+@pytest.fixture
+def admin_headers(client, building):
+    admin = client.portal.call(server.app.state.repositories.users.create, {
+        "phone_number": "5550007777", "name": "Yönetici", "role": "building_admin", "building_id": building["_id"]
+    })
+    return {"Authorization": f"Bearer {issue_tokens(admin)['access_token']}"}
+
+
+@pytest.fixture
+def make_request(client, building):
+    def make(status: str) -> str:
+        now = datetime.utcnow()
+        created = client.portal.call(server.app.state.repositories.requests.create, {
+            "user_id": "u1", "building_id": building["_id"], "title": "Asansör", "description": "Arıza",
+            "status": status, "priority": "normal", "created_at": now, "updated_at": now
+        })
+        return created["_id"]
+    return make
+
+
+@pytest.mark.parametrize("current, target, allowed", [
+    ("received", "in_progress", True),
+    ("received", "resolved", True),
+    ("in_progress", "resolved", True),
+    ("received", "received", False),
+    ("in_progress", "received", False),
+    ("in_progress", "in_progress", False),
+    ("resolved", "received", False),
+    ("resolved", "in_progress", False),
+    ("resolved", "resolved", False),
+])
+def test_transition_table(client, make_request, admin_headers, current, target, allowed):
+    assert (current in server.allowed_previous_statuses(target)) == allowed
+    request_id = make_request(current)
+    response = client.put(f"/api/requests/{request_id}/status", json={"status": target}, headers=admin_headers)
+    if allowed:
+        assert response.status_code == 200, response.text
+        assert response.json()["status"] == target
+        assert ("resolved_at" in response.json()) == (target == "resolved")
+    else:
+        assert response.status_code == 400
+        assert f"{current} → {target}" in response.json()["detail"]
+
+
+def test_single_update_rejects_unknown_status_and_request(client, make_request, admin_headers):
+    request_id = make_request("received")
+    assert client.put(f"/api/requests/{request_id}/status", json={"status": "closed"},
+                      headers=admin_headers).status_code == 400
+    assert client.put(f"/api/requests/{ObjectId()}/status", json={"status": "resolved"},
+                      headers=admin_headers).status_code == 404
+
+
+def test_bulk_update_reports_each_item(client, make_request, admin_headers):
+    to_progress = make_request("received")
+    to_resolve = make_request("in_progress")
+    backwards = make_request("resolved")
+    missing = str(ObjectId())
+    items = [
+        {"request_id": to_progress, "status": "in_progress"},
+        {"request_id": to_resolve, "status": "resolved"},
+        {"request_id": backwards, "status": "received"},
+        {"request_id": missing, "status": "resolved"},
+        {"request_id": "not-an-object-id", "status": "resolved"},
+        {"request_id": to_progress, "status": "resolved"},
+        {"request_id": make_request("received"), "status": "closed"},
+    ]
+    response = client.put("/api/requests/status:bulk", json={"items": items}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    results = body["results"]
+
+    assert [r["request_id"] for r in results] == [item["request_id"] for item in items]
+    assert results[0] == {"request_id": to_progress, "success": True, "status": "in_progress"}
+    assert results[1] == {"request_id": to_resolve, "success": True, "status": "resolved"}
+    assert results[2]["success"] is False and results[2]["status"] == "resolved"
+    assert "resolved → received" in results[2]["error"]
+    assert results[3] == {"request_id": missing, "success": False, "error": "Talep bulunamadı"}
+    assert results[4] == {"request_id": "not-an-object-id", "success": False, "error": "Talep bulunamadı"}
+    assert results[5]["success"] is False and "birden fazla" in results[5]["error"]
+    assert results[6] == {"request_id": items[6]["request_id"], "success": False, "error": "Geçersiz talep durumu"}
+    assert (body["success"], body["updated"], body["failed"]) == (False, 2, 5)
+
+    # Uygulanmayan geçişler belgeleri değiştirmedi
+    repositories = server.app.state.repositories
+    assert client.portal.call(repositories.requests.get, backwards)["status"] == "resolved"
+    assert client.portal.call(repositories.requests.get, to_progress)["status"] == "in_progress"
+
+
+def test_bulk_update_all_valid(client, make_request, admin_headers):
+    ids = [make_request("received") for _ in range(3)]
+    body = client.put("/api/requests/status:bulk", headers=admin_headers, json={
+        "items": [{"request_id": request_id, "status": "resolved"} for request_id in ids]
+    }).json()
+    assert (body["success"], body["updated"], body["failed"]) == (True, 3, 0)
+
+
+def test_transition_marker_is_not_returned(client, building, admin_headers):
+    # Toplu geçişin Mongo'da bıraktığı işaret yanıtlara girmez
+    now = datetime.utcnow()
+    created = client.portal.call(server.app.state.repositories.requests.create, {
+        "user_id": "u1", "building_id": building["_id"], "title": "Asansör", "description": "Arıza",
+        "status": "resolved", "priority": "normal", "created_at": now, "updated_at": now, "transition_id": "abc"
+    })
+    body = client.get(f"/api/requests/{created['_id']}", headers=admin_headers).json()
+    assert body["status"] == "resolved" and "transition_id" not in body
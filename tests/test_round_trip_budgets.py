@@ -0,0 +1,183 @@
+"""
+Uç başına veritabanı gidiş-dönüş bütçeleri
+
+Her uç için izin verilen en fazla gidiş-dönüş sayısı BUDGETS'ta tanımlıdır.
+Bir değişiklik bir ucun yaptığı çağrı sayısını bütçenin üstüne çıkarırsa
+(yazmadan sonra fazladan okuma, döngü içinde sorgu gibi) test başarısız olur
+ve yapılan çağrıları listeler. Bütçe bilerek artırılacaksa sebebi yanına yazılmalıdır.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from auth import issue_tokens
+
+BUDGETS = {
+    "login: mevcut kullanıcı": 1,
+    # Telefon araması, ilk bina, demo daire, kullanıcı
+    "login: yeni kullanıcı": 4,
+    "auth/refresh": 1,
+    # Ana ekran (frontend/app/home.tsx): bina listesi + bina durumu
+    "dashboard": 2,
+    # Güncelleme (önceki + güncel durum tek çağrıda) + geçmiş kovası
+    "bina durumu güncelleme": 2,
+    "daire aidatları": 1,
+    # Aidat + çekim öncesi ayırma (çift çekime karşı) + ödendi işareti
+    "aidat ödeme": 3,
+    # Ödenmemiş aidatlar + çekim öncesi ayırma + tek seferde işaretleme
+    "toplu aidat ödeme": 3,
+    "talep oluşturma": 1,
+    # Koşullu güncelleme güncel belgeyi döndürür; tekrar okunmaz
+    "talep durumu güncelleme": 1,
+    "bina duyuruları": 1,
+    # Okundu kaydı + ilk okumada sayaç
+    "duyuru okundu": 2,
+    "okunmamış duyuru sayısı": 1,
+    # Duyurular, aidatlar, talepler, hukuki süreç, bina durumu (ilk senkronda silme izi okunmaz)
+    "senkronizasyon: ilk": 5,
+    "senkronizasyon: delta": 6,
+}
+
+
+def call(client, counter, budget: str, method: str, url: str, **kwargs):
+    """İsteği yap; başarılı olduğunu ve gidiş-dönüş sayısının bütçeyi aşmadığını doğrula"""
+    counter.calls.clear()
+    response = client.request(method, url, **kwargs)
+    assert response.status_code < 400, response.text
+    limit = BUDGETS[budget]
+    assert len(counter.calls) <= limit, (
+        f"{budget}: {len(counter.calls)} gidiş-dönüş (bütçe {limit})\n" + "\n".join(counter.calls)
+    )
+    return response.json()
+
+
+def run(client, coroutine_function, *args):
+    """Test verisini uygulamanın event loop'unda, sayılmadan hazırla"""
+    return client.portal.call(coroutine_function, *args)
+
+
+@pytest.fixture
+def resident(client):
+    repositories = server.app.state.repositories
+    now = datetime.utcnow()
+    building = run(client, repositories.buildings.create, {"name": "Örnek Sitesi", "created_at": now})
+    apartment = run(client, repositories.buildings.create_apartment, {
+        "building_id": building["_id"], "block": "A", "apartment_number": 5, "floor": 2, "created_at": now
+    })
+    user = run(client, repositories.users.create, {
+        "phone_number": "5550001122",
+        "name": "Demo Kullanıcı",
+        "role": "tenant",
+        "building_id": building["_id"],
+        "apartment_id": apartment["_id"],
+        "created_at": now
+    })
+    dues = run(client, repositories.dues.create_many, [
+        {"apartment_id": apartment["_id"], "amount": 750.0, "paid": False,
+         "due_date": now - timedelta(days=30 * i), "created_at": now}
+        for i in range(3)
+    ])
+    run(client, repositories.buildings.get_or_create_status, building["_id"], server.default_building_status())
+    tokens = issue_tokens(user)
+    return {
+        "building": building,
+        "apartment": apartment,
+        "user": user,
+        "dues": dues,
+        "tokens": tokens,
+        "headers": {"Authorization": f"Bearer {tokens['access_token']}"},
+    }
+
+
+@pytest.fixture
+def admin_headers(client, resident):
+    admin = run(client, server.app.state.repositories.users.create, {
+        "phone_number": "5550009999", "name": "Yönetici", "role": "building_admin",
+        "building_id": resident["building"]["_id"]
+    })
+    return {"Authorization": f"Bearer {issue_tokens(admin)['access_token']}"}
+
+
+def test_login_existing_user(client, counter, resident):
+    body = call(client, counter, "login: mevcut kullanıcı", "POST", "/api/auth/login",
+                json={"phone_number": resident["user"]["phone_number"], "role": "tenant"})
+    assert body["user"]["_id"] == resident["user"]["_id"]
+
+
+def test_login_new_user(client, counter, resident):
+    call(client, counter, "login: yeni kullanıcı", "POST", "/api/auth/login",
+         json={"phone_number": "5550003344", "role": "tenant"})
+
+
+def test_refresh_tokens(client, counter, resident):
+    call(client, counter, "auth/refresh", "POST", "/api/auth/refresh",
+         json={"refresh_token": resident["tokens"]["refresh_token"]})
+
+
+def test_dashboard(client, counter, resident):
+    counter.calls.clear()
+    buildings = client.get("/api/buildings").json()
+    status = client.get(f"/api/buildings/{buildings[0]['_id']}/status")
+    assert status.status_code == 200
+    assert len(counter.calls) <= BUDGETS["dashboard"], "\n".join(counter.calls)
+
+
+def test_update_building_status(client, counter, resident, admin_headers):
+    call(client, counter, "bina durumu güncelleme", "PUT", f"/api/buildings/{resident['building']['_id']}/status",
+         json={"elevator": "maintenance"}, headers=admin_headers)
+
+
+def test_apartment_dues(client, counter, resident):
+    body = call(client, counter, "daire aidatları", "GET", f"/api/apartments/{resident['apartment']['_id']}/dues",
+                headers=resident["headers"])
+    assert len(body["dues"]) == 3
+
+
+def test_pay_due(client, counter, resident):
+    body = call(client, counter, "aidat ödeme", "POST", f"/api/dues/{resident['dues'][0]['_id']}/pay",
+                json={"method": "test"}, headers=resident["headers"])
+    assert body["success"]
+
+
+def test_pay_multiple_dues(client, counter, resident):
+    body = call(client, counter, "toplu aidat ödeme", "POST",
+                f"/api/apartments/{resident['apartment']['_id']}/dues/pay",
+                json={"amount": 1500, "method": "test"}, headers=resident["headers"])
+    assert len(body["dues"]) == 2
+
+
+def test_create_request(client, counter, resident):
+    call(client, counter, "talep oluşturma", "POST", "/api/requests",
+         json={"title": "Asansör", "description": "Asansör çalışmıyor", "category": "maintenance"},
+         headers=resident["headers"])
+
+
+def test_update_request_status(client, counter, resident, admin_headers):
+    request = run(client, server.app.state.repositories.requests.create, {
+        "user_id": resident["user"]["_id"], "building_id": resident["building"]["_id"],
+        "title": "Asansör", "description": "Asansör çalışmıyor", "status": "received",
+        "priority": "normal", "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()
+    })
+    call(client, counter, "talep durumu güncelleme", "PUT", f"/api/requests/{request['_id']}/status",
+         json={"status": "in_progress"}, headers=admin_headers)
+
+
+def test_building_announcements_and_read(client, counter, resident):
+    announcement = run(client, server.app.state.repositories.announcements.create, {
+        "building_id": resident["building"]["_id"], "title": "Su kesintisi", "content": "Yarın 09:00-17:00",
+        "category": "maintenance", "priority": "high", "created_at": datetime.utcnow()
+    })
+    call(client, counter, "bina duyuruları", "GET", f"/api/buildings/{resident['building']['_id']}/announcements")
+    call(client, counter, "duyuru okundu", "POST", f"/api/announcements/{announcement['_id']}/read",
+         headers=resident["headers"])
+    body = call(client, counter, "okunmamış duyuru sayısı", "GET",
+                f"/api/users/{resident['user']['_id']}/announcements/unread-count", headers=resident["headers"])
+    assert body["unread_count"] == 0
+
+
+def test_sync(client, counter, resident):
+    url = f"/api/users/{resident['user']['_id']}/sync"
+    first = call(client, counter, "senkronizasyon: ilk", "GET", url, headers=resident["headers"])
+    call(client, counter, "senkronizasyon: delta", "GET", url, params={"since": first["token"]},
+         headers=resident["headers"])
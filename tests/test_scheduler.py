@@ -0,0 +1,183 @@
+"""
+Zamanlanmış işler: cron alanları ve sonraki çalıştırma zamanı, iki zamanlayıcı
+arasında kira çekişmesi ve çalıştırma geçmişi (bellek içi kilit deposuyla)
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from scheduler import CronSchedule, InMemoryJobStore, JobContext, LeaseLost, Scheduler, _parse_field
+
+NOW = datetime(2026, 3, 1, 12, 0)  # pazar
+
+
+@pytest.mark.parametrize("text, low, high, expected", [
+    ("*", 0, 5, {0, 1, 2, 3, 4, 5}),
+    ("*/15", 0, 59, {0, 15, 30, 45}),
+    ("10-20/5", 0, 59, {10, 15, 20}),
+    ("1,5,10-12", 0, 59, {1, 5, 10, 11, 12}),
+    # Başlangıç ve adım: sona kadar
+    ("5/20", 0, 59, {5, 25, 45}),
+    ("7", 0, 7, {7}),
+])
+def test_parse_field(text, low, high, expected):
+    assert _parse_field(text, low, high) == frozenset(expected)
+
+
+@pytest.mark.parametrize("expression", [
+    "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *", "* * * * 8",
+    "5-3 * * * *", "*/0 * * * *", "a * * * *", "* * * *", "* * * * * *",
+])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_sunday_is_zero_or_seven():
+    assert CronSchedule("0 0 * * 7").weekdays == CronSchedule("0 0 * * 0").weekdays == frozenset({0})
+
+
+@pytest.mark.parametrize("expression, moment, expected", [
+    # Saniyeler atılır; aynı dakika değil bir sonraki
+    ("* * * * *", datetime(2026, 3, 1, 10, 0, 30), datetime(2026, 3, 1, 10, 1)),
+    ("*/10 * * * *", datetime(2026, 3, 1, 10, 0), datetime(2026, 3, 1, 10, 10)),
+    ("30 3 * * 0", datetime(2026, 3, 7, 4, 0), datetime(2026, 3, 8, 3, 30)),
+    ("0 6 * * *", datetime(2026, 12, 31, 7, 0), datetime(2027, 1, 1, 6, 0)),
+    ("0 0 1 1 *", datetime(2026, 6, 1), datetime(2027, 1, 1)),
+    ("0 0 29 2 *", datetime(2026, 1, 1), datetime(2028, 2, 29)),
+    ("15 9-17/4 * * 1-5", datetime(2026, 3, 6, 17, 15), datetime(2026, 3, 9, 9, 15)),
+])
+def test_next_after(expression, moment, expected):
+    assert CronSchedule(expression).next_after(moment) == expected
+
+
+def test_day_of_month_or_day_of_week():
+    # İkisi de kısıtlıysa biri yeterli: ayın 13'ü ya da pazartesi
+    either = CronSchedule("0 0 13 * 1")
+    assert either.next_after(datetime(2026, 3, 1)) == datetime(2026, 3, 2)
+    assert either.next_after(datetime(2026, 3, 10)) == datetime(2026, 3, 13)
+    # Yalnızca biri kısıtlıysa yalnızca o
+    assert CronSchedule("0 0 13 * *").next_after(datetime(2026, 3, 1)) == datetime(2026, 3, 13)
+    assert CronSchedule("0 0 * * 1").next_after(datetime(2026, 3, 10)) == datetime(2026, 3, 16)
+
+
+def test_impossible_date_never_matches():
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_after(NOW)
+
+
+async def run_started(scheduler: Scheduler, now: datetime) -> list:
+    """tick ile başlatılan işleri sonuna kadar bekle"""
+    started = await scheduler.tick(now)
+    await asyncio.gather(*scheduler._running.values())
+    return started
+
+
+def test_only_one_scheduler_runs_a_due_job():
+    async def scenario():
+        store = InMemoryJobStore()
+        calls, gate = [], asyncio.Event()
+
+        async def job(context):
+            calls.append(context.owner)
+            await gate.wait()
+            return "tamam"
+
+        first, second = Scheduler(store, owner="a"), Scheduler(store, owner="b")
+        for scheduler in (first, second):
+            scheduler.add("rapor", "*/10 * * * *", job)
+        # İlk tick kilidi sonraki cron zamanıyla kaydeder
+        assert await first.tick(NOW) == [] and await second.tick(NOW) == []
+        due = NOW + timedelta(minutes=10)
+
+        assert await first.tick(due) == ["rapor"]
+        # Kira ilkinde: ikincisi çalıştırmaz
+        assert await second.tick(due) == []
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*first._running.values())
+
+        # Çalıştırma bitince sonraki zaman ileri alındı; aynı an için ikinci çalıştırma yok
+        assert await second.tick(due) == []
+        assert store.locks["rapor"]["next_run_at"] > due
+        assert (calls, store.locks["rapor"]["owner"]) == (["a"], None)
+        await asyncio.gather(first.stop(), second.stop())
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_moves_to_another_scheduler():
+    async def scenario():
+        store = InMemoryJobStore()
+        contexts = []
+
+        async def job(context):
+            contexts.append(context)
+            await context.save({"after": "x-100"})
+            return {"processed": 100}
+
+        scheduler = Scheduler(store, owner="b")
+        scheduler.add("arsiv", "0 * * * *", job, lease_seconds=60)
+        await scheduler.tick(NOW)
+        due = NOW + timedelta(hours=1)
+
+        # Başka bir worker kiraladı, ilerleme yazdı ve çöktü
+        assert await store.acquire("arsiv", "a", due, due + timedelta(seconds=60))
+        assert await store.save_checkpoint("arsiv", "a", {"after": "x-50"})
+        assert await run_started(scheduler, due + timedelta(seconds=30)) == []
+        # Kira doldu: iş bu worker'a geçer ve kaldığı yerden devam eder
+        assert await run_started(scheduler, due + timedelta(seconds=61)) == ["arsiv"]
+        assert contexts[0].resumed and contexts[0].checkpoint == {"after": "x-100"}
+
+        # Kirası elinden alınan worker ilerleme yazamaz
+        stale = JobContext(store, "arsiv", "a")
+        with pytest.raises(LeaseLost):
+            await stale.save({"after": "x-999"})
+        assert store.locks["arsiv"]["checkpoint"] is None
+        assert (await store.history("arsiv"))[0]["resumed"] is True
+
+    asyncio.run(scenario())
+
+
+def test_runs_are_recorded():
+    async def scenario():
+        store = InMemoryJobStore()
+        attempts = []
+
+        async def flaky(context):
+            attempts.append(context.checkpoint)
+            if len(attempts) == 1:
+                await context.save(5)
+                raise RuntimeError("bağlantı koptu")
+            return len(attempts)
+
+        async def quiet(context):
+            return None
+
+        scheduler = Scheduler(store, owner="a")
+        scheduler.add("flaky", "0 0 * * *", flaky, retry_seconds=300)
+        scheduler.add("quiet", "0 0 * * *", quiet)
+        await scheduler.tick(NOW)
+        midnight = datetime(2026, 3, 2)
+
+        assert sorted(await run_started(scheduler, midnight)) == ["flaky", "quiet"]
+        lock = store.locks["flaky"]
+        assert (lock["last_status"], lock["last_error"], lock["checkpoint"]) == ("failed", "bağlantı koptu", 5)
+        # Başarısız iş cron zamanını beklemeden yeniden denenir, ilerlemesiyle
+        retry_at = lock["next_run_at"]
+        assert timedelta(seconds=290) <= retry_at - datetime.utcnow() <= timedelta(seconds=300)
+        assert await run_started(scheduler, retry_at) == ["flaky"]
+        assert attempts == [None, 5]
+        assert store.locks["flaky"]["next_run_at"] == CronSchedule("0 0 * * *").next_after(
+            store.locks["flaky"]["last_finished_at"]
+        )
+
+        runs = await store.history("flaky")
+        assert [run["status"] for run in runs] == ["succeeded", "failed"]
+        assert runs[0]["result"] == 2 and runs[0]["resumed"] is True and runs[1]["error"] == "bağlantı koptu"
+        assert all(run["owner"] == "a" and run["duration_ms"] >= 0 for run in runs)
+        assert len(await store.history()) == 3
+        assert len(await store.history(limit=1)) == 1
+
+    asyncio.run(scenario())
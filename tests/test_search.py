@@ -0,0 +1,144 @@
+"""
+Metin araması: Türkçe kök eşleme, başlık ağırlıklı sıralama, imleç sayfalaması
+ve token'a göre zorlanan bina/kullanıcı filtreleri
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import pagination
+import server
+import text_search
+from auth import issue_tokens
+
+
+@pytest.fixture
+def building_id(client):
+    repositories = server.app.state.repositories
+    now = datetime.utcnow()
+    building = client.portal.call(repositories.buildings.create, {"name": "Arama Sitesi", "created_at": now})
+    requests = [
+        ("Asansör arızası", "A blok asansörü çalışmıyor"),
+        ("Merdiven temizliği", "Asansörün önündeki merdiven kirli"),
+        ("Kapı zili", "Zil bozuk, asansör ile ilgisi yok"),
+        ("Otopark", "Araç park yeri sorunu"),
+        ("ASANSOR BAKIMI", "Yıllık bakım zamanı"),
+    ]
+    for i, (title, description) in enumerate(requests):
+        client.portal.call(repositories.requests.create, {
+            "user_id": "u1", "building_id": building["_id"], "title": title, "description": description,
+            "category": "maintenance", "status": "received", "priority": "normal",
+            "created_at": now - timedelta(minutes=i), "updated_at": now
+        })
+    client.portal.call(repositories.announcements.create, {
+        "building_id": building["_id"], "title": "Asansör bakımı", "content": "Salı günü asansör bakımı var",
+        "category": "maintenance", "priority": "normal", "created_at": now - timedelta(minutes=10)
+    })
+    return building["_id"]
+
+
+def bearer(user: dict) -> dict:
+    return {"Authorization": f"Bearer {issue_tokens(user)['access_token']}"}
+
+
+@pytest.fixture
+def admin(client, building_id):
+    return bearer(client.portal.call(server.app.state.repositories.users.create, {
+        "phone_number": "5553000001", "role": "building_admin", "building_id": building_id
+    }))
+
+
+def search(client, headers, **params):
+    response = client.get("/api/search", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_turkish_terms_fold_and_stem():
+    assert text_search.terms("ASANSÖRÜ") == text_search.terms("asansor") == ["asansor"]
+    assert text_search.terms("Temizliği") == ["temizlik"]
+    assert text_search.terms("IŞIK") == text_search.terms("ışık")
+
+
+def test_title_matches_rank_above_body_matches(client, building_id, admin):
+    body = search(client, admin, q="asansörü", building_id=building_id, types="requests", limit=50)
+    titles = [r["title"] for r in body["results"]]
+    assert "Otopark" not in titles
+    assert len(titles) == 4
+    # Başlıkta geçenler (ağırlık 3) yalnızca açıklamada geçenlerden önce
+    assert set(titles[:2]) == {"Asansör arızası", "ASANSOR BAKIMI"}
+    scores = [r["score"] for r in body["results"]]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_cursor_pages_cover_results_once(client, building_id, admin):
+    for sort in ("relevance", "recent"):
+        everything = search(client, admin, q="asansör", building_id=building_id, sort=sort, limit=50)
+        assert everything["next_cursor"] is None
+        expected = [(r["type"], r["_id"]) for r in everything["results"]]
+        assert len(expected) == 5
+
+        seen, cursor = [], None
+        while True:
+            page = search(client, admin, q="asansör", building_id=building_id, sort=sort, limit=2,
+                          **({"cursor": cursor} if cursor else {}))
+            seen.extend((r["type"], r["_id"]) for r in page["results"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == expected
+
+
+def test_recent_sort_orders_by_creation_time(client, building_id, admin):
+    body = search(client, admin, q="asansör", building_id=building_id, sort="recent", limit=50)
+    created = [r["created_at"] for r in body["results"]]
+    assert created == sorted(created, reverse=True)
+
+
+def test_invalid_cursor_is_rejected(client, building_id, admin):
+    response = client.get("/api/search", params={"q": "asansör", "cursor": "bozuk-imleç"}, headers=admin)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("value", [12.5, 0, "x", datetime(2026, 1, 2, 3, 4, 5, 678000)])
+def test_cursor_round_trip(value):
+    cursor = pagination.decode_cursor(pagination.encode_cursor(value, "request", "abc"))
+    assert cursor == {"value": value, "kind": "request", "id": "abc"}
+
+
+def test_is_after_cursor_follows_list_order():
+    cursor = {"value": 2.0, "kind": "announcement", "id": "m"}
+    assert pagination.is_after_cursor("announcement", 1.0, "z", cursor)
+    assert not pagination.is_after_cursor("announcement", 3.0, "a", cursor)
+    # Eşit değerde tür artan, sonra _id azalan
+    assert pagination.is_after_cursor("request", 2.0, "z", cursor)
+    assert pagination.is_after_cursor("announcement", 2.0, "a", cursor)
+    assert not pagination.is_after_cursor("announcement", 2.0, "m", cursor)
+
+
+def test_search_is_scoped_to_the_token(client, building_id, admin):
+    repositories = server.app.state.repositories
+    other = client.portal.call(repositories.buildings.create, {"name": "Diğer Site", "created_at": datetime.utcnow()})
+    resident = client.portal.call(repositories.users.create, {
+        "phone_number": "5553000002", "role": "tenant", "building_id": building_id
+    })
+    now = datetime.utcnow()
+    own = client.portal.call(repositories.requests.create, {
+        "user_id": resident["_id"], "building_id": building_id, "title": "Asansör sesi", "description": "Gece",
+        "category": "maintenance", "status": "received", "priority": "normal", "created_at": now, "updated_at": now
+    })
+
+    assert client.get("/api/search", params={"q": "asansör"}).status_code == 401
+    for params, headers in (({"building_id": other["_id"]}, admin),
+                            ({"building_id": other["_id"]}, bearer(resident)),
+                            ({"user_id": "u1"}, bearer(resident))):
+        response = client.get("/api/search", params={"q": "asansör", **params}, headers=headers)
+        assert response.status_code == 403, (params, response.text)
+
+    # Sakin: bina token'dan, talepler yalnızca kendisinin; duyurular binanın
+    body = search(client, bearer(resident), q="asansör", limit=50)
+    assert [r["_id"] for r in body["results"] if r["type"] == "request"] == [own["_id"]]
+    assert [r["type"] for r in body["results"]].count("announcement") == 1
+    # Yönetici: filtre verilmese de yalnızca kendi binası
+    body = search(client, admin, q="asansör", types="requests", limit=50)
+    assert len(body["results"]) == 5 and all(r["building_id"] == building_id for r in body["results"])
@@ -0,0 +1,42 @@
+"""
+Açılış ve kapanış: ısınma sırasında düzeltilmesi gereken veri hatası hazırlığı
+düşürür; taşınan kiracının eski worker'ı kapanışta beklenir
+"""
+from fastapi.testclient import TestClient
+
+import server
+from repositories import DuplicateIndexKeys, Repositories
+
+
+def test_ready_after_warm_up(client):
+    assert client.get("/readyz").json() == {"status": "ready"}
+
+
+def test_duplicate_phone_numbers_fail_readiness(monkeypatch):
+    async def ensure_indexes(self):
+        raise DuplicateIndexKeys("users.phone_number benzersiz indeksi oluşturulamadı, mükerrer numaralar: 555 (2)")
+
+    monkeypatch.setattr(Repositories, "ensure_indexes", ensure_indexes)
+    with TestClient(server.app) as test_client:
+        response = test_client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["status"] == "failed" and "555 (2)" in response.json()["detail"]
+        # Canlılık etkilenmez: süreç ayakta, yalnızca trafik almaz
+        assert test_client.get("/healthz").status_code == 200
+
+
+def test_moved_tenant_worker_is_awaited_on_shutdown():
+    with TestClient(server.app) as test_client:
+        state = server.app.state
+
+        async def move_tenant():
+            # Kiracı iki kez yeni konuma bağlanır; ilk worker durdurulmak üzere bırakılır
+            state.tenants.on_tenant("tenant-1", state.repositories)
+            first = state.outbox_workers["tenant-1"]
+            state.tenants.on_tenant("tenant-1", state.repositories)
+            return first, list(first._tasks)
+
+        first, tasks = test_client.portal.call(move_tenant)
+        assert tasks and state.outbox_workers["tenant-1"] is not first
+    assert all(task.done() for task in tasks) and first._tasks == []
+    assert all(task.done() for task in state.outbox_workers["tenant-1"]._tasks)
@@ -0,0 +1,69 @@
+"""
+Bina durumu çalışma oranı: gün kovalarından kesinti süresi ve sayısı
+
+Uç üzerinden çalışır; MONGO_TEST_URL tanımlıysa aynı beklentiler Motor
+uygulamasına karşı doğrulanır (iki uygulamanın eşliği).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from repositories import status_uptime
+
+DAY = datetime(2026, 3, 10)
+OPENING = {"elevator": "active", "wifi": "active"}
+
+
+@pytest.fixture
+def building_id(client):
+    repositories = server.app.state.repositories
+    building = client.portal.call(repositories.buildings.create, {"name": "Kesinti Sitesi", "created_at": DAY})
+    for at, changes in ((DAY + timedelta(hours=8), {"elevator": "maintenance"}),
+                        (DAY + timedelta(hours=10), {"elevator": "active"}),
+                        (DAY + timedelta(days=1, hours=6), {"elevator": "inactive"})):
+        client.portal.call(repositories.buildings.append_status_history, building["_id"], at, changes, OPENING)
+    return building["_id"]
+
+
+def uptime(client, building_id, start: datetime, end: datetime) -> dict:
+    response = client.get(f"/api/buildings/{building_id}/status/uptime",
+                          params={"start": start.isoformat(), "end": end.isoformat()})
+    assert response.status_code == 200, response.text
+    return response.json()["features"]
+
+
+def test_outages_across_day_buckets(client, building_id):
+    features = uptime(client, building_id, DAY + timedelta(hours=6), DAY + timedelta(days=1, hours=12))
+    assert features["elevator"] == {
+        "uptime_percentage": round(100 * (1 - 8 / 30), 3),
+        "outage_count": 2,
+        "mttr_minutes": 240.0,
+        "downtime_minutes": 480.0,
+        "observed_minutes": 1800.0,
+    }
+    assert features["wifi"]["uptime_percentage"] == 100.0 and features["wifi"]["outage_count"] == 0
+    # Geçmişi olmayan özellik
+    assert features["water"]["uptime_percentage"] is None
+
+
+def test_outage_running_at_range_start_is_counted(client, building_id):
+    features = uptime(client, building_id, DAY + timedelta(hours=9), DAY + timedelta(hours=12))
+    assert (features["elevator"]["outage_count"], features["elevator"]["downtime_minutes"]) == (1, 60.0)
+
+
+def test_state_carries_over_from_previous_bucket(client, building_id):
+    # Aralık gününün kovası yok: önceki günün son durumu (kesinti) sürer
+    start = DAY + timedelta(days=2)
+    features = uptime(client, building_id, start, start + timedelta(hours=6))
+    assert features["elevator"]["uptime_percentage"] == 0.0
+    assert (features["elevator"]["outage_count"], features["elevator"]["observed_minutes"]) == (1, 360.0)
+
+
+def test_status_uptime_ignores_events_after_end():
+    bucket = {"day": DAY, "opening": {"wifi": "active"}, "events": [
+        {"feature": "wifi", "status": "inactive", "at": DAY + timedelta(hours=2)},
+    ]}
+    assert status_uptime([bucket], DAY, DAY + timedelta(hours=1)) == {
+        "wifi": {"observed_ms": 3600000, "down_ms": 0, "outages": 0}
+    }
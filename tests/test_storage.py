@@ -0,0 +1,121 @@
+"""
+Ek dosya deposu: Range başlığı çözümleme, depo dışına çıkan anahtarlar ve yükleme/okuma
+"""
+from datetime import datetime
+
+import pytest
+
+import server
+from storage import LocalObjectStore, RangeNotSatisfiable, parse_range
+
+SIZE = 10
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("items=0-1", None),
+    ("bytes=0-1,4-5", None),
+    ("bytes=abc-", None),
+    ("bytes=-", None),
+    ("bytes=0-0", (0, 0)),
+    ("bytes=0-", (0, 9)),
+    ("bytes=2-5", (2, 5)),
+    ("bytes=9-", (9, 9)),
+    ("bytes=5-100", (5, 9)),
+    ("bytes=-3", (7, 9)),
+    ("bytes=-100", (0, 9)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=10-20", "bytes=5-3", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, SIZE)
+
+
+def test_parse_range_empty_file():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=-5", 0)
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=0-", 0)
+
+
+@pytest.mark.parametrize("key", [
+    "../secret.txt",
+    "requests/../../secret.txt",
+    "/etc/passwd",
+    "",
+    "../uploads-other/file.pdf",
+])
+def test_path_for_rejects_keys_outside_root(tmp_path, key):
+    store = LocalObjectStore(tmp_path / "uploads")
+    with pytest.raises(FileNotFoundError):
+        store.path_for(key)
+
+
+def test_path_for_rejects_symlink_out_of_root(tmp_path):
+    root = tmp_path / "uploads"
+    root.mkdir()
+    (tmp_path / "secret.txt").write_text("gizli")
+    (root / "link.txt").symlink_to(tmp_path / "secret.txt")
+    with pytest.raises(FileNotFoundError):
+        LocalObjectStore(root).path_for("link.txt")
+
+
+def test_path_for_accepts_nested_keys(tmp_path):
+    store = LocalObjectStore(tmp_path)
+    assert store.path_for("requests/abc/file.pdf") == tmp_path.resolve() / "requests" / "abc" / "file.pdf"
+    assert store.path_for("requests/../file.pdf") == tmp_path.resolve() / "file.pdf"
+
+
+@pytest.fixture
+def object_store(tmp_path, monkeypatch):
+    store = LocalObjectStore(tmp_path / "uploads", max_upload_bytes=1024)
+    monkeypatch.setattr(server, "object_store", store)
+    return store
+
+
+@pytest.fixture
+def request_id(client):
+    now = datetime.utcnow()
+    created = client.portal.call(server.app.state.repositories.requests.create, {
+        "user_id": "u1", "building_id": "b1", "title": "Kapı", "description": "Kırık",
+        "status": "received", "priority": "normal", "created_at": now, "updated_at": now
+    })
+    return created["_id"]
+
+
+def test_upload_and_ranged_download(client, object_store, request_id):
+    content = b"%PDF-" + bytes(range(50))
+    response = client.post(f"/api/requests/{request_id}/attachments",
+                           files=[("files", ("belge.pdf", content, "application/pdf"))])
+    assert response.status_code == 200, response.text
+    attachment = response.json()["attachments"][0]
+    assert attachment["size"] == len(content) and attachment["thumbnail_url"] is None
+
+    full = client.get(attachment["url"])
+    assert full.status_code == 200 and full.content == content
+
+    tail = client.get(attachment["url"], headers={"Range": "bytes=-5"})
+    assert tail.status_code == 206
+    assert tail.content == content[-5:]
+    assert tail.headers["content-range"] == f"bytes {len(content) - 5}-{len(content) - 1}/{len(content)}"
+
+    at_end = client.get(attachment["url"], headers={"Range": f"bytes={len(content)}-"})
+    assert at_end.status_code == 416
+    assert at_end.headers["content-range"] == f"bytes */{len(content)}"
+
+
+def test_traversal_key_is_not_served(client, object_store):
+    assert client.get("/api/files/../server.py").status_code == 404
+    assert client.get("/api/files/%2e%2e/%2e%2e/server.py").status_code == 404
+
+
+def test_upload_too_large_leaves_no_files(client, object_store, request_id):
+    response = client.post(f"/api/requests/{request_id}/attachments",
+                           files=[("files", ("buyuk.pdf", b"x" * 2048, "application/pdf"))])
+    assert response.status_code == 413
+    assert not any(path.is_file() for path in object_store.root.rglob("*"))
@@ -0,0 +1,115 @@
+"""
+Delta senkronizasyon: dolan sayfaların (zaman, _id) konumundan devamı
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+import pagination
+import server
+
+
+@pytest.fixture
+def page_size(monkeypatch):
+    monkeypatch.setattr(server, "SYNC_PAGE_SIZE", 3)
+    return 3
+
+
+@pytest.fixture
+def resident(client):
+    repositories = server.app.state.repositories
+    now = datetime.utcnow()
+    building = client.portal.call(repositories.buildings.create, {"name": "Senkron Sitesi", "created_at": now})
+    apartment = client.portal.call(repositories.buildings.create_apartment, {
+        "building_id": building["_id"], "block": "A", "apartment_number": 1, "floor": 1, "created_at": now
+    })
+    user = client.portal.call(repositories.users.create, {
+        "phone_number": "5553330000", "role": "tenant", "building_id": building["_id"], "apartment_id": apartment["_id"]
+    })
+    return {"building": building, "apartment": apartment, "user": user}
+
+
+def sync_all(client, user_id: str, token=None, max_pages: int = 20):
+    """Zinciri has_more bitene kadar izle; sayfaları döndür"""
+    pages = []
+    for _ in range(max_pages):
+        response = client.get(f"/api/users/{user_id}/sync", params={"since": token} if token else {})
+        assert response.status_code == 200, response.text
+        pages.append(response.json())
+        token = pages[-1]["token"]
+        if not pages[-1]["has_more"]:
+            return pages
+    raise AssertionError("Senkronizasyon zinciri bitmedi")
+
+
+def test_same_timestamp_changes_page_without_looping(client, resident, page_size):
+    repositories = server.app.state.repositories
+    stamp = datetime.utcnow() - timedelta(seconds=1)
+    dues = client.portal.call(repositories.dues.create_many, [
+        {"apartment_id": resident["apartment"]["_id"], "amount": 100.0 + i, "paid": False,
+         "due_date": stamp, "created_at": stamp, "updated_at": stamp}
+        for i in range(page_size * 3 + 1)
+    ])
+
+    first = sync_all(client, resident["user"]["_id"])
+    assert len(first) == 4
+    assert first[0]["reset"] and not any(page["reset"] for page in first[1:])
+    seen = [due["_id"] for page in first for due in page["dues"]]
+    assert sorted(seen) == sorted(due["_id"] for due in dues)
+
+    # Son token örtüşmeyle geri sarar: aynı kayıtlar tekrar gelir ama zincir yine biter
+    again = sync_all(client, resident["user"]["_id"], first[-1]["token"])
+    assert not again[0]["reset"]
+    assert sorted(due["_id"] for page in again for due in page["dues"]) == sorted(seen)
+
+
+def test_only_full_streams_continue(client, resident, page_size):
+    repositories = server.app.state.repositories
+    now = datetime.utcnow()
+    client.portal.call(repositories.dues.create_many, [
+        {"apartment_id": resident["apartment"]["_id"], "amount": 100.0, "paid": False, "due_date": now,
+         "created_at": now} for _ in range(page_size + 1)
+    ])
+    client.portal.call(repositories.announcements.create, {
+        "building_id": resident["building"]["_id"], "title": "Duyuru", "content": "İçerik", "created_at": now
+    })
+    client.portal.call(repositories.buildings.get_or_create_status, resident["building"]["_id"],
+                       server.default_building_status())
+
+    pages = sync_all(client, resident["user"]["_id"])
+    assert [len(page["dues"]) for page in pages] == [page_size, 1]
+    assert [len(page["announcements"]) for page in pages] == [1, 0]
+    assert pages[0]["building_status"] is not None and pages[1]["building_status"] is None
+
+    positions = pagination.decode_sync_token(pages[0]["token"])["positions"]
+    assert set(positions) == {"dues"}
+    # Son token devam konumu taşımaz; zincirin başladığı an
+    final = pagination.decode_sync_token(pages[-1]["token"])
+    assert final["positions"] == {}
+    assert final["synced_at"] == pagination.decode_sync_token(pages[0]["token"])["synced_at"]
+
+
+def test_tombstones_page_by_position(client, resident, page_size):
+    repositories = server.app.state.repositories
+    token = sync_all(client, resident["user"]["_id"])[-1]["token"]
+    deleted_at = datetime.utcnow()
+    for i in range(page_size * 2):
+        client.portal.call(repositories.tombstones.record, "announcement", f"a{i}",
+                           f"building:{resident['building']['_id']}", deleted_at)
+
+    pages = sync_all(client, resident["user"]["_id"], token)
+    ids = [item["id"] for page in pages for item in page["deleted"]]
+    assert sorted(ids) == sorted(f"a{i}" for i in range(page_size * 2))
+
+
+def test_sync_token_round_trip_and_invalid_token(client, resident):
+    at = datetime(2026, 5, 1, 12, 0, 0, 123000)
+    token = pagination.encode_sync_token(at, at - timedelta(seconds=5), {"dues": (at, "abc")})
+    assert pagination.decode_sync_token(token) == {
+        "synced_at": at, "after": at - timedelta(seconds=5), "positions": {"dues": (at, "abc")}
+    }
+    assert pagination.decode_sync_token(pagination.encode_sync_token(at)) == {
+        "synced_at": at, "after": None, "positions": {}
+    }
+    response = client.get(f"/api/users/{resident['user']['_id']}/sync", params={"since": "bozuk"})
+    assert response.status_code == 400
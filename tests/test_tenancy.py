@@ -0,0 +1,166 @@
+"""
+Kiracı yönlendirmesi: yolunda bina olmayan uçlar (daire, aidat, talep, kullanıcı)
+ve sorgudaki building_id, token olmadan da binanın kiracısına gider
+"""
+from dataclasses import replace
+from datetime import datetime
+
+import pytest
+
+import server
+from auth import issue_tokens
+from repositories import Repositories
+import tenancy
+from tenancy import DEFAULT_TENANT, TenantRouter
+
+
+class Routes:
+    """tenant_routes koleksiyonunun find'ı kadarı"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query):
+        async def iterate():
+            for doc in self.docs:
+                yield doc
+
+        return iterate()
+
+
+def bearer(user: dict) -> dict:
+    return {"Authorization": f"Bearer {issue_tokens(user)['access_token']}"}
+
+
+@pytest.fixture
+def routed(client, monkeypatch):
+    """Bir binası ayrı veritabanına yönlendirilmiş kurulum; istekler gerçek kiracı seçimiyle çalışır"""
+    default = server.app.state.repositories
+    # Kullanıcılar kiracıdan bağımsız olarak kontrol veritabanında
+    tenant = replace(Repositories.in_memory(), users=default.users)
+    now = datetime.utcnow()
+    building = client.portal.call(tenant.buildings.create, {"name": "Taşınan Site", "created_at": now})
+    apartment = client.portal.call(tenant.buildings.create_apartment, {
+        "building_id": building["_id"], "block": "A", "apartment_number": 1, "floor": 1, "created_at": now
+    })
+    resident = client.portal.call(default.users.create, {
+        "phone_number": "5554440000", "role": "tenant", "building_id": building["_id"], "apartment_id": apartment["_id"]
+    })
+    dues = client.portal.call(tenant.dues.create_many, [
+        {"apartment_id": apartment["_id"], "amount": 300.0, "paid": False, "due_date": now, "created_at": now}
+        for _ in range(2)
+    ])
+    request = client.portal.call(tenant.requests.create, {
+        "user_id": resident["_id"], "building_id": building["_id"], "title": "Asansör arızası",
+        "description": "Kapı kapanmıyor", "status": "received", "priority": "normal", "created_at": now,
+        "updated_at": now
+    })
+    other_request = client.portal.call(default.requests.create, {
+        "user_id": "u-default", "building_id": "b-default", "title": "Kapı", "description": "Kırık",
+        "status": "received", "priority": "normal", "created_at": now, "updated_at": now
+    })
+
+    routes = Routes([{"_id": "company-1", "db_name": "company_1", "building_ids": [building["_id"]]}])
+    tenants = TenantRouter(default, routes=routes, connect=lambda mongo_url, db_name: tenant)
+    monkeypatch.setattr(server.app.state, "tenants", tenants)
+    # Sayan repository vekili kiracı seçimini atlar; client fixture'ı kapanışta tüm override'ları temizler
+    server.app.dependency_overrides.pop(server.get_repositories)
+    return {"default": default, "tenant": tenant, "tenants": tenants, "building": building, "apartment": apartment,
+            "resident": resident, "dues": dues, "request": request, "other_request": other_request}
+
+
+def test_entity_endpoints_route_without_token(client, routed):
+    tenant, apartment = routed["tenant"], routed["apartment"]
+    body = client.get(f"/api/apartments/{apartment['_id']}/dues").json()
+    # Örnek veri değil, kiracıdaki aidatlar
+    assert sorted(due["_id"] for due in body["dues"]) == sorted(due["_id"] for due in routed["dues"])
+
+    first, second = routed["dues"]
+    assert client.post(f"/api/dues/{first['_id']}/pay", json={}).json()["success"] is True
+    body = client.post(f"/api/apartments/{apartment['_id']}/dues/pay", json={"due_ids": [second["_id"]]}).json()
+    assert body["success"] is True
+    assert all(client.portal.call(tenant.dues.get, due["_id"])["paid"] for due in routed["dues"])
+    assert client.portal.call(routed["default"].dues.list_for_apartment, apartment["_id"], 100) == []
+
+    user_id = routed["resident"]["_id"]
+    requests = client.get(f"/api/users/{user_id}/requests").json()
+    assert [r["_id"] for r in requests] == [routed["request"]["_id"]]
+    assert len(client.get(f"/api/users/{user_id}/sync").json()["dues"]) == 2
+
+    created = client.post("/api/requests", json={"user_id": user_id, "title": "Su", "description": "Kaçak"}).json()
+    assert created["success"] is True
+    assert client.portal.call(tenant.requests.get, created["request"]["_id"]) is not None
+
+
+def test_request_building_comes_from_the_stored_user(client, routed):
+    # Gövdedeki building_id kiracı seçtirmez ve talebe yazılmaz
+    outsider = client.portal.call(routed["default"].users.create, {"phone_number": "5554441111", "role": "tenant",
+                                                                   "building_id": "b-default"})
+    created = client.post("/api/requests", json={"user_id": outsider["_id"], "building_id": routed["building"]["_id"],
+                                                 "title": "Su", "description": "Kaçak"}).json()
+    assert created["request"]["building_id"] == "b-default"
+    assert client.portal.call(routed["tenant"].requests.get, created["request"]["_id"]) is None
+    assert client.portal.call(routed["default"].requests.get, created["request"]["_id"]) is not None
+
+
+def test_search_routes_by_query_building(client, routed):
+    response = client.get("/api/search", params={"q": "asansör", "building_id": routed["building"]["_id"],
+                                                  "types": "requests"}, headers=bearer(routed["resident"]))
+    assert response.status_code == 200, response.text
+    assert [r["_id"] for r in response.json()["results"]] == [routed["request"]["_id"]]
+
+
+def test_super_admin_reaches_routed_tenant(client, routed):
+    admin = client.portal.call(routed["default"].users.create, {"phone_number": "5559990000", "role": "super_admin"})
+    headers = bearer(admin)
+    request_id, other_id = routed["request"]["_id"], routed["other_request"]["_id"]
+
+    response = client.put(f"/api/requests/{request_id}/status", json={"status": "in_progress"}, headers=headers)
+    assert response.status_code == 200, response.text
+    body = client.put("/api/requests/status:bulk", headers=headers, json={"items": [
+        {"request_id": request_id, "status": "resolved"}, {"request_id": other_id, "status": "in_progress"}
+    ]}).json()
+    assert body["updated"] == 2, body
+    assert client.portal.call(routed["tenant"].requests.get, request_id)["status"] == "resolved"
+    assert client.portal.call(routed["default"].requests.get, other_id)["status"] == "in_progress"
+
+    names = [building["name"] for building in client.get("/api/buildings", headers=headers).json()]
+    assert "Taşınan Site" in names
+
+
+def test_entity_building_lookup_is_cached(client, routed):
+    tenants = routed["tenants"]
+    apartment_id = routed["apartment"]["_id"]
+    assert client.portal.call(tenants.building_of, "apartment", apartment_id) == routed["building"]["_id"]
+    assert client.portal.call(tenants.building_of, "due", routed["dues"][0]["_id"]) == routed["building"]["_id"]
+    assert ("apartment", apartment_id) in tenants._entity_buildings
+    assert client.portal.call(tenants.building_of, "apartment", "yok") is None
+    assert ("apartment", "yok") not in tenants._entity_buildings and ("apartment", "yok") in tenants._missing_entities
+    assert tenants.tenant_of(routed["building"]["_id"]) == "company-1"
+
+
+def test_missing_entity_is_not_looked_up_again(client, routed, monkeypatch):
+    tenants = routed["tenants"]
+    calls = []
+    find_building = tenants._find_building
+
+    async def counting(kind, entity_id):
+        calls.append(entity_id)
+        return await find_building(kind, entity_id)
+
+    monkeypatch.setattr(tenants, "_find_building", counting)
+    for _ in range(3):
+        assert client.portal.call(tenants.building_of, "request", "yok") is None
+    assert calls == ["yok"]
+    # Süre dolunca yeniden aranır
+    monkeypatch.setattr(tenancy, "MISSING_ENTITY_TTL", 0)
+    tenants._missing_entities.clear()
+    assert client.portal.call(tenants.building_of, "request", "yok") is None
+    assert client.portal.call(tenants.building_of, "request", "yok") is None
+    assert tenants.tenant_of(routed["building"]["_id"]) == "company-1"
+
+
+def test_no_routes_means_no_lookup(client):
+    tenants = TenantRouter(server.app.state.repositories)
+    assert client.portal.call(tenants.building_of, "apartment", "herhangi") is None
+    assert tenants.tenant_of("herhangi") == DEFAULT_TENANT